@@ -1,8 +1,19 @@
 # app.py (HUB)
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+# Hilos/afinidad de torch, OpenCV y ONNX Runtime: antes de importar las sub-apps (fijan sus pools al cargar)
+from apps.common.runtime import apply_runtime_config, runtime_info
+apply_runtime_config()
+
+import os
+import time
+
+from fastapi import FastAPI, Header, Query
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from starlette.middleware.wsgi import WSGIMiddleware
 
+from apps.common import metrics, openai_client, profiling
+from apps.common.readiness import readiness
+from apps.common.storage import get_storage_manager
+
 # Flask (AI Detect v1)
 from apps.ai_detect.app import flask_app as detect_flask_app
 
@@ -21,6 +32,71 @@ hub.mount("/ai-detect-v2", WSGIMiddleware(detect_v2_flask_app))    # v2 🚀
 hub.mount("/ai-tutor", tutor_app)
 hub.mount("/ai-seguridad", seguridad_app)
 
+# Conteo/latencia por sub-app y ruta (las sub-apps Flask se instrumentan por dentro con instrument_flask)
+hub.add_middleware(metrics.MetricsMiddleware, mounts={
+    "/ai-detect": ("ai_detect", True),
+    "/ai-detect-v2": ("ai_detect_v2", True),
+    "/ai-tutor": ("ai_tutor", False),
+    "/ai-seguridad": ("ai_seguridad", False),
+})
+
+# Retención de uploads/results/audio: compactación periódica en segundo plano
+storage = get_storage_manager()
+storage.start()
+
+@hub.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Requests y etapas internas (decode, inference, openai_chat, tts, stt...) en formato Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@hub.get("/metrics/storage")
+def storage_metrics():
+    """Uso de disco por sub-app/carpeta (vivo y archivado) y resultado de la última compactación."""
+    return storage.usage()
+
+@hub.get("/metrics/openai")
+def openai_metrics():
+    """Estado de los circuit breakers por modelo, presupuestos de reintento y umbral de hedging de STT."""
+    return openai_client.stats()
+
+@hub.get("/metrics/runtime")
+def runtime_metrics():
+    """Hilos y CPUs asignados a este worker."""
+    return runtime_info()
+
+@hub.get("/admin/profile")
+def admin_profile(seconds: float = Query(10.0, gt=0), interval_ms: float = Query(5.0, gt=0),
+                  x_admin_token: str = Header(None)):
+    """
+    Profiler por muestreo de todos los hilos durante 'seconds' (máx. PROFILE_MAX_SECONDS).
+    Retorna stacks colapsados (flamegraph.pl / speedscope). Requiere header X-Admin-Token = HUB_ADMIN_TOKEN.
+    """
+    if not profiling.is_admin(x_admin_token):
+        return JSONResponse({"error": "no autorizado"}, status_code=403)
+    out = profiling.sample_stacks(seconds, interval_ms / 1000.0)
+    if out is None:
+        return JSONResponse({"error": "ya hay un muestreo en curso"}, status_code=409)
+    return PlainTextResponse(out["collapsed"], headers={
+        "Content-Disposition": f'attachment; filename="hub_profile_{int(time.time())}.folded"',
+        "X-Profile-Samples": str(out["samples"]),
+        "X-Profile-Threads": str(out["threads"]),
+    })
+
+# Componentes cuya falla sí saca al HUB de rotación (p.ej. "ai_detect"); por defecto ninguno:
+# un modelo caído degrada solo su sub-app y el resto sigue atendiendo
+HEALTH_BLOCKING_FAILED = {c.strip() for c in os.getenv("HUB_HEALTH_BLOCKING_FAILED", "").split(",") if c.strip()}
+
+@hub.get("/healthz")
+def healthz():
+    """Readiness del proceso: 503 mientras algún modelo calienta; los fallidos se reportan como 'degraded'."""
+    ready, payload = readiness.check(blocking_failed=HEALTH_BLOCKING_FAILED)
+    return JSONResponse(payload, status_code=200 if ready else 503)
+
+@hub.get("/livez")
+def livez():
+    """Liveness: el proceso responde (no depende del warmup)."""
+    return {"ok": True}
+
 @hub.get("/", response_class=HTMLResponse)
 def index():
     return """
@@ -30,6 +106,7 @@ def index():
       <li><a href="/ai-detect-v2">AI Detect · UI (v2)</a> · <a href="/ai-detect-v2/healthz">health</a></li>
       <li><a href="/ai-tutor">AI Tutor · UI</a> · <a href="/ai-tutor/docs">docs</a></li>
       <li><a href="/ai-seguridad">AI Seguridad · UI</a> · <a href="/ai-seguridad/docs">docs</a></li>
+      <li><a href="/healthz">Readiness del HUB</a> · <a href="/metrics">métricas</a></li>
     </ul>
     """
 
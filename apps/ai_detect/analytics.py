@@ -0,0 +1,178 @@
+# analytics.py — Contadores pre-agregados de inspecciones (día × zona × clase × prioridad)
+# Se actualizan de forma incremental en cada detección; /stats solo lee agregados (sin escanear archivos).
+# Re-inspeccionar una imagen resta su contribución anterior antes de sumar la nueva,
+# así los totales no se duplican.
+import sqlite3
+import threading
+from pathlib import Path
+
+try:
+    from .inspection_index import _ts_from
+except Exception:
+    from inspection_index import _ts_from
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stats_detections (
+    day        TEXT NOT NULL,
+    zona       TEXT NOT NULL,
+    clase      TEXT NOT NULL,
+    prioridad  TEXT NOT NULL,
+    n          INTEGER NOT NULL,
+    PRIMARY KEY (day, zona, clase, prioridad)
+);
+CREATE TABLE IF NOT EXISTS stats_inspections (
+    day        TEXT NOT NULL,
+    zona       TEXT NOT NULL,
+    prioridad  TEXT NOT NULL,          -- prioridad global de la inspección
+    n          INTEGER NOT NULL,
+    PRIMARY KEY (day, zona, prioridad)
+);
+-- Qué aportó cada imagen (para revertirlo al re-inspeccionar)
+CREATE TABLE IF NOT EXISTS stats_contrib (
+    filename   TEXT NOT NULL,
+    kind       TEXT NOT NULL,          -- 'det' | 'insp'
+    day        TEXT NOT NULL,
+    zona       TEXT NOT NULL,
+    clase      TEXT NOT NULL,
+    prioridad  TEXT NOT NULL,
+    n          INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_contrib_fn ON stats_contrib (filename);
+"""
+
+DIMENSIONS = ("day", "zona", "clase", "prioridad")
+ND = "N/D"
+
+
+def _contributions(result: dict):
+    """Filas (kind, day, zona, clase, prioridad, n) que aporta un resultado."""
+    filename = result.get("filename") or ""
+    resumen = result.get("resumen_inspeccion") or {}
+    day = _ts_from(result, filename)[:10]
+    zona = resumen.get("zona") or resumen.get("lugar") or ND
+
+    rows = {}
+    reporte = result.get("reporte_incidencia")
+    if isinstance(reporte, list) and reporte:
+        pairs = [(r.get("problema") or "incidencia", r.get("prioridad") or ND) for r in reporte]
+    else:
+        pairs = [(d.get("class") or "incidencia", d.get("severity") or ND) for d in (result.get("detections") or [])]
+    for clase, prio in pairs:
+        key = ("det", day, zona, clase, prio)
+        rows[key] = rows.get(key, 0) + 1
+    rows[("insp", day, zona, "", resumen.get("prioridad_global") or ND)] = 1
+    return [k + (n,) for k, n in rows.items()]
+
+
+class InspectionAnalytics:
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _apply(conn, kind, day, zona, clase, prioridad, n):
+        if kind == "det":
+            conn.execute(
+                "INSERT INTO stats_detections (day, zona, clase, prioridad, n) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (day, zona, clase, prioridad) DO UPDATE SET n = n + excluded.n",
+                (day, zona, clase, prioridad, n),
+            )
+        else:
+            conn.execute(
+                "INSERT INTO stats_inspections (day, zona, prioridad, n) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (day, zona, prioridad) DO UPDATE SET n = n + excluded.n",
+                (day, zona, prioridad, n),
+            )
+
+    def record(self, result: dict):
+        """Suma la contribución de un resultado (reemplazando la previa de la misma imagen) en una transacción."""
+        filename = result.get("filename")
+        if not filename:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute(
+                "SELECT kind, day, zona, clase, prioridad, n FROM stats_contrib WHERE filename = ?", (filename,)
+            ).fetchall()
+            for r in old:
+                self._apply(conn, r["kind"], r["day"], r["zona"], r["clase"], r["prioridad"], -r["n"])
+            conn.execute("DELETE FROM stats_contrib WHERE filename = ?", (filename,))
+
+            new = _contributions(result)
+            for row in new:
+                self._apply(conn, *row)
+            conn.executemany(
+                "INSERT INTO stats_contrib (filename, kind, day, zona, clase, prioridad, n) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(filename,) + row for row in new],
+            )
+            conn.execute("DELETE FROM stats_detections WHERE n <= 0")
+            conn.execute("DELETE FROM stats_inspections WHERE n <= 0")
+
+    def stats(self, date_from=None, date_to=None, zona=None, clase=None, prioridad=None,
+              group_by=("day",), top=5) -> dict:
+        """
+        Rollups sobre los contadores agregados.
+        group_by: subconjunto de ('day', 'zona', 'clase', 'prioridad') para las filas de 'rollup'.
+        Retorna totales, rollup y top-N de clases y zonas dentro del filtro.
+        """
+        group_by = [g for g in (group_by or []) if g in DIMENSIONS]
+        top = max(1, min(int(top or 5), 50))
+
+        def where_for(table):
+            where, args = [], []
+            if date_from:
+                where.append("day >= ?"); args.append(date_from[:10])
+            if date_to:
+                where.append("day <= ?"); args.append(date_to[:10])
+            if zona:
+                where.append("zona = ?"); args.append(zona)
+            if prioridad:
+                where.append("prioridad = ?"); args.append(prioridad)
+            if clase and table == "stats_detections":
+                where.append("clase = ?"); args.append(clase)
+            return (" WHERE " + " AND ".join(where)) if where else "", args
+
+        conn = self._conn()
+        w_det, a_det = where_for("stats_detections")
+        w_ins, a_ins = where_for("stats_inspections")
+
+        total_det = conn.execute(f"SELECT COALESCE(SUM(n), 0) FROM stats_detections{w_det}", a_det).fetchone()[0]
+        total_ins = conn.execute(f"SELECT COALESCE(SUM(n), 0) FROM stats_inspections{w_ins}", a_ins).fetchone()[0]
+
+        rollup = []
+        if group_by:
+            cols = ", ".join(group_by)
+            rollup = [dict(r) for r in conn.execute(
+                f"SELECT {cols}, SUM(n) AS detecciones FROM stats_detections{w_det} "
+                f"GROUP BY {cols} ORDER BY {cols}", a_det
+            )]
+
+        def top_by(dim):
+            return [dict(r) for r in conn.execute(
+                f"SELECT {dim}, SUM(n) AS detecciones FROM stats_detections{w_det} "
+                f"GROUP BY {dim} ORDER BY detecciones DESC LIMIT ?", a_det + [top]
+            )]
+
+        return {
+            "totales": {"inspecciones": total_ins, "detecciones": total_det},
+            "group_by": group_by,
+            "rollup": rollup,
+            "top_clases": top_by("clase"),
+            "top_zonas": top_by("zona"),
+            "por_prioridad": top_by("prioridad"),
+        }
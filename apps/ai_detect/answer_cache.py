@@ -0,0 +1,145 @@
+# answer_cache.py — Cache de respuestas de /ask por pregunta + contexto de inspección
+# Clave: (modo, hash del contexto compactado, pregunta normalizada sin acentos ni signos).
+# "¿Qué EPP necesito?" y "que epp necesito" comparten entrada para la misma inspección.
+# Opcional: búsqueda semántica de paráfrasis dentro del mismo (modo, contexto):
+#   ASK_CACHE_SEMANTIC = off (default) | ngram (vectores de trigramas, sin dependencias)
+#                        | <modelo de sentence-transformers>, p.ej. paraphrase-multilingual-MiniLM-L12-v2
+#   ASK_CACHE_SIMILARITY  umbral de coseno (default 0.92)
+# Expulsión por TTL (ASK_CACHE_TTL_SEC) y LRU (ASK_CACHE_MAX). Por proceso, en memoria.
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# ========= Configuración (por entorno) =========
+CACHE_ENABLED = os.getenv("ASK_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CACHE_MAX = int(os.getenv("ASK_CACHE_MAX", "512"))
+CACHE_TTL_SEC = float(os.getenv("ASK_CACHE_TTL_SEC", "21600"))  # 6 h
+SEMANTIC = os.getenv("ASK_CACHE_SEMANTIC", "off").strip()
+SIMILARITY = float(os.getenv("ASK_CACHE_SIMILARITY", "0.92"))
+NGRAM_DIMS = 1024
+
+_punct_re = re.compile(r"[^\w\s]")
+_ws_re = re.compile(r"\s+")
+
+
+def fold(text: str) -> str:
+    """Minúsculas, sin acentos ni signos y con espacios simples ('¿Qué EPP?' -> 'que epp')."""
+    t = unicodedata.normalize("NFD", (text or "").lower())
+    t = "".join(ch for ch in t if unicodedata.category(ch) != "Mn")
+    return _ws_re.sub(" ", _punct_re.sub(" ", t)).strip()
+
+
+def context_hash(ctx) -> str:
+    """Hash estable del contexto compactado (claves ordenadas)."""
+    raw = json.dumps(ctx or {}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _ngram_vector(text: str) -> np.ndarray:
+    """Bolsa de trigramas de caracteres proyectada a NGRAM_DIMS (hashing) y normalizada."""
+    vec = np.zeros(NGRAM_DIMS, dtype=np.float32)
+    padded = f"  {text} "
+    for i in range(len(padded) - 2):
+        vec[zlib.crc32(padded[i:i + 3].encode("utf-8")) % NGRAM_DIMS] += 1.0
+    n = np.linalg.norm(vec)
+    return vec / n if n else vec
+
+
+class AnswerCache:
+    def __init__(self, max_entries=CACHE_MAX, ttl_sec=CACHE_TTL_SEC, semantic=SEMANTIC, similarity=SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.similarity = similarity
+        self._entries = OrderedDict()  # (mode, ctx_hash, pregunta) -> entry (orden LRU)
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits_exact": 0, "hits_semantic": 0, "misses": 0,
+                       "stores": 0, "evictions": 0, "saved_ms": 0.0}
+        self._encode = self._make_encoder(semantic)
+        self.semantic = semantic if self._encode is not None else "off"  # lo que usa esta instancia
+
+    @staticmethod
+    def _make_encoder(semantic):
+        if not semantic or semantic.lower() in ("off", "0", "no", "false"):
+            return None
+        if semantic.lower() == "ngram":
+            return _ngram_vector
+        try:
+            # Import diferido: sentence-transformers arrastra torch y solo hace falta con un modelo configurado
+            from sentence_transformers import SentenceTransformer
+        except Exception:  # embeddings locales opcionales
+            print(f"⚠️ ASK_CACHE_SEMANTIC={semantic} requiere sentence-transformers; se usa coincidencia exacta")
+            return None
+        model = SentenceTransformer(semantic)
+        return lambda text: model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+    def _expired(self, entry, now):
+        return now - entry["created"] > self.ttl_sec
+
+    def get(self, mode: str, ctx_hash: str, question: str):
+        """Entrada cacheada ({answer, llm_latency_ms, ...}) con 'cache': exact|semantic, o None."""
+        if not CACHE_ENABLED:
+            return None
+        q = fold(question)
+        now = time.time()
+        with self._lock:
+            self._stats["lookups"] += 1
+            key = (mode, ctx_hash, q)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            hit = "exact" if entry is not None else None
+            candidates = [] if hit or self._encode is None else [
+                (k, e) for k, e in self._entries.items()
+                if k[0] == mode and k[1] == ctx_hash and e.get("vector") is not None and not self._expired(e, now)
+            ]
+        if candidates:
+            vec = self._encode(q)  # fuera del lock: puede tardar (modelo de embeddings)
+            best_key, best_entry = max(candidates, key=lambda kv: float(np.dot(vec, kv[1]["vector"])))
+            if float(np.dot(vec, best_entry["vector"])) >= self.similarity:
+                key, entry, hit = best_key, best_entry, "semantic"
+        with self._lock:
+            if hit is None:
+                self._stats["misses"] += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._stats["hits_" + hit] += 1
+            self._stats["saved_ms"] += entry.get("llm_latency_ms") or 0.0
+            entry["hits"] += 1
+            out = {k: v for k, v in entry.items() if k != "vector"}
+            out["cache"] = hit
+            return out
+
+    def put(self, mode: str, ctx_hash: str, question: str, answer: str, llm_latency_ms=None, **extra):
+        if not CACHE_ENABLED or not answer:
+            return
+        q = fold(question)
+        entry = {"answer": answer, "llm_latency_ms": llm_latency_ms, "created": time.time(), "hits": 0, **extra}
+        entry["vector"] = self._encode(q) if self._encode is not None else None
+        with self._lock:
+            self._entries[(mode, ctx_hash, q)] = entry
+            self._entries.move_to_end((mode, ctx_hash, q))
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["entries"] = len(self._entries)
+        hits = s["hits_exact"] + s["hits_semantic"]
+        s["hit_rate"] = round(hits / s["lookups"], 4) if s["lookups"] else 0.0
+        s["saved_ms"] = round(s["saved_ms"], 1)
+        s["semantic"] = self.semantic
+        s["enabled"] = CACHE_ENABLED
+        return s
@@ -1,6 +1,7 @@
 # app.py — OpenAI Only + Voz (TTS/STT) + summary_tts_id + control de voz persistente (acento-robusto)
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file
 import os
+import sys
 from werkzeug.utils import secure_filename
 import uuid
 from datetime import datetime
@@ -8,9 +9,27 @@ import json
 import io
 import hashlib
 import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
 from dotenv import load_dotenv
 from pathlib import Path
 
+# `python app.py` desde apps/ai_detect: la raíz del repo (apps.common) no está en sys.path; este
+# bootstrap también cubre a detector_problemas/detector, que se importan más abajo
+_REPO_ROOT = str(Path(__file__).resolve().parents[2])
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from apps.common import openai_client
+from apps.common.metrics import instrument_flask, observe_stage, stage
+from apps.common.profiling import flask_profiled
+from apps.common.tokens import fit_json, message_tokens, truncate_to_tokens
+from apps.common.readiness import readiness
+from apps.common.storage import get_storage_manager
+
 # ========= Cargar .env =========
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
@@ -19,17 +38,25 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
 OPENAI_STT_MODEL  = os.getenv("OPENAI_STT_MODEL",  "gpt-4o-mini-transcribe")
 OPENAI_TTS_MODEL  = os.getenv("OPENAI_TTS_MODEL",  "gpt-4o-mini-tts")
+# Solo se usa si el circuito del modelo STT principal está abierto (ver apps/common/openai_client.py)
+OPENAI_STT_FALLBACK_MODEL = os.getenv("OPENAI_STT_FALLBACK_MODEL", "gpt-4o-transcribe")
 
 # Mantener compatibilidad con tu código anterior que usa OPENAI_MODEL
 OPENAI_MODEL = OPENAI_CHAT_MODEL
 
-# ========= OpenAI Client =========
-from openai import OpenAI
+# Endpoint compatible con OpenAI (p.ej. el stub local de benchmarks/openai_stub.py); vacío = api.openai.com
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Presupuesto de tokens para /ask (contexto de inspección y pregunta)
+ASK_CONTEXT_TOKENS  = int(os.getenv("ASK_CONTEXT_TOKENS", "1200"))
+ASK_QUESTION_TOKENS = int(os.getenv("ASK_QUESTION_TOKENS", "400"))
+
+# ========= OpenAI Client (compartido: pool keep-alive, timeouts, reintentos y breaker) =========
 client = None
 if OPENAI_API_KEY:
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        print("✅ OpenAI client listo")
+        client = openai_client.get_client()
+        print("✅ OpenAI client listo" + (f" ({OPENAI_BASE_URL})" if OPENAI_BASE_URL else ""))
         print(f"🧠 Chat model: {OPENAI_CHAT_MODEL}")
         print(f"🗣️  STT model:  {OPENAI_STT_MODEL}")
         print(f"🔊 TTS model:  {OPENAI_TTS_MODEL}")
@@ -214,12 +241,27 @@ def _merge_and_normalize(chunks_map: dict) -> str:
         merged = _smart_merge(merged, chunks_map[k])
     return _normalize_es(merged)
 
+# ====== Artefactos (con restauración perezosa desde el archivo de retención) ======
+STORAGE_POLICIES = {'UPLOAD_FOLDER': 'ai_detect_uploads', 'RESULT_FOLDER': 'ai_detect_results'}
+
+def _artifact_path(folder_key, name):
+    """Ruta de static/uploads|results/<name>; si el compactador lo archivó, se restaura. None si no existe."""
+    path = os.path.join(app.config[folder_key], name)
+    if os.path.exists(path):
+        return path
+    try:
+        restored = get_storage_manager().restore(STORAGE_POLICIES[folder_key], name)
+        return str(restored) if restored else None
+    except Exception as e:
+        app.logger.warning(f"No se pudo restaurar {name} del archivo: {e}")
+        return None
+
 # ====== NUEVO: helpers de cache JSON ======
 def load_cached_result(filename):
     """Lee el resultado de inspección cacheado como JSON en static/results/<filename>.json."""
     try:
-        path = os.path.join(app.config['RESULT_FOLDER'], secure_filename(filename) + ".json")
-        if os.path.exists(path):
+        path = _artifact_path('RESULT_FOLDER', secure_filename(filename) + ".json")
+        if path:
             with open(path, "r", encoding="utf-8") as f:
                 return json.load(f)
     except Exception as e:
@@ -236,15 +278,53 @@ app = Flask(
     template_folder=str(BASE_DIR / "templates"),
     static_folder=str(BASE_DIR / "static")
 )
+instrument_flask(app, "ai_detect")  # conteo/latencia por ruta en /metrics del HUB
 
 # Rutas absolutas para uploads/results dentro de esta subapp
 app.config['UPLOAD_FOLDER'] = str(BASE_DIR / 'static' / 'uploads')
 app.config['RESULT_FOLDER'] = str(BASE_DIR / 'static' / 'results')
+app.config['AUDIO_FOLDER'] = str(BASE_DIR / 'static' / 'audio')  # segmentos TTS de /ask en streaming
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'webp'}
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['RESULT_FOLDER'], exist_ok=True)
+os.makedirs(app.config['AUDIO_FOLDER'], exist_ok=True)
+
+# Índice SQLite del historial (fuera de static/ para no servirlo)
+app.config['INDEX_DB'] = os.getenv("AI_DETECT_INDEX_DB", str(BASE_DIR / 'data' / 'inspections.db'))
+
+# ========= Índice de inspecciones =========
+try:
+    try:
+        from .inspection_index import InspectionIndex  # type: ignore
+        from .analytics import InspectionAnalytics  # type: ignore
+    except Exception:
+        from inspection_index import InspectionIndex  # type: ignore
+        from analytics import InspectionAnalytics  # type: ignore
+    inspection_index = InspectionIndex(app.config['INDEX_DB'])
+    inspection_stats = InspectionAnalytics(app.config['INDEX_DB'])
+    if inspection_index.is_empty():
+        # Backfill único desde los <filename>.json existentes, sin frenar el arranque
+        threading.Thread(
+            target=inspection_index.backfill,
+            args=(app.config['RESULT_FOLDER'], app.config['UPLOAD_FOLDER']),
+            kwargs={"on_result": inspection_stats.record},
+            daemon=True,
+        ).start()
+except Exception as e:
+    print(f"⚠️ Índice de inspecciones no disponible (se usará escaneo de carpetas): {e}")
+    inspection_index = None
+    inspection_stats = None
+
+def _index_result(result, json_path=None):
+    if inspection_index is None:
+        return
+    try:
+        inspection_index.upsert(result, json_path=json_path)
+        inspection_stats.record(result)
+    except Exception as e:
+        app.logger.warning(f"No se pudo indexar la inspección: {e}")
 
 # ========= Detector =========
 try:
@@ -263,6 +343,67 @@ except ImportError as e:
     print(f"❌ No se pudo importar el módulo detector: {str(e)}")
     detector = None
 
+# Warmup en segundo plano: /healthz da 503 hasta que termine
+readiness.register("ai_detect")
+if detector is not None:
+    readiness.run("ai_detect", detector.warmup)
+else:
+    readiness.fail("ai_detect", "detector no disponible")
+
+# ========= Cache de respuestas de /ask =========
+try:
+    from .answer_cache import AnswerCache, context_hash  # type: ignore
+except Exception:
+    from answer_cache import AnswerCache, context_hash  # type: ignore
+answer_cache = AnswerCache()
+
+# ========= VAD previo al STT =========
+try:
+    from . import vad  # type: ignore
+except Exception:
+    import vad  # type: ignore
+
+# ========= Persistencia en segundo plano de los originales =========
+persist_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ai-detect-persist")
+
+def _persist_bytes(path, data):
+    """Escribe bytes a disco (tmp + rename para que nunca se lean a medias). Los errores se propagan."""
+    tmp = f"{path}.part"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _discard_upload(persist, path):
+    """Detección fallida: espera la escritura en curso del original y lo borra para que no quede huérfano."""
+    try:
+        persist.result()
+    except Exception:
+        pass
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _detect_opts():
+    """
+    Opciones de detección desde form/query:
+    render=none|sync|async, format=jpg|webp|png, quality=1-100 (imagen anotada); tiling=auto|on|off (teselado).
+    """
+    v = request.values
+    return {
+        'render': v.get('render') or None,
+        'fmt': v.get('format') or None,
+        'quality': v.get('quality', type=int),
+        'tiling': v.get('tiling') or None,
+    }
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
@@ -273,7 +414,18 @@ def index():
                                message="El sistema de detección no está disponible. Contacte al administrador.")
     return render_template('problemas.html')
 
+# Originales, imágenes anotadas y miniaturas: mismas URLs que el estático de Flask, pero si el compactador
+# los archivó se restauran antes de servirlos (las rutas de /upload y /history siguen valiendo)
+@app.route('/static/uploads/<name>', defaults={'folder_key': 'UPLOAD_FOLDER'})
+@app.route('/static/results/<name>', defaults={'folder_key': 'RESULT_FOLDER'})
+def serve_artifact(name, folder_key):
+    path = _artifact_path(folder_key, secure_filename(name))
+    if not path:
+        return jsonify({'error': 'Archivo no encontrado'}), 404
+    return send_file(path)
+
 @app.route('/upload', methods=['POST'])
+@flask_profiled  # X-Profile + X-Admin-Token: cProfile de este request en la respuesta
 def upload_file():
     global last_result
     if detector is None:
@@ -293,16 +445,38 @@ def upload_file():
         filename = secure_filename(f"{timestamp}_{unique_id}_{file.filename}")
         upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
 
-        file.save(upload_path)
-        if not os.path.exists(upload_path):
-            return jsonify({'error': 'Error al guardar el archivo'}), 500
+        # Decodificación directa desde el request (sin guardar y releer del disco)
+        t0 = time.perf_counter()
+        data = file.read()
+        with stage("ai_detect", "decode"):
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+        if img is None:
+            return jsonify({'error': 'No se pudo leer la imagen, formato posiblemente no soportado'}), 400
+        decode_ms = (time.perf_counter() - t0) * 1000
+
+        # El original se persiste en paralelo a la inferencia
+        persist = persist_executor.submit(_persist_bytes, upload_path, data)
 
         zona = request.form.get('zona', '')
-        result = detector.detect_problems(upload_path, zona=zona)
+        t1 = time.perf_counter()
+        try:
+            result = detector.detect_problems(upload_path, zona=zona, image=img, **_detect_opts())
+            detect_ms = (time.perf_counter() - t1) * 1000
+        except Exception:
+            _discard_upload(persist, upload_path)
+            raise
         if not result or 'error' in result:
-            return jsonify({'error': result.get('error', 'Error desconocido al procesar la imagen')}), 500
+            _discard_upload(persist, upload_path)
+            return jsonify({'error': (result or {}).get('error', 'Error desconocido al procesar la imagen')}), 500
+        # La respuesta, el JSON cacheado y el índice apuntan a original_image: tiene que existir antes.
+        # Si la escritura falló, la excepción termina en el 500 de abajo.
+        persist.result()
 
         result.update({'timestamp': timestamp, 'filename': filename, 'status': 'success'})
+        result['timings_ms'] = {
+            'read_decode': round(decode_ms, 1),
+            'detect': round(detect_ms, 1),
+        }
 
         # Texto e ID para TTS
         try:
@@ -315,10 +489,12 @@ def upload_file():
         # ====== Cache JSON para chat/contexto
         try:
             json_path = os.path.join(app.config['RESULT_FOLDER'], f"{filename}.json")
-            with open(json_path, "w", encoding="utf-8") as f:
+            with stage("ai_detect", "json_dump"), open(json_path, "w", encoding="utf-8") as f:
                 json.dump(result, f, ensure_ascii=False)
         except Exception as e:
             app.logger.warning(f"No se pudo cachear JSON en /upload: {e}")
+            json_path = None
+        _index_result(result, json_path)
         # ======================================================================
 
         last_result = result
@@ -332,16 +508,47 @@ def upload_file():
 
 @app.route('/history', methods=['GET'])
 def get_history():
+    """
+    Query (todos opcionales): limit, cursor, date_from, date_to (YYYY-MM-DD o ISO), zona, prioridad, clase
+    Retorna: { "history": [...], "next_cursor": "<cursor para la siguiente página>|null" }
+    """
+    if inspection_index is not None:
+        try:
+            a = request.args
+            return jsonify(inspection_index.query(
+                limit=a.get('limit', 10, type=int),
+                cursor=a.get('cursor'),
+                date_from=a.get('date_from'),
+                date_to=a.get('date_to'),
+                zona=a.get('zona'),
+                prioridad=a.get('prioridad'),
+                clase=a.get('clase'),
+            ))
+        except Exception as e:
+            app.logger.error(f"Error consultando índice de historial: {str(e)}")
+
+    # Fallback: escaneo de carpetas (sin índice)
     try:
         processed_files = []
         for filename in sorted(os.listdir(app.config['UPLOAD_FOLDER']), reverse=True):
             if filename.lower().endswith(tuple(app.config['ALLOWED_EXTENSIONS'])):
                 original = os.path.join(app.config['UPLOAD_FOLDER'], filename).replace('\\', '/')
-                processed = os.path.join(app.config['RESULT_FOLDER'], filename).replace('\\', '/')
+                # _render cambia la extensión si el formato de salida difiere: la ruta real está en el JSON cacheado
+                cached = {}
+                json_path = os.path.join(app.config['RESULT_FOLDER'], filename + ".json")
+                if os.path.exists(json_path):  # sin restaurar del archivo: solo se listan los presentes
+                    try:
+                        with open(json_path, "r", encoding="utf-8") as f:
+                            cached = json.load(f)
+                    except Exception:
+                        cached = {}
+                processed = (cached.get('processed_image')
+                             or os.path.join(app.config['RESULT_FOLDER'], filename)).replace('\\', '/')
                 if os.path.exists(processed):
                     processed_files.append({
                         'original': original,
                         'processed': processed,
+                        'thumbnail': cached.get('thumbnail_image'),
                         'filename': filename,
                         'timestamp': ' '.join(filename.split('_')[0:2])
                     })
@@ -350,19 +557,44 @@ def get_history():
         app.logger.error(f"Error al obtener historial: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Query (todos opcionales): date_from, date_to (YYYY-MM-DD), zona, clase, prioridad,
+           group_by (lista separada por comas de day,zona,clase,prioridad; default 'day'), top (N)
+    Retorna totales, rollup agrupado y top-N de clases/zonas/prioridades desde contadores pre-agregados.
+    """
+    if inspection_stats is None:
+        return jsonify({'error': 'Analítica no disponible'}), 503
+    try:
+        a = request.args
+        group_by = [g.strip() for g in (a.get('group_by') or 'day').split(',') if g.strip()]
+        return jsonify(inspection_stats.stats(
+            date_from=a.get('date_from'),
+            date_to=a.get('date_to'),
+            zona=a.get('zona'),
+            clase=a.get('clase'),
+            prioridad=a.get('prioridad'),
+            group_by=group_by,
+            top=a.get('top', 5, type=int),
+        ))
+    except Exception as e:
+        app.logger.error(f"Error al obtener estadísticas: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/inspect/<filename>', methods=['GET'])
 def inspect_file(filename):
     global last_result
     if not allowed_file(filename):
         return jsonify({'error': 'Tipo de archivo no permitido'}), 400
     try:
-        upload_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
-        result_path = os.path.join(app.config['RESULT_FOLDER'], secure_filename(filename))
-        if not os.path.exists(upload_path) or not os.path.exists(result_path):
+        # Solo hace falta el original: la imagen anotada se vuelve a generar según 'render'
+        upload_path = _artifact_path('UPLOAD_FOLDER', secure_filename(filename))
+        if not upload_path:
             return jsonify({'error': 'Archivo no encontrado'}), 404
 
         zona = request.args.get('zona', '')
-        result = detector.detect_problems(upload_path, zona=zona)
+        result = detector.detect_problems(upload_path, zona=zona, **_detect_opts())
         if not result or 'error' in result:
             return jsonify({'error': result.get('error', 'Error al procesar la imagen')}), 500
 
@@ -381,6 +613,9 @@ def inspect_file(filename):
                 json.dump(result, f, ensure_ascii=False)
         except Exception as e:
             app.logger.warning(f"No se pudo cachear JSON en /inspect: {e}")
+            json_path = None
+        result.setdefault('filename', secure_filename(filename))
+        _index_result(result, json_path)
         # ==============================================
 
         last_result = result
@@ -390,6 +625,141 @@ def inspect_file(filename):
         app.logger.error(f"Error al inspeccionar archivo: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# ========= /ask en streaming: texto por tokens + audio por frases =========
+# La síntesis de cada frase arranca en cuanto la frase está completa, en paralelo con el resto de la
+# respuesta: el primer audio llega tras la primera frase y no tras respuesta completa + /tts.
+ASK_TTS_WORKERS = int(os.getenv("ASK_TTS_WORKERS", "3"))
+ASK_SEGMENT_MIN_CHARS = int(os.getenv("ASK_SEGMENT_MIN_CHARS", "20"))  # frases cortas se unen a la siguiente
+tts_executor = ThreadPoolExecutor(max_workers=ASK_TTS_WORKERS, thread_name_prefix="ai-detect-tts")
+_SENTENCE_END = re.compile(r'(?<=[.!?…:;])["»)\]]?\s+|\n+')
+_MARKDOWN = re.compile(r'[*_#`>]+|^\s*[-•]\s+', re.MULTILINE)
+
+def _split_sentences(buf: str, final: bool = False):
+    """Separa las frases completas de 'buf' (con al menos ASK_SEGMENT_MIN_CHARS). Retorna (frases, resto)."""
+    sentences, start = [], 0
+    for m in _SENTENCE_END.finditer(buf):
+        piece = buf[start:m.end()].strip()
+        if len(piece) >= ASK_SEGMENT_MIN_CHARS:
+            sentences.append(piece)
+            start = m.end()
+    rest = buf[start:]
+    if final and rest.strip():
+        sentences.append(rest.strip())
+        rest = ""
+    return sentences, rest
+
+def _synthesize_segment(text: str, voice: str) -> str:
+    """
+    MP3 de una frase en static/audio (direccionado por contenido: la misma frase se reutiliza).
+    Si la escritura falla la excepción se propaga y _ask_stream emite audio_error para ese segmento.
+    """
+    name = f"seg_{_tts_id(f'{OPENAI_TTS_MODEL}|{voice}|{text}')}.mp3"
+    path = os.path.join(app.config['AUDIO_FOLDER'], name)
+    if not os.path.exists(path):
+        with stage("ai_detect", "tts"):
+            speech = openai_client.call(
+                "tts", OPENAI_TTS_MODEL, client.audio.speech.create,
+                model=OPENAI_TTS_MODEL, voice=voice, input=_MARKDOWN.sub("", text)
+            )
+            _persist_bytes(path, speech.read())
+    return name
+
+def _ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def _chat_deltas(messages, max_tokens, usage):
+    """
+    Deltas de texto del completion en streaming (anota prompt_tokens en 'usage').
+    La etapa openai_chat acumula solo la llamada y la lectura de chunks, no el tiempo que el consumidor
+    pasa entre deltas (TTS, red); si el cliente corta el stream (GeneratorExit) no cuenta como error.
+    """
+    busy, failed = 0.0, False
+    t = time.perf_counter()
+    try:
+        chunks = iter(openai_client.call(
+            "chat", OPENAI_MODEL, client.chat.completions.create,
+            model=OPENAI_MODEL, messages=messages, temperature=0.3, max_tokens=max_tokens,
+            stream=True, stream_options={"include_usage": True}
+        ))
+        while True:
+            chunk = next(chunks, None)
+            busy += time.perf_counter() - t
+            if chunk is None:
+                return
+            if getattr(chunk, "usage", None) is not None:
+                usage["prompt_tokens"] = chunk.usage.prompt_tokens
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+            t = time.perf_counter()
+    except Exception:
+        failed = True
+        busy += time.perf_counter() - t
+        raise
+    finally:
+        observe_stage("ai_detect", "openai_chat", busy, failed)
+
+def _ask_stream(deltas, speak, voice, meta, on_done=None):
+    """
+    Eventos NDJSON: meta → text (deltas) → audio {seq, url} en orden a medida que se sintetizan → done.
+    'deltas' es el completion en streaming (_chat_deltas) o la respuesta cacheada completa.
+    Los errores después de empezar el stream llegan como evento {"type": "error"}.
+    """
+    t0 = time.perf_counter()
+    usage = meta.pop("usage", {})  # compartido con _chat_deltas (prompt_tokens)
+    yield _ndjson({"type": "meta", **meta})
+
+    pending = []   # [(seq, frase, future)] en orden de síntesis
+    next_seq = 0   # próximo segmento a emitir (el audio se entrega en orden)
+    parts, buf = [], ""
+
+    def submit(sentence):
+        pending.append((len(pending), sentence, tts_executor.submit(_synthesize_segment, sentence, voice)))
+
+    def ready_audio(block=False):
+        nonlocal next_seq
+        while next_seq < len(pending):
+            seq, sentence, fut = pending[next_seq]
+            if not block and not fut.done():
+                return
+            try:
+                url = f"static/audio/{fut.result()}"
+                if "ttfa_ms" not in usage:
+                    usage["ttfa_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                yield _ndjson({"type": "audio", "seq": seq, "url": url, "text": sentence})
+            except Exception as e:
+                app.logger.warning(f"TTS de segmento {seq} falló: {e}")
+                yield _ndjson({"type": "audio_error", "seq": seq, "error": str(e)})
+            next_seq += 1
+
+    try:
+        for delta in deltas:
+            if not parts:
+                usage["ttft_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            parts.append(delta)
+            yield _ndjson({"type": "text", "delta": delta})
+            if speak:
+                buf += delta
+                sentences, buf = _split_sentences(buf)
+                for sentence in sentences:
+                    submit(sentence)
+            yield from ready_audio()
+        # Latencia del modelo: hasta agotar los deltas, sin esperar la síntesis de los últimos segmentos
+        usage["llm_latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if speak:
+            for sentence in _split_sentences(buf, final=True)[0]:
+                submit(sentence)
+            yield from ready_audio(block=True)
+        text = "".join(parts).strip()
+        if text and on_done is not None:
+            on_done(text, usage)
+        text = text or "No pude generar respuesta."
+        app.logger.info(f"/ask stream ttft={usage.get('ttft_ms')}ms ttfa={usage.get('ttfa_ms')}ms segments={len(pending)}")
+        yield _ndjson({"type": "done", "answer": text, "segments": len(pending), "usage": usage})
+    except Exception as e:
+        app.logger.error(f"OpenAI error (stream): {e}")
+        yield _ndjson({"type": "error", "error": f"Error consultando OpenAI: {str(e)}"})
+
 # ========= Chat SOLO OpenAI =========
 @app.route('/ask', methods=['POST'])
 def ask():
@@ -399,10 +769,14 @@ def ask():
       "q": "pregunta",
       "filename": "opcional",
       "mode": "initial" | "chat",
-      "speak": true|false   # opcional; si no viene se usa estado persistente SPEECH_ENABLED
+      "speak": true|false,  # opcional; si no viene se usa estado persistente SPEECH_ENABLED
+      "stream": true|false, # opcional; NDJSON con texto por tokens y audio por frases (ver _ask_stream)
+      "voice": "alloy",     # opcional; voz de los segmentos de audio en streaming
+      "no_cache": true      # opcional; ignora el cache de respuestas (ver answer_cache.py)
     }
     Retorna:
     { "answer": "...", "tts_text": "...", "used_model": "...", "has_context": true|false }
+    o, con stream=true, application/x-ndjson (las respuestas sin llamada al modelo siguen siendo JSON).
     """
     global last_result, SPEECH_ENABLED
     if client is None:
@@ -445,10 +819,11 @@ def ask():
             ctx_result = cached
         else:
             # 2) Fallback: volver a correr el detector si existe el archivo
-            upload_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
-            if os.path.exists(upload_path) and detector is not None:
+            upload_path = _artifact_path('UPLOAD_FOLDER', secure_filename(filename))
+            if upload_path and detector is not None:
                 try:
-                    ctx_result = detector.detect_problems(upload_path)
+                    # Solo se necesita el reporte como contexto: sin dibujar ni codificar imagen
+                    ctx_result = detector.detect_problems(upload_path, render="none")
                 except Exception as e:
                     app.logger.error(f"Error creando contexto para chatbot: {str(e)}")
     # ======================================================================
@@ -485,30 +860,69 @@ def ask():
         })
 
     try:
+        # Ajuste a presupuesto: el contexto se reduce (listas y textos largos) hasta caber
+        llm_ctx, ctx_tokens = fit_json(compact_ctx, ASK_CONTEXT_TOKENS)
         messages = [
             {"role": "system", "content": base_system},
             {"role": "system", "content": style_prompt},
             {
                 "role": "user",
                 "content": (
-                    "Pregunta del usuario:\n" + question +
+                    "Pregunta del usuario:\n" + truncate_to_tokens(question, ASK_QUESTION_TOKENS) +
                     "\n\nContexto de inspección (JSON compactado, si existe):\n" +
-                    json.dumps(compact_ctx, ensure_ascii=False)
+                    json.dumps(llm_ctx, ensure_ascii=False)
                 )
             }
         ]
-        resp = client.chat.completions.create(
-            model=OPENAI_MODEL,  # = OPENAI_CHAT_MODEL (retrocompat)
-            messages=messages,
-            temperature=0.3,
-            max_tokens=400 if mode == "initial" else 200
-        )
-        text = resp.choices[0].message.content.strip() if resp and resp.choices else "No pude generar respuesta."
+        usage = {"prompt_tokens_est": message_tokens(messages), "context_tokens_est": ctx_tokens}
+        max_tokens = 400 if mode == "initial" else 200
+
+        # Cache de respuestas: misma pregunta (normalizada) sobre el mismo contexto y modo
+        cache_key = (mode, context_hash(compact_ctx), _normalize_es(question))
+        cached = None if payload.get("no_cache") else answer_cache.get(*cache_key)
+        if cached is not None:
+            usage.update({"cache": cached["cache"], "saved_ms": cached.get("llm_latency_ms")})
+
+        def remember(text, call_usage):
+            answer_cache.put(*cache_key, text, llm_latency_ms=call_usage.get("llm_latency_ms"))
+
+        if payload.get("stream"):
+            meta = {"used_model": OPENAI_MODEL, "has_context": bool(compact_ctx), "speak": speak, "usage": usage}
+            if cached is not None:
+                deltas, on_done = [cached["answer"]], None
+            else:
+                deltas, on_done = _chat_deltas(messages, max_tokens, usage), remember
+            gen = _ask_stream(deltas, speak, payload.get("voice") or "alloy", meta, on_done)
+            return Response(gen, mimetype="application/x-ndjson",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        if cached is not None:
+            out = {"answer": cached["answer"], "used_model": OPENAI_MODEL, "has_context": bool(compact_ctx), "usage": usage}
+            if speak:
+                out["tts_text"] = cached["answer"]
+            return jsonify(out)
+        t0 = time.perf_counter()
+        with stage("ai_detect", "openai_chat"):
+            resp = openai_client.call(
+                "chat", OPENAI_MODEL, client.chat.completions.create,
+                model=OPENAI_MODEL,  # = OPENAI_CHAT_MODEL (retrocompat)
+                messages=messages,
+                temperature=0.3,
+                max_tokens=max_tokens
+            )
+        usage["llm_latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if getattr(resp, "usage", None) is not None:
+            usage["prompt_tokens"] = resp.usage.prompt_tokens
+        app.logger.info(f"/ask prompt_tokens~{usage['prompt_tokens_est']} latency={usage['llm_latency_ms']}ms")
+        text = resp.choices[0].message.content.strip() if resp and resp.choices else ""
+        if text:
+            remember(text, usage)
+        text = text or "No pude generar respuesta."
 
         out = {
             "answer": text,
             "used_model": OPENAI_MODEL,
-            "has_context": bool(compact_ctx)
+            "has_context": bool(compact_ctx),
+            "usage": usage
         }
         if speak:
             out["tts_text"] = text
@@ -535,19 +949,21 @@ def tts():
         return jsonify({"error": "Falta 'text' en el body"}), 400
 
     try:
-        with client.audio.speech.with_streaming_response.create(
-            model=OPENAI_TTS_MODEL,  # <- parametrizado
-            voice=voice,
-            input=text
-        ) as speech:
-            audio_bytes = io.BytesIO(speech.read())
-            audio_bytes.seek(0)
-            return send_file(
-                audio_bytes,
-                mimetype="audio/mpeg",
-                as_attachment=False,
-                download_name="voz.mp3"
+        with stage("ai_detect", "tts"):
+            speech = openai_client.call(
+                "tts", OPENAI_TTS_MODEL, client.audio.speech.create,
+                model=OPENAI_TTS_MODEL,  # <- parametrizado
+                voice=voice,
+                input=text
             )
+            audio_bytes = io.BytesIO(speech.read())
+        audio_bytes.seek(0)
+        return send_file(
+            audio_bytes,
+            mimetype="audio/mpeg",
+            as_attachment=False,
+            download_name="voz.mp3"
+        )
     except Exception as e:
         app.logger.error(f"TTS error: {e}")
         return jsonify({"error": f"Error TTS: {str(e)}"}), 500
@@ -571,29 +987,26 @@ def stt():
         return jsonify({"error": "Archivo vacío"}), 400
 
     sid = (request.form.get("sid") or "").strip() or None
+    vad.forget_stream(sid)  # la pasada final cierra el dictado de esa sesión
 
     try:
         raw = fs.read()
         if not raw or len(raw) < 800:
             return jsonify({"text": "", "sid": sid})
 
-        bio = io.BytesIO(raw)
-        bio.name = fs.filename or "audio.webm"
-        bio.seek(0)
+        # VAD: si no hay voz no se llama a la API; si hay, se recortan silencios
+        name = fs.filename or "audio.webm"
+        v = vad.analyze(raw, name)
+        if not v["speech"]:
+            if sid:
+                LIVE_TRANSCRIPTS.pop(sid, None)
+            return jsonify({"text": "", "sid": sid, "vad": "silence"})
+        if v["audio"]:
+            raw, name = v["audio"], v["filename"]
 
-        try:
-            tr = client.audio.transcriptions.create(
-                model=OPENAI_STT_MODEL,
-                file=bio,
-                language="es"
-            )
-        except Exception:
-            bio.seek(0)
-            tr = client.audio.transcriptions.create(
-                model="gpt-4o-transcribe",
-                file=bio,
-                language="es"
-            )
+        with stage("ai_detect", "stt"):
+            tr = openai_client.transcribe(raw, name, OPENAI_STT_MODEL, language="es",
+                                          fallback_model=OPENAI_STT_FALLBACK_MODEL)
 
         if sid and sid in LIVE_TRANSCRIPTS:
             try:
@@ -632,30 +1045,28 @@ def stt_chunk():
 
     try:
         raw = fs.read()
-        if not raw or len(raw) < 800:
+        name = fs.filename or "chunk.webm"
+        if raw and len(raw) >= 800:
+            # Chunks de continuación de MediaRecorder: se les antepone la cabecera del primero de la sesión
+            raw = vad.with_stream_header(sid, raw)
+            v = vad.analyze(raw, name)
+        else:
+            v = None
+        if v is None or not v["speech"]:
             merged = ""
             if sid and sid in LIVE_TRANSCRIPTS:
                 merged = _merge_and_normalize(LIVE_TRANSCRIPTS.get(sid, {}))
-            return jsonify({"partial": "", "seq": seq, "merged": merged, "sid": sid})
-
-        bio = io.BytesIO(raw)
-        bio.name = fs.filename or "chunk.webm"
-        bio.seek(0)
-
-        try:
-            tr = client.audio.transcriptions.create(
-                model=OPENAI_STT_MODEL,
-                file=bio,
-                language="es"
-            )
-        except Exception as e1:
-            app.logger.warning(f"STT con {OPENAI_STT_MODEL} falló, fallback: {e1}")
-            bio.seek(0)
-            tr = client.audio.transcriptions.create(
-                model="gpt-4o-transcribe",
-                file=bio,
-                language="es"
-            )
+            payload = {"partial": "", "seq": seq, "merged": merged, "sid": sid}
+            if v is not None:
+                payload["vad"] = "silence"
+            return jsonify(payload)
+        if v["audio"]:
+            raw, name = v["audio"], v["filename"]
+
+        # Chunks en vivo: hedging si la petición supera el p95 reciente (gana la primera respuesta)
+        with stage("ai_detect", "stt"):
+            tr = openai_client.transcribe(raw, name, OPENAI_STT_MODEL, language="es", hedge=True,
+                                          fallback_model=OPENAI_STT_FALLBACK_MODEL)
 
         partial = getattr(tr, "text", "") or ""
 
@@ -694,14 +1105,38 @@ def stt_close():
         return jsonify({"ok": False, "error": "Falta 'sid'"}), 400
     try:
         LIVE_TRANSCRIPTS.pop(sid, None)
+        vad.forget_stream(sid)
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
+@app.route('/render_status/<filename>', methods=['GET'])
+def render_status(filename):
+    """Estado de la imagen anotada pedida con render=async (ready|pending|failed|missing)."""
+    if detector is None:
+        return jsonify({'error': 'Sistema de detección no disponible'}), 503
+    cached = load_cached_result(filename) or {}
+    processed = cached.get('processed_image') or os.path.join(app.config['RESULT_FOLDER'], secure_filename(filename))
+    status = detector.render_status(processed)
+    status.update({'processed_image': processed, 'thumbnail_image': cached.get('thumbnail_image')})
+    return jsonify(status)
+
+# ====== Estadísticas del VAD (fracción de chunks/segundos omitidos) ======
+@app.get("/stt_stats")
+def stt_stats():
+    return jsonify(vad.stats())
+
+@app.get("/ask_cache/stats")
+def ask_cache_stats():
+    """Entradas, tasa de aciertos (exactos/semánticos) y latencia de LLM ahorrada por el cache de /ask."""
+    return jsonify(answer_cache.stats())
+
 # ====== NUEVO ENDPOINT DE SALUD ======
 @app.route("/healthz", methods=["GET"])
 def healthz():
-    return {"ok": True}
+    """Readiness: 200 solo cuando el detector terminó su warmup (503 mientras tanto o si falló)."""
+    ready, payload = readiness.check(["ai_detect"])
+    return jsonify(payload), (200 if ready else 503)
 
 # Alias para que el HUB pueda importarlo como WSGI app:
 flask_app = app
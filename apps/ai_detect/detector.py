@@ -1,13 +1,14 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 from PIL import Image
 import os
 
+from apps.common.yolo_backend import load_yolo
+
 class ObjectDetector:
     def __init__(self, model_path='yolov8n.pt'):
         """Inicializa el modelo YOLO"""
-        self.model = YOLO(model_path)
+        self.model, self.model_info = load_yolo(model_path, backend=os.getenv("AI_DETECT_BACKEND"))
         self.class_names = self.model.names
     
     def detect_objects(self, image_path):
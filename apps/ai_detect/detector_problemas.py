@@ -1,10 +1,20 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import os
 import logging
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path  # ⟵ NUEVO
+from types import MappingProxyType
+
+from apps.common.metrics import stage
+from apps.common.readiness import parse_sizes
+from apps.common.yolo_backend import load_yolo, warmup
 
 # ==== Mapas y reglas para “sentido común” ====
 ALIASES = {
@@ -54,6 +64,71 @@ ACCIONES_BASE = {
     ]
 }
 
+# === Render de la imagen anotada ===
+RENDER_MODES = ("none", "sync", "async")
+RENDER_DEFAULT = os.getenv("AI_DETECT_RENDER", "sync")
+RENDER_FORMAT = os.getenv("AI_DETECT_RENDER_FORMAT", "")        # "" = misma extensión que el original
+RENDER_QUALITY = int(os.getenv("AI_DETECT_RENDER_QUALITY", "90"))
+THUMB_SIZE = int(os.getenv("AI_DETECT_THUMB_SIZE", "320"))      # lado mayor de la miniatura (px)
+ENCODE_PARAMS = {
+    "jpg": lambda q: [cv2.IMWRITE_JPEG_QUALITY, q],
+    "jpeg": lambda q: [cv2.IMWRITE_JPEG_QUALITY, q],
+    "webp": lambda q: [cv2.IMWRITE_WEBP_QUALITY, q],
+    "png": lambda q: [cv2.IMWRITE_PNG_COMPRESSION, 3],
+}
+
+# === Inferencia por teselas (fotos de alta resolución) ===
+TILING_MODE = os.getenv("AI_DETECT_TILING", "auto")                 # auto | on | off
+TILE_SIZE = int(os.getenv("AI_DETECT_TILE_SIZE", "1024"))           # lado de cada tesela (px)
+TILE_OVERLAP = float(os.getenv("AI_DETECT_TILE_OVERLAP", "0.2"))    # fracción de solape entre teselas
+TILE_MIN_SIDE = int(os.getenv("AI_DETECT_TILE_MIN_SIDE", "2000"))   # en 'auto', solo se tesela si el lado mayor lo supera
+TILE_BATCH = int(os.getenv("AI_DETECT_TILE_BATCH", "8"))            # teselas por llamada al modelo
+TILE_NMS_IOU = float(os.getenv("AI_DETECT_TILE_NMS_IOU", "0.5"))
+
+# === Warmup (inferencias dummy antes de recibir tráfico) ===
+WARMUP_SIZES = os.getenv("AI_DETECT_WARMUP_SIZES", "1280x960")
+WARMUP_RUNS = int(os.getenv("AI_DETECT_WARMUP_RUNS", "2"))
+
+
+def _tile_origins(length: int, tile: int, stride: int):
+    """Orígenes de teselas sobre un eje; la última se alinea al borde para cubrirlo completo."""
+    if length <= tile:
+        return [0]
+    out = list(range(0, length - tile, stride))
+    out.append(length - tile)
+    return out
+
+
+def _nms_per_class(boxes, iou_thr: float):
+    """NMS por clase sobre [(x1, y1, x2, y2, conf, cls_id)]. Usa IoU o intersección/área menor
+    (lo que sea mayor) para fusionar cajas partidas en el borde de dos teselas."""
+    if not boxes:
+        return []
+    arr = np.asarray(boxes, dtype=np.float64)
+    keep = []
+    for cls_id in np.unique(arr[:, 5]):
+        sub = arr[arr[:, 5] == cls_id]
+        areas = (sub[:, 2] - sub[:, 0]).clip(0) * (sub[:, 3] - sub[:, 1]).clip(0)
+        order = np.lexsort((-areas, -sub[:, 4]))  # mayor confianza; a igual confianza, la caja más completa
+        sub, areas = sub[order], areas[order]
+        alive = np.ones(len(sub), dtype=bool)
+        for i in range(len(sub)):
+            if not alive[i]:
+                continue
+            keep.append(sub[i])
+            rest = np.where(alive)[0]
+            rest = rest[rest > i]
+            if not len(rest):
+                break
+            xx1 = np.maximum(sub[i, 0], sub[rest, 0]); yy1 = np.maximum(sub[i, 1], sub[rest, 1])
+            xx2 = np.minimum(sub[i, 2], sub[rest, 2]); yy2 = np.minimum(sub[i, 3], sub[rest, 3])
+            inter = (xx2 - xx1).clip(0) * (yy2 - yy1).clip(0)
+            iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+            ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+            alive[rest[np.maximum(iou, ios) > iou_thr]] = False
+    return [(int(b[0]), int(b[1]), int(b[2]), int(b[3]), float(b[4]), int(b[5])) for b in keep]
+
+
 # === Palabras clave para inferir zona desde el nombre del archivo ===
 ZONA_KEYWORDS = {
     "electrico": "Cuarto eléctrico",
@@ -81,17 +156,99 @@ ZONA_KEYWORDS = {
     "planta": "Sala de planta"
 }
 
+# === Tablas de reglas precompiladas (el post-proceso es O(detecciones), sin normalizar strings por caja) ===
+ZONA_SENSIBLE_KW = ("eléctrico", "tablero", "ups", "rack", "servidor")  # prioridad y descripción
+ZONA_ELECTRICA_KW = ("eléctrico", "tablero", "ups", "rack")             # acciones/categorías de tubería
+ACCION_GENERICA = ["Realizar inspección detallada y levantar diagnóstico."]
+# Solo lectura: cada entrada de "solucion" recibe su propia copia (dict) para que sea serializable
+SEGUN_PRIORIDAD = MappingProxyType({
+    "Alta": "Asignar cuadrilla <2h, notificar supervisor y crear OT.",
+    "Baja": "Programar en próxima ventana de mantenimiento."
+})
+WORKERS_DETALLE = MappingProxyType({
+    "Alta": "Técnico senior + ayudante; EPP completo.",
+    "Baja": "Técnico estándar; verificación posterior."
+})
+PROBLEMA_DESCONOCIDO_COLOR = (128, 0, 128)  # Morado
+
+
+def _normalize_simple(text: str) -> str:
+    """Quita acentos/ñ de forma básica para matching robusto sin dependencias externas."""
+    if not text:
+        return ""
+    repl = (("á","a"),("é","e"),("í","i"),("ó","o"),("ú","u"),("ñ","n"))
+    out = text.lower()
+    for a,b in repl:
+        out = out.replace(a,b)
+    return out
+
+
+def _compile_zone_regex():
+    """
+    Una sola regex para ZONA_KEYWORDS (claves normalizadas una vez). El lookahead reporta coincidencias
+    solapadas y cada clave conserva su orden en el dict: gana la primera clave listada que aparezca.
+    """
+    rank = {}
+    for k, label in ZONA_KEYWORDS.items():
+        rank.setdefault(_normalize_simple(k), (len(rank), label))
+    alternation = "|".join(re.escape(k) for k in sorted(rank, key=lambda k: rank[k][0]))
+    return re.compile(f"(?=({alternation}))"), rank
+
+
+_ZONA_RE, _ZONA_RANK = _compile_zone_regex()
+
+
+@lru_cache(maxsize=1024)
+def _norm_cls_name(raw) -> str:
+    if not raw:
+        return "incidencia"
+    s = str(raw).strip()
+    return ALIASES.get(s.upper().replace("_", " "), s.lower())
+
+
+@lru_cache(maxsize=256)
+def _zona_flags(zona: str):
+    """(sensible, eléctrica) de una zona; se calcula una vez por texto de zona."""
+    z = (zona or "").lower()
+    return any(k in z for k in ZONA_SENSIBLE_KW), any(k in z for k in ZONA_ELECTRICA_KW)
+
+
+# Memoizados y compartidos entre payloads: se devuelven tuplas para que una mutación falle en el acto
+@lru_cache(maxsize=256)
+def _acciones_para(cls: str, electrica: bool) -> tuple:
+    acciones = ACCIONES_BASE.get(cls, ACCION_GENERICA)
+    if cls == "tuberia_rota" and electrica:
+        acciones = ["Cortar suministro eléctrico del área"] + acciones
+    return tuple(acciones)
+
+
+@lru_cache(maxsize=256)
+def _categorias_para(cls: str, electrica: bool) -> tuple:
+    cats = CATEGORIAS.get(cls, ["Mantenimiento"])
+    if cls == "tuberia_rota" and electrica:
+        cats = cats + ["Electricidad"]
+    return tuple(dict.fromkeys(cats))  # sin duplicados, en orden
+
 
 class ProblemDetector:
     def __init__(self, model_path=None):
         """Inicializador robusto con múltiples fallbacks"""
         self.model = None
+        self.model_info = {}
         self.class_names = {}
         self.problem_descriptions = {}
 
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
+        # Pool para render/encode diferido (render="async")
+        self._render_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv("AI_DETECT_RENDER_WORKERS", "2")), thread_name_prefix="ai-detect-render"
+        )
+        self._render_lock = threading.Lock()
+        self._render_pending = set()
+        self._render_failed = {}
+
         try:
             self._setup_problem_descriptions()
             self._load_model(model_path)
@@ -143,9 +300,9 @@ class ProblemDetector:
                     self.logger.warning(f"Modelo demasiado pequeño: {cand}")
                     continue
 
-                self.model = YOLO(str(cand))
+                self.model, self.model_info = self._load_variant(cand)
                 self.class_names = self.model.names
-                self.logger.info(f"Modelo cargado exitosamente: {cand}")
+                self.logger.info(f"Modelo cargado exitosamente: {cand} ({self.model_info['backend']})")
                 self.logger.info(f"📦 Clases del modelo: {self.class_names}")
                 return
             except Exception as e:
@@ -159,6 +316,29 @@ class ProblemDetector:
         )
         raise RuntimeError(msg)
 
+    def _load_variant(self, weights: Path):
+        """
+        Precisión: AI_DETECT_PRECISION=fp32 (default) | int8. La variante INT8 (<stem>.int8.onnx,
+        generada con `python -m apps.ai_detect.quantize`) corre en ONNX Runtime; si no existe o
+        está desactualizada respecto al .pt, se usa FP32.
+        Backend FP32: AI_DETECT_BACKEND > YOLO_BACKEND (torch | onnx | openvino).
+        """
+        if os.getenv("AI_DETECT_PRECISION", "fp32").lower() == "int8":
+            int8 = weights.with_name(f"{weights.stem}.int8.onnx")
+            if int8.exists() and int8.stat().st_mtime >= weights.stat().st_mtime:
+                try:
+                    model, info = load_yolo(int8, backend="onnx")
+                    if info["backend"] == "onnx":
+                        info["precision"] = "int8"
+                        return model, info
+                except Exception as e:
+                    self.logger.warning(f"No se pudo cargar la variante INT8 {int8}: {e}; se usa FP32")
+            else:
+                self.logger.warning(f"Variante INT8 no disponible o desactualizada ({int8}); se usa FP32")
+        model, info = load_yolo(weights, backend=os.getenv("AI_DETECT_BACKEND"))
+        info["precision"] = "fp32"
+        return model, info
+
     # ----------------- Catálogo base (sin duplicados) -----------------
     def _setup_problem_descriptions(self):
         """Configuración completa de problemas y soluciones"""
@@ -238,21 +418,33 @@ class ProblemDetector:
 
     # ----------------- Helpers de razonamiento ligero -----------------
     def _norm_cls(self, raw):
-        if not raw:
-            return "incidencia"
-        s = str(raw).strip()
-        s_up = s.upper().replace("_", " ")
-        return ALIASES.get(s_up, s.lower())
+        return _norm_cls_name(raw)
 
     def _normalize_simple(self, text: str) -> str:
-        """Quita acentos/ñ de forma básica para matching robusto sin dependencias externas."""
-        if not text:
-            return ""
-        repl = (("á","a"),("é","e"),("í","i"),("ó","o"),("ú","u"),("ñ","n"))
-        out = text.lower()
-        for a,b in repl:
-            out = out.replace(a,b)
-        return out
+        return _normalize_simple(text)
+
+    def _class_table(self):
+        """
+        class_id -> (clase normalizada, info del catálogo), compilada una vez por dict de nombres del modelo.
+        Las clases fuera del catálogo llevan la info genérica (morado).
+        """
+        names = getattr(self.model, "names", {}) or {}
+        cached = getattr(self, "_cls_table_cache", None)
+        if cached is not None and cached[0] is names:
+            return cached[1]
+        items = names.items() if isinstance(names, dict) else enumerate(names)
+        table = {}
+        for cls_id, raw in items:
+            class_name = _norm_cls_name(raw)
+            info = self.problem_descriptions.get(class_name) or {
+                'description': f'Problema detectado: {class_name}',
+                'severity': 'desconocida',
+                'solutions': ['Contactar a un especialista para evaluación'],
+                'color': PROBLEMA_DESCONOCIDO_COLOR
+            }
+            table[int(cls_id)] = (class_name, info)
+        self._cls_table_cache = (names, table)
+        return table
 
     # --------- Descripciones dinámicas & zona inferida ---------
     def _bbox_metrics(self, bbox, img_shape):
@@ -290,7 +482,7 @@ class ProblemDetector:
         nivel = self._nivel_texto(score)
         parte = self._parte_vertical(m["y"])
         multi = multiplicidad > 1
-        zona_sensible = any(k in (zona or "").lower() for k in ["eléctrico", "tablero", "ups", "rack", "servidor"])
+        zona_sensible = _zona_flags(zona or "")[0]
 
         if cls == "tuberia_rota":
             trozo = "rotura de tubería"
@@ -325,18 +517,17 @@ class ProblemDetector:
         """
         try:
             base = os.path.basename(image_path) if image_path else ""
-            base_norm = self._normalize_simple(base)
+            base_norm = _normalize_simple(base)
 
-            # 1) Palabras clave en filename
-            for k, label in ZONA_KEYWORDS.items():
-                k_norm = self._normalize_simple(k)
-                if k_norm in base_norm:
-                    return label
+            # 1) Palabras clave en filename (una pasada de la regex compilada; gana la primera clave listada)
+            found = [_ZONA_RANK[m.group(1)] for m in _ZONA_RE.finditer(base_norm)]
+            if found:
+                return min(found)[1]
 
             # 2) & 3) Señales de detección
             H = img_shape[0] if (img_shape is not None and len(img_shape) >= 2) else None
 
-            classes = [self._norm_cls(d.get("name") or d.get("class")) for d in (detections or [])]
+            classes = [_norm_cls_name(d.get("name") or d.get("class")) for d in (detections or [])]
             boxes   = [d.get("bbox") for d in (detections or [])]
 
             def mean_y_for(cls_name):
@@ -383,7 +574,7 @@ class ProblemDetector:
         return "N/D"
 
     def _prioridad_y_urgencia(self, cls: str, conf: float, zona: str = ""):
-        zona_sensible = any(k in (zona or "").lower() for k in ["eléctrico", "servidor", "ups", "tablero", "rack"])
+        zona_sensible = _zona_flags(zona or "")[0]
         if cls in CRITICAS or conf >= 0.85 or zona_sensible:
             return "Alta", "Inmediata"
         if 0.60 <= conf < 0.85:
@@ -391,23 +582,16 @@ class ProblemDetector:
         return "Baja", "72h"
 
     def _acciones_recomendadas(self, cls: str, zona: str = ""):
-        acciones = ACCIONES_BASE.get(cls, ["Realizar inspección detallada y levantar diagnóstico."])
-        if cls == "tuberia_rota" and any(k in (zona or "").lower() for k in ["eléctrico", "tablero", "ups", "rack"]):
-            acciones = ["Cortar suministro eléctrico del área"] + acciones
-        return acciones
+        # Memoizado por (clase, zona eléctrica): tupla compartida
+        return _acciones_para(cls, _zona_flags(zona or "")[1])
 
     def _categorias_trabajo(self, cls: str, zona: str = ""):
-        cats = CATEGORIAS.get(cls, ["Mantenimiento"])
-        if cls == "tuberia_rota" and any(k in (zona or "").lower() for k in ["eléctrico", "tablero", "ups", "rack"]):
-            cats = cats + ["Electricidad"]
-        seen, out = set(), []
-        for c in cats:
-            if c not in seen:
-                seen.add(c); out.append(c)
-        return out
+        return _categorias_para(cls, _zona_flags(zona or "")[1])
 
-    def _build_structured_payload(self, img_name, modelo, detections, zona="", img_shape=None):
+    def _build_structured_payload(self, img_name, modelo, detections, zona="", img_shape=None,
+                                  counts=None, descriptions=None):
         # detections: [{name, confidence(0-1), bbox}]
+        # counts/descriptions (opcionales): ya calculados por detect_problems, alineados con detections
         resumen = {
             "imagen": img_name,
             "fecha": datetime.utcnow().isoformat() + "Z",
@@ -416,17 +600,19 @@ class ProblemDetector:
             "detecciones": len(detections)
         }
 
-        counts = {}
-        for d in detections:
-            cls = self._norm_cls(d.get("name") or d.get("class"))
-            counts[cls] = counts.get(cls, 0) + 1
+        classes = [_norm_cls_name(d.get("name") or d.get("class")) for d in detections]
+        if counts is None:
+            counts = Counter(classes)
+        electrica = _zona_flags(zona or "")[1]
 
         reporte, solucion = [], []
-        for det in detections:
-            cls = self._norm_cls(det.get("name") or det.get("class"))
+        for i, (cls, det) in enumerate(zip(classes, detections)):
             conf = float(det.get("confidence", 0.0))
             prioridad, urgencia = self._prioridad_y_urgencia(cls, conf, zona)
-            desc = self._describe_detection(cls, conf, det.get("bbox"), zona, img_shape, counts.get(cls, 1))
+            if descriptions is not None:
+                desc = descriptions[i]
+            else:
+                desc = self._describe_detection(cls, conf, det.get("bbox"), zona, img_shape, counts.get(cls, 1))
 
             reporte.append({
                 "problema": cls,
@@ -439,16 +625,10 @@ class ProblemDetector:
             })
             solucion.append({
                 "problema": cls,
-                "acciones_recomendadas": self._acciones_recomendadas(cls, zona),
-                "categorias_trabajo": self._categorias_trabajo(cls, zona),
-                "segun_prioridad": {
-                    "Alta": "Asignar cuadrilla <2h, notificar supervisor y crear OT.",
-                    "Baja": "Programar en próxima ventana de mantenimiento."
-                },
-                "workers_detalle": {
-                    "Alta": "Técnico senior + ayudante; EPP completo.",
-                    "Baja": "Técnico estándar; verificación posterior."
-                }
+                "acciones_recomendadas": _acciones_para(cls, electrica),
+                "categorias_trabajo": _categorias_para(cls, electrica),
+                "segun_prioridad": dict(SEGUN_PRIORIDAD),
+                "workers_detalle": dict(WORKERS_DETALLE)
             })
 
         payload = {
@@ -465,53 +645,54 @@ class ProblemDetector:
             payload["resumen_inspeccion"]["prioridad_global"] = "Baja"
             payload["resumen_inspeccion"]["urgencia_global"] = "72h"
 
-        acc = []
-        for s in solucion:
-            acc.extend(s["acciones_recomendadas"])
-        seen, out = set(), []
-        for a in acc:
-            if a not in seen:
-                seen.add(a); out.append(a)
-        payload["resumen_inspeccion"]["acciones_recomendadas_globales"] = out[:6]
+        # Las acciones dependen solo de la clase: basta recorrer las clases distintas (en orden de aparición)
+        out = dict.fromkeys(a for cls in dict.fromkeys(classes) for a in _acciones_para(cls, electrica))
+        payload["resumen_inspeccion"]["acciones_recomendadas_globales"] = list(out)[:6]
 
         return payload
 
     # ----------------- Método principal (con zona) -----------------
-    def detect_problems(self, image_path, zona: str = ""):
-        """Detección principal con manejo de errores robusto. 'zona' es opcional."""
-        if not os.path.exists(image_path):
+    def detect_problems(self, image_path, zona: str = "", image=None, render: str = None,
+                        fmt: str = None, quality: int = None, tiling: str = None):
+        """
+        Detección principal con manejo de errores robusto. 'zona' es opcional.
+        Si llega 'image' (BGR ya decodificada, p.ej. con cv2.imdecode desde el request),
+        no se lee del disco: 'image_path' solo define nombres/rutas de salida.
+        render: "none" (solo reporte), "sync" (dibuja y guarda antes de responder) o
+                "async" (se dibuja/codifica en segundo plano; ver render_status()).
+        fmt/quality: formato (jpg|webp|png) y calidad de la imagen anotada.
+        tiling: "auto" (solo fotos grandes), "on" u "off"; ver _predict().
+        """
+        if image is None and not os.path.exists(image_path):
             return {'error': 'La imagen no existe en la ruta especificada'}
 
         try:
-            img = cv2.imread(image_path)
+            if image is None:
+                with stage("ai_detect", "decode"):
+                    img = cv2.imread(image_path)
+            else:
+                img = image
             if img is None:
                 return {'error': 'No se pudo leer la imagen, formato posiblemente no soportado'}
 
-            results = self.model(img)
-            names = getattr(self.model, "names", {})
+            with stage("ai_detect", "inference"):
+                raw_boxes, inference = self._predict(img, tiling)
+            table = self._class_table()
 
-            detections = []
-            for result in results:
-                for box in result.boxes:
+            with stage("ai_detect", "postprocess"):
+                detections = []
+                for x1, y1, x2, y2, conf, cls_id in raw_boxes:
                     try:
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        conf = float(box.conf[0])
-                        cls_id = int(box.cls[0])
-                        class_name_raw = names.get(cls_id, str(cls_id))
-                        class_name = self._norm_cls(class_name_raw)
-
-                        problem_info = self.problem_descriptions.get(class_name, {
-                            'description': f'Problema detectado: {class_name}',
-                            'severity': 'desconocida',
-                            'solutions': ['Contactar a un especialista para evaluación'],
-                            'color': (128, 0, 128)  # Morado
-                        })
-
-                        # Dibujar detección
-                        cv2.rectangle(img, (x1, y1), (x2, y2), problem_info['color'], 2)
-                        label = f"{class_name} {conf:.2f}"
-                        cv2.putText(img, label, (x1, y1-10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, problem_info['color'], 2)
+                        entry = table.get(cls_id)
+                        if entry is None:  # id fuera del dict de nombres del modelo
+                            class_name = _norm_cls_name(str(cls_id))
+                            entry = table[cls_id] = (class_name, self.problem_descriptions.get(class_name) or {
+                                'description': f'Problema detectado: {class_name}',
+                                'severity': 'desconocida',
+                                'solutions': ['Contactar a un especialista para evaluación'],
+                                'color': PROBLEMA_DESCONOCIDO_COLOR
+                            })
+                        class_name, problem_info = entry
 
                         detections.append({
                             'class': class_name,
@@ -527,40 +708,42 @@ class ProblemDetector:
                         self.logger.error(f"Error procesando detección: {str(e)}")
                         continue
 
-            # Guardar imagen procesada
-            result_path = image_path.replace('uploads', 'results')
-            os.makedirs(os.path.dirname(result_path), exist_ok=True)
-            cv2.imwrite(result_path, img)
+            # Imagen anotada: ninguna, ahora mismo, o en segundo plano
+            render_info = self._render(img, detections, image_path, render, fmt, quality)
+            result_path = render_info.get("path")
 
             # -------- Sección estructurada (Detección/Solución) --------
-            det_min = [
-                {"name": d["class"], "confidence": d["confidence"], "bbox": d["box"]}
-                for d in detections
-            ]
-
-            zona_inferida = zona or self._infer_zone(image_path, det_min, img_shape=img.shape)
-
-            # Actualizar descripciones dinámicas
-            counts = {}
-            for dm in det_min:
-                c = self._norm_cls(dm["name"])
-                counts[c] = counts.get(c, 0) + 1
-            for d in detections:
-                d['description'] = self._describe_detection(
-                    d['class'], d['confidence'], d['box'], zona_inferida, img.shape, counts.get(d['class'], 1)
+            with stage("ai_detect", "report"):
+                det_min = [
+                    {"name": d["class"], "confidence": d["confidence"], "bbox": d["box"]}
+                    for d in detections
+                ]
+
+                zona_inferida = zona or self._infer_zone(image_path, det_min, img_shape=img.shape)
+
+                # Actualizar descripciones dinámicas (conteos y descripciones se reutilizan en el payload)
+                counts = Counter(d['class'] for d in detections)
+                for d in detections:
+                    d['description'] = self._describe_detection(
+                        d['class'], d['confidence'], d['box'], zona_inferida, img.shape, counts[d['class']]
+                    )
+
+                structured = self._build_structured_payload(
+                    img_name=os.path.basename(image_path),
+                    modelo=self._modelo_tag(),
+                    detections=det_min,
+                    zona=zona_inferida,
+                    img_shape=img.shape,
+                    counts=counts,
+                    descriptions=[d['description'] for d in detections]
                 )
 
-            structured = self._build_structured_payload(
-                img_name=os.path.basename(image_path),
-                modelo="yolov8/pt",
-                detections=det_min,
-                zona=zona_inferida,
-                img_shape=img.shape
-            )
-
             return {
                 'original_image': image_path,
                 'processed_image': result_path,
+                'thumbnail_image': render_info.get("thumbnail"),
+                'render': {k: v for k, v in render_info.items() if k not in ("path", "thumbnail")},
+                'inference': inference,
                 'detections': detections,
                 'analysis': self._generate_analysis(detections),
                 'maintenance_report': self._generate_maintenance_report(detections),
@@ -573,6 +756,159 @@ class ProblemDetector:
             self.logger.error(f"Error en detect_problems: {str(e)}")
             return {'error': f"Error al procesar la imagen: {str(e)}"}
 
+    def _modelo_tag(self) -> str:
+        info = self.model_info or {}
+        backend = info.get("backend", "torch")
+        tag = "yolov8/pt" if backend == "torch" else f"yolov8/{backend}"
+        return tag + "-int8" if info.get("precision") == "int8" else tag
+
+    # ----------------- Inferencia (imagen completa o por teselas) -----------------
+    @staticmethod
+    def _boxes_from(result, dx=0, dy=0):
+        out = []
+        for box in result.boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            out.append((x1 + dx, y1 + dy, x2 + dx, y2 + dy, float(box.conf[0]), int(box.cls[0])))
+        return out
+
+    def _predict(self, img, tiling=None):
+        """
+        Cajas [(x1, y1, x2, y2, conf, cls_id)] en coordenadas de la imagen completa + info de inferencia.
+        Con teselado, la imagen se corta en teselas solapadas que van al modelo por lotes (junto con
+        la imagen completa, para objetos grandes) y las cajas se fusionan con NMS entre teselas.
+        """
+        t0 = time.perf_counter()
+        h, w = img.shape[:2]
+        mode = (tiling or TILING_MODE).lower()
+        sliced = mode == "on" or (mode == "auto" and max(h, w) > TILE_MIN_SIDE)
+
+        if not sliced:
+            boxes = [b for r in self.model(img) for b in self._boxes_from(r)]
+            return boxes, {"tiled": False, "tiles": 1, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+        tile = min(TILE_SIZE, max(h, w))
+        stride = max(1, int(tile * (1.0 - TILE_OVERLAP)))
+        crops = [(img, 0, 0)]
+        for y in _tile_origins(h, tile, stride):
+            for x in _tile_origins(w, tile, stride):
+                crops.append((img[y:y + tile, x:x + tile], x, y))
+
+        boxes = []
+        for i in range(0, len(crops), max(1, TILE_BATCH)):
+            batch = crops[i:i + TILE_BATCH]
+            for (_, dx, dy), r in zip(batch, self.model([c[0] for c in batch])):
+                boxes.extend(self._boxes_from(r, dx, dy))
+        merged = _nms_per_class(boxes, TILE_NMS_IOU)
+        return merged, {
+            "tiled": True,
+            "tiles": len(crops) - 1,
+            "tile_size": tile,
+            "overlap": TILE_OVERLAP,
+            "raw_boxes": len(boxes),
+            "ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+
+    def warmup(self) -> dict:
+        """
+        Paga la inicialización perezosa de torch/ORT antes del primer request real:
+        inferencias dummy a AI_DETECT_WARMUP_SIZES y, si el teselado está activo, un lote de teselas.
+        Retorna ms por tamaño (para el estado de readiness).
+        """
+        out = warmup(self.model, parse_sizes(WARMUP_SIZES), WARMUP_RUNS)
+        if TILING_MODE != "off":
+            tile = np.zeros((TILE_SIZE, TILE_SIZE, 3), dtype=np.uint8)
+            t0 = time.perf_counter()
+            self.model([tile] * max(1, TILE_BATCH), verbose=False)
+            out[f"tiles_{TILE_BATCH}x{TILE_SIZE}"] = round((time.perf_counter() - t0) * 1000, 1)
+        return {"ms": out, "backend": (self.model_info or {}).get("backend")}
+
+    # ----------------- Render de la imagen anotada -----------------
+    def _draw(self, img, detections):
+        for d in detections:
+            x1, y1, x2, y2 = d['box']
+            cv2.rectangle(img, (x1, y1), (x2, y2), d['color'], 2)
+            label = f"{d['class']} {d['confidence']:.2f}"
+            cv2.putText(img, label, (x1, y1-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, d['color'], 2)
+        return img
+
+    @staticmethod
+    def _write_encoded(path, img, fmt, quality):
+        """Codifica y escribe vía tmp + rename: el archivo existe solo cuando está completo."""
+        ok, buf = cv2.imencode("." + fmt, img, ENCODE_PARAMS.get(fmt, lambda q: [])(quality))
+        if not ok:
+            raise RuntimeError(f"No se pudo codificar la imagen como {fmt}")
+        tmp = f"{path}.part"
+        with open(tmp, "wb") as f:
+            f.write(buf.tobytes())
+        os.replace(tmp, path)
+
+    def _render_job(self, img, detections, result_path, thumb_path, fmt, quality):
+        with stage("ai_detect", "annotation"):
+            self._draw(img, detections)
+        with stage("ai_detect", "imwrite"):
+            self._write_encoded(result_path, img, fmt, quality)
+            h, w = img.shape[:2]
+            scale = THUMB_SIZE / float(max(h, w))
+            if scale < 1.0:
+                img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+            self._write_encoded(thumb_path, img, "jpg", 80)
+
+    def _render(self, img, detections, image_path, render=None, fmt=None, quality=None):
+        """Resuelve el modo de render y retorna {mode, path, thumbnail, format, ready}."""
+        mode = (render or RENDER_DEFAULT).lower()
+        if mode not in RENDER_MODES:
+            mode = "sync"
+        if mode == "none":
+            return {"mode": "none", "path": None, "thumbnail": None, "ready": False}
+
+        result_path = image_path.replace('uploads', 'results')
+        src_ext = os.path.splitext(result_path)[1].lstrip(".").lower()
+        fmt = (fmt or RENDER_FORMAT or src_ext or "jpg").lower()
+        if fmt not in ENCODE_PARAMS:
+            fmt = "jpg"
+        if fmt != src_ext:
+            result_path = f"{os.path.splitext(result_path)[0]}.{fmt}"
+        thumb_path = f"{result_path}.thumb.jpg"
+        quality = int(quality or RENDER_QUALITY)
+        os.makedirs(os.path.dirname(result_path) or ".", exist_ok=True)
+        info = {"mode": mode, "path": result_path, "thumbnail": thumb_path, "format": fmt}
+
+        if mode == "sync":
+            self._render_job(img, detections, result_path, thumb_path, fmt, quality)
+            info["ready"] = True
+            return info
+
+        with self._render_lock:
+            self._render_pending.add(result_path)
+            self._render_failed.pop(result_path, None)
+        fut = self._render_pool.submit(self._render_job, img, detections, result_path, thumb_path, fmt, quality)
+
+        def _done(f, path=result_path):
+            with self._render_lock:
+                self._render_pending.discard(path)
+                err = f.exception()
+                if err is not None:
+                    self.logger.error(f"Render async falló para {path}: {err}")
+                    if len(self._render_failed) > 1000:
+                        self._render_failed.clear()
+                    self._render_failed[path] = str(err)
+
+        fut.add_done_callback(_done)
+        info["ready"] = False
+        return info
+
+    def render_status(self, result_path: str) -> dict:
+        """Estado de una imagen anotada: ready | pending | failed | missing."""
+        with self._render_lock:
+            if result_path in self._render_pending:
+                return {"status": "pending", "ready": False}
+            if result_path in self._render_failed:
+                return {"status": "failed", "ready": False, "error": self._render_failed[result_path]}
+        if os.path.exists(result_path):
+            return {"status": "ready", "ready": True}
+        return {"status": "missing", "ready": False}
+
     # ----------------- Estadística legacy (se mantiene) -----------------
     def _generate_analysis(self, detections):
         """Genera análisis estadístico"""
@@ -639,23 +975,18 @@ class ProblemDetector:
         img = cv2.imread(image_path)
         if img is None:
             return {'error': 'No se pudo leer la imagen, formato posiblemente no soportado'}
-        results = self.model(img)
-        names = getattr(self.model, "names", {})
+        raw_boxes, _ = self._predict(img)
+        table = self._class_table()
         detections = []
-        for r in results:
-            for b in r.boxes:
-                cls_id = int(b.cls[0])
-                name_raw = names.get(cls_id, str(cls_id))
-                name = self._norm_cls(name_raw)
-                conf = float(b.conf[0])
-                x1, y1, x2, y2 = map(int, b.xyxy[0])
-                detections.append({"name": name, "confidence": conf, "bbox": [x1, y1, x2, y2]})
+        for x1, y1, x2, y2, conf, cls_id in raw_boxes:
+            name = table[cls_id][0] if cls_id in table else _norm_cls_name(str(cls_id))
+            detections.append({"name": name, "confidence": conf, "bbox": [x1, y1, x2, y2]})
 
         zona_inferida = zona or self._infer_zone(image_path, detections, img_shape=img.shape)
 
         payload = self._build_structured_payload(
             img_name=img_name or os.path.basename(image_path),
-            modelo="yolov8/pt",
+            modelo=self._modelo_tag(),
             detections=detections,
             zona=zona_inferida,
             img_shape=img.shape
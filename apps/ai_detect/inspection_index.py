@@ -0,0 +1,241 @@
+# inspection_index.py — Índice SQLite (WAL) del historial de inspecciones
+# Se escribe en /upload y /inspect; /history consulta aquí en vez de listar carpetas.
+# Backfill (una vez) desde los <filename>.json existentes:
+#   python -m apps.ai_detect.inspection_index --backfill
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inspections (
+    filename     TEXT PRIMARY KEY,
+    ts           TEXT NOT NULL,          -- ISO 'YYYY-MM-DDTHH:MM:SS' (orden y rangos)
+    zona         TEXT,
+    prioridad    TEXT,
+    urgencia     TEXT,
+    detecciones  INTEGER NOT NULL DEFAULT 0,
+    original     TEXT,
+    processed    TEXT,
+    thumbnail    TEXT,
+    json_path    TEXT,
+    indexed_at   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_insp_ts        ON inspections (ts DESC, filename DESC);
+CREATE INDEX IF NOT EXISTS ix_insp_zona_ts   ON inspections (zona, ts DESC);
+CREATE INDEX IF NOT EXISTS ix_insp_prio_ts   ON inspections (prioridad, ts DESC);
+
+CREATE TABLE IF NOT EXISTS inspection_classes (
+    filename  TEXT NOT NULL REFERENCES inspections(filename) ON DELETE CASCADE,
+    clase     TEXT NOT NULL,
+    n         INTEGER NOT NULL,
+    PRIMARY KEY (filename, clase)
+);
+CREATE INDEX IF NOT EXISTS ix_cls_clase ON inspection_classes (clase, filename);
+"""
+
+MAX_PAGE = 100
+
+
+def _ts_from(result: dict, filename: str) -> str:
+    """Timestamp ISO del resultado; si no viene, se toma del prefijo 'YYYYmmdd_HHMMSS_' del filename."""
+    for raw in (result.get("timestamp"), "_".join((filename or "").split("_")[0:2])):
+        try:
+            return datetime.strptime(raw or "", "%Y%m%d_%H%M%S").isoformat()
+        except ValueError:
+            continue
+    fecha = (result.get("resumen_inspeccion") or {}).get("fecha") or ""
+    return fecha.rstrip("Z")[:19] or datetime.now().isoformat(timespec="seconds")
+
+
+def _class_counts(result: dict) -> dict:
+    dist = (result.get("analysis") or {}).get("class_distribution")
+    if isinstance(dist, dict) and dist:
+        return {str(k): int(v) for k, v in dist.items() if int(v) > 0}
+    counts = {}
+    for d in result.get("detections") or []:
+        c = d.get("class")
+        if c:
+            counts[c] = counts.get(c, 0) + 1
+    return counts
+
+
+def _date_bound(value: str, end: bool) -> str:
+    """Acepta 'YYYY-MM-DD' o ISO; un día completo si viene solo la fecha."""
+    value = (value or "").strip()
+    if len(value) == 10:
+        return value + ("T23:59:59" if end else "T00:00:00")
+    return value
+
+
+class InspectionIndex:
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # Migración: índices creados antes de que existieran las miniaturas
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(inspections)")}
+        if "thumbnail" not in cols:
+            conn.execute("ALTER TABLE inspections ADD COLUMN thumbnail TEXT")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo (Flask/WSGI sirve peticiones en varios hilos)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ----------------- Escritura -----------------
+    def upsert(self, result: dict, original: str = None, processed: str = None, json_path: str = None):
+        """Indexa (o re-indexa) un resultado de detección. Re-inspeccionar reemplaza la fila y sus clases."""
+        filename = result.get("filename") or os.path.basename(original or result.get("original_image") or "")
+        if not filename:
+            return
+        resumen = result.get("resumen_inspeccion") or {}
+        row = (
+            filename,
+            _ts_from(result, filename),
+            resumen.get("zona") or resumen.get("lugar"),
+            resumen.get("prioridad_global"),
+            resumen.get("urgencia_global"),
+            int(resumen.get("detecciones") or len(result.get("detections") or [])),
+            (original or result.get("original_image") or "").replace("\\", "/"),
+            (processed or result.get("processed_image") or "").replace("\\", "/"),
+            (result.get("thumbnail_image") or "").replace("\\", "/") or None,
+            json_path,
+            datetime.now().isoformat(timespec="seconds"),
+        )
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO inspections "
+                "(filename, ts, zona, prioridad, urgencia, detecciones, original, processed, thumbnail, json_path, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            conn.execute("DELETE FROM inspection_classes WHERE filename = ?", (filename,))
+            conn.executemany(
+                "INSERT INTO inspection_classes (filename, clase, n) VALUES (?, ?, ?)",
+                [(filename, c, n) for c, n in _class_counts(result).items()],
+            )
+
+    def delete(self, filename: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM inspections WHERE filename = ?", (filename,))
+
+    # ----------------- Lectura -----------------
+    def is_empty(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM inspections LIMIT 1").fetchone() is None
+
+    def query(self, limit=10, cursor=None, date_from=None, date_to=None, zona=None, prioridad=None, clase=None) -> dict:
+        """
+        Página de historial (más reciente primero) con filtros opcionales.
+        Paginación por cursor ('ts|filename' del último ítem): cada página cuesta lo mismo sin importar la profundidad.
+        """
+        limit = max(1, min(int(limit or 10), MAX_PAGE))
+        where, args = [], []
+        if date_from:
+            where.append("i.ts >= ?"); args.append(_date_bound(date_from, end=False))
+        if date_to:
+            where.append("i.ts <= ?"); args.append(_date_bound(date_to, end=True))
+        if zona:
+            where.append("i.zona = ?"); args.append(zona)
+        if prioridad:
+            where.append("i.prioridad = ?"); args.append(prioridad)
+        if clase:
+            where.append("EXISTS (SELECT 1 FROM inspection_classes c WHERE c.filename = i.filename AND c.clase = ?)")
+            args.append(clase)
+        if cursor and "|" in cursor:
+            c_ts, c_fn = cursor.split("|", 1)
+            where.append("(i.ts < ? OR (i.ts = ? AND i.filename < ?))")
+            args.extend([c_ts, c_ts, c_fn])
+
+        sql = "SELECT i.* FROM inspections i"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY i.ts DESC, i.filename DESC LIMIT ?"
+        conn = self._conn()
+        rows = conn.execute(sql, args + [limit + 1]).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        classes = {}
+        if rows:
+            marks = ",".join("?" * len(rows))
+            for r in conn.execute(
+                f"SELECT filename, clase, n FROM inspection_classes WHERE filename IN ({marks})",
+                [r["filename"] for r in rows],
+            ):
+                classes.setdefault(r["filename"], {})[r["clase"]] = r["n"]
+
+        items = [{
+            "original": r["original"],
+            "processed": r["processed"],
+            "thumbnail": r["thumbnail"],
+            "filename": r["filename"],
+            "timestamp": r["ts"].replace("T", " "),
+            "zona": r["zona"],
+            "prioridad": r["prioridad"],
+            "urgencia": r["urgencia"],
+            "detecciones": r["detecciones"],
+            "clases": classes.get(r["filename"], {}),
+        } for r in rows]
+        next_cursor = f"{rows[-1]['ts']}|{rows[-1]['filename']}" if has_more else None
+        return {"history": items, "next_cursor": next_cursor}
+
+    # ----------------- Backfill -----------------
+    def backfill(self, result_folder, upload_folder=None, on_result=None) -> int:
+        """
+        Indexa los <filename>.json ya existentes en static/results. Retorna cuántos se indexaron.
+        on_result(result) se llama por cada uno (p.ej. para poblar analytics).
+        """
+        n = 0
+        for entry in os.scandir(result_folder):
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            except Exception:
+                continue
+            filename = entry.name[: -len(".json")]
+            result.setdefault("filename", filename)
+            original = os.path.join(upload_folder, filename) if upload_folder else None
+            processed = os.path.join(result_folder, filename)
+            self.upsert(result, original=original, processed=processed, json_path=entry.path)
+            if on_result is not None:
+                on_result(result)
+            n += 1
+        return n
+
+
+if __name__ == "__main__":
+    import argparse
+
+    base = Path(__file__).resolve().parent
+    ap = argparse.ArgumentParser(description="Índice de inspecciones (AI Detect)")
+    ap.add_argument("--db", default=os.getenv("AI_DETECT_INDEX_DB", str(base / "data" / "inspections.db")))
+    ap.add_argument("--results", default=str(base / "static" / "results"))
+    ap.add_argument("--uploads", default=str(base / "static" / "uploads"))
+    ap.add_argument("--backfill", action="store_true", help="indexar los <filename>.json existentes")
+    args = ap.parse_args()
+
+    idx = InspectionIndex(args.db)
+    if args.backfill:
+        try:
+            from .analytics import InspectionAnalytics
+        except Exception:
+            from analytics import InspectionAnalytics
+        stats = InspectionAnalytics(args.db)
+        print(f"Indexados: {idx.backfill(args.results, args.uploads, on_result=stats.record)}")
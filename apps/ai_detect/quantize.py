@@ -0,0 +1,119 @@
+# quantize.py — Variante INT8 del detector (cuantización estática de ONNX Runtime)
+# Exporta el .pt a ONNX (yolo_backend.export), calibra las activaciones con fotos reales y escribe
+# <stem>.int8.onnx junto a los pesos. ProblemDetector la usa con AI_DETECT_PRECISION=int8.
+#   python -m apps.ai_detect.quantize [--weights ...] [--calib apps/ai_detect/static/results] [--limit 100]
+# La evaluación contra FP32 (latencia y concordancia de cajas) está en benchmarks/quantization_eval.py.
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from apps.common.yolo_backend import EXPORT_IMGSZ, export
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_WEIGHTS = BASE_DIR / "modelos" / "problemas_infraestructura.pt"
+DEFAULT_CALIB = BASE_DIR / "static" / "results"
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def quantized_path(weights) -> Path:
+    weights = Path(weights)
+    return weights.with_name(f"{weights.stem}.int8.onnx")
+
+
+def calibration_images(folder, limit=100):
+    """Rutas de imágenes de calibración (sin miniaturas), las más recientes primero."""
+    folder = Path(folder)
+    if not folder.is_dir():
+        return []
+    files = [p for p in folder.iterdir()
+             if p.suffix.lower() in IMAGE_EXTS and not p.name.endswith(".thumb.jpg")]
+    files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    return files[:limit]
+
+
+def letterbox(img, size=EXPORT_IMGSZ):
+    """Mismo preprocesado que Ultralytics: resize con aspecto + padding gris 114, RGB, CHW, [0, 1]."""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    x = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return x[None]
+
+
+def _copy_metadata(src: Path, dst: Path):
+    """Ultralytics lee names/stride/imgsz de metadata_props; la cuantización no siempre los conserva."""
+    import onnx
+
+    meta = {p.key: p.value for p in onnx.load(str(src), load_external_data=False).metadata_props}
+    model = onnx.load(str(dst))
+    present = {p.key for p in model.metadata_props}
+    for k, v in meta.items():
+        if k not in present:
+            model.metadata_props.add(key=k, value=v)
+    onnx.save(model, str(dst))
+
+
+def quantize(weights=DEFAULT_WEIGHTS, calib_dir=DEFAULT_CALIB, limit=100, out=None, per_channel=True) -> Path:
+    """Genera la variante INT8 (QDQ, pesos por canal) y retorna su ruta."""
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    weights = Path(weights)
+    out = Path(out) if out else quantized_path(weights)
+    images = calibration_images(calib_dir, limit)
+    if not images:
+        raise RuntimeError(f"Sin imágenes de calibración en {calib_dir}")
+
+    fp32 = export(weights, "onnx")
+    prep = out.with_name(f".{out.stem}.prep.onnx")
+    quant_pre_process(str(fp32), str(prep))
+
+    import onnxruntime as ort
+    input_name = ort.InferenceSession(str(prep), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._it = iter(images)
+
+        def get_next(self):
+            for p in self._it:
+                img = cv2.imread(str(p))
+                if img is not None:
+                    return {input_name: letterbox(img)}
+            return None
+
+    tmp = out.with_name(f".{out.name}.tmp")
+    try:
+        quantize_static(
+            str(prep), str(tmp), _Reader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=per_channel,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+        _copy_metadata(fp32, tmp)
+        os.replace(tmp, out)
+    finally:
+        for p in (prep, tmp):
+            if p.exists():
+                p.unlink()
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Variante INT8 del detector de problemas")
+    ap.add_argument("--weights", default=str(DEFAULT_WEIGHTS))
+    ap.add_argument("--calib", default=str(DEFAULT_CALIB), help="carpeta con imágenes de calibración")
+    ap.add_argument("--limit", type=int, default=100)
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--per-tensor", action="store_true", help="pesos por tensor en vez de por canal")
+    args = ap.parse_args()
+    path = quantize(args.weights, args.calib, args.limit, args.out, per_channel=not args.per_tensor)
+    print(f"✅ Modelo INT8: {path}")
@@ -0,0 +1,232 @@
+# vad.py — Detección de actividad de voz (VAD) previa al STT
+# Decodifica el chunk, mide energía por frames y decide si hay voz.
+# - Chunks en silencio: se omiten (no se llama a la API de transcripción).
+# - Chunks con voz: se recortan silencios al inicio/fin antes de enviarlos.
+# Dictado en vivo: MediaRecorder con timeslice solo pone la cabecera del contenedor en el primer chunk;
+# with_stream_header() la guarda por sesión (sid) y la antepone a los chunks de continuación.
+# Si el audio no se puede decodificar (p.ej. continuación sin cabecera conocida o sin ffmpeg)
+# se deja pasar tal cual: el VAD nunca bloquea una transcripción por error propio.
+import io
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from pydub import AudioSegment
+except Exception:  # pydub/ffmpeg opcionales: sin ellos el VAD queda desactivado
+    AudioSegment = None
+
+# ========= Configuración (por entorno) =========
+VAD_ENABLED = os.getenv("STT_VAD_ENABLED", "1").lower() not in ("0", "false", "no")
+VAD_SAMPLE_RATE = 16000
+VAD_FRAME_MS = int(os.getenv("STT_VAD_FRAME_MS", "30"))
+VAD_FLOOR_DBFS = float(os.getenv("STT_VAD_FLOOR_DBFS", "-50"))    # por debajo: siempre silencio
+VAD_SPEECH_DBFS = float(os.getenv("STT_VAD_SPEECH_DBFS", "-32"))  # por encima: siempre voz
+VAD_SNR_DB = float(os.getenv("STT_VAD_SNR_DB", "10"))             # margen sobre el ruido de fondo
+VAD_MIN_SPEECH_MS = int(os.getenv("STT_VAD_MIN_SPEECH_MS", "150"))
+VAD_PAD_MS = int(os.getenv("STT_VAD_PAD_MS", "250"))
+VAD_MIN_TRIM_MS = int(os.getenv("STT_VAD_MIN_TRIM_MS", "400"))    # recortar solo si se ahorra al menos esto
+STREAM_HEADER_TTL_SEC = int(os.getenv("STT_VAD_HEADER_TTL_SEC", "600"))
+STREAM_HEADER_MAX = int(os.getenv("STT_VAD_HEADER_MAX", "1000"))
+
+# ========= Estadísticas (por proceso) =========
+_stats_lock = threading.Lock()
+_stats = {
+    "chunks_total": 0,
+    "chunks_skipped": 0,
+    "chunks_trimmed": 0,
+    "chunks_undecoded": 0,
+    "chunks_header_restored": 0,
+    "audio_s_total": 0.0,
+    "audio_s_skipped": 0.0,
+}
+
+
+# Cabeceras de contenedor: EBML (webm/mkv) y página Ogg
+_EBML = b"\x1a\x45\xdf\xa3"
+_OGG = b"OggS"
+_CONTAINER_MAGIC = {"webm": _EBML, "ogg": _OGG, "opus": _OGG}
+_WEBM_CLUSTER = b"\x1f\x43\xb6\x75"
+# Cluster de tamaño desconocido con Timecode=0: para continuaciones que empiezan en un SimpleBlock suelto
+_WEBM_CLUSTER_OPEN = _WEBM_CLUSTER + b"\x01\xff\xff\xff\xff\xff\xff\xff" + b"\xe7\x81\x00"
+
+_headers_lock = threading.Lock()
+_headers = OrderedDict()  # sid -> (cabecera, contenedor, último uso)
+
+
+def _ogg_header_len(raw: bytes) -> int:
+    """Bytes de las páginas Ogg iniciales con granule 0 (OpusHead/OpusTags). 0 si no hay."""
+    pos = 0
+    while raw.startswith(_OGG, pos) and pos + 27 <= len(raw):
+        granule = struct.unpack_from("<q", raw, pos + 6)[0]
+        if granule != 0:
+            break
+        n_segs = raw[pos + 26]
+        pos += 27 + n_segs + sum(raw[pos + 27:pos + 27 + n_segs])
+    return min(pos, len(raw))
+
+
+def _split_header(raw: bytes):
+    """(cabecera, contenedor) de un chunk inicial; (None, None) si no empieza con una cabecera conocida."""
+    if raw.startswith(_EBML):
+        cut = raw.find(_WEBM_CLUSTER)
+        return raw[:cut if cut > 0 else len(raw)], "webm"
+    if raw.startswith(_OGG) and len(raw) > 5 and raw[5] & 0x02:  # página BOS
+        return raw[:_ogg_header_len(raw)], "ogg"
+    return None, None
+
+
+def with_stream_header(sid: str, raw: bytes) -> bytes:
+    """
+    Chunk decodificable de un stream de dictado. El primer chunk de 'sid' (con cabecera) la registra y se
+    retorna igual; a los de continuación se les antepone la cabecera registrada. Sin cabecera conocida
+    (o sin sid) el chunk se retorna tal cual.
+    """
+    if not sid or not raw:
+        return raw
+    now = time.monotonic()
+    header, container = _split_header(raw)
+    with _headers_lock:
+        for old in [k for k, (_, _, ts) in _headers.items() if now - ts > STREAM_HEADER_TTL_SEC]:
+            del _headers[old]
+        if header is not None:
+            _headers[sid] = (header, container, now)
+            _headers.move_to_end(sid)
+            while len(_headers) > STREAM_HEADER_MAX:
+                _headers.popitem(last=False)
+            return raw
+        entry = _headers.get(sid)
+        if entry is None:
+            return raw
+        header, container, _ = entry
+        _headers[sid] = (header, container, now)
+    if container == "webm" and not raw.startswith(_WEBM_CLUSTER):
+        header += _WEBM_CLUSTER_OPEN
+    with _stats_lock:
+        _stats["chunks_header_restored"] += 1
+    return header + raw
+
+
+def forget_stream(sid: str):
+    """Olvida la cabecera registrada de 'sid' (fin del dictado)."""
+    if sid:
+        with _headers_lock:
+            _headers.pop(sid, None)
+
+
+def _decode(raw: bytes, filename: str = ""):
+    """Decodifica bytes de audio a PCM mono 16 kHz (float32 en [-1, 1]). None si no se puede."""
+    if AudioSegment is None or not raw:
+        return None
+    ext = os.path.splitext(filename or "")[1].lstrip(".").lower() or None
+    magic = _CONTAINER_MAGIC.get(ext)
+    if magic is not None and not raw.startswith(magic):
+        # Continuación de MediaRecorder sin cabecera registrada (ver with_stream_header): ffmpeg no puede
+        # abrirla ni con ni sin pista de formato; no gastar dos subprocesos para terminar en "no decodificable"
+        return None
+    try:
+        seg = AudioSegment.from_file(io.BytesIO(raw), format=ext)
+    except Exception:
+        try:
+            seg = AudioSegment.from_file(io.BytesIO(raw))
+        except Exception:
+            return None
+    seg = seg.set_channels(1).set_frame_rate(VAD_SAMPLE_RATE).set_sample_width(2)
+    samples = np.frombuffer(seg.raw_data, dtype=np.int16).astype(np.float32) / 32768.0
+    return samples, seg
+
+
+def _voiced_frames(samples: np.ndarray) -> np.ndarray:
+    """Máscara booleana de frames con voz según energía (dBFS) y ruido de fondo estimado."""
+    frame_len = max(1, VAD_SAMPLE_RATE * VAD_FRAME_MS // 1000)
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12)
+    db = 20.0 * np.log10(rms)
+    noise = float(np.percentile(db, 10))
+    return (db > VAD_FLOOR_DBFS) & ((db > noise + VAD_SNR_DB) | (db > VAD_SPEECH_DBFS))
+
+
+def analyze(raw: bytes, filename: str = "") -> dict:
+    """
+    Ejecuta el VAD sobre un payload de audio.
+    Retorna:
+      { "decoded": bool, "speech": bool, "duration_s": float, "speech_s": float,
+        "audio": bytes|None, "filename": str|None }
+    'audio'/'filename' solo vienen si conviene enviar una versión recortada.
+    """
+    out = {"decoded": False, "speech": True, "duration_s": 0.0, "speech_s": 0.0,
+           "audio": None, "filename": None}
+    if not VAD_ENABLED:
+        return out
+
+    decoded = _decode(raw, filename)
+    if decoded is None:
+        _record(out)
+        return out
+    samples, seg = decoded
+
+    out["decoded"] = True
+    out["duration_s"] = len(samples) / float(VAD_SAMPLE_RATE)
+
+    voiced = _voiced_frames(samples)
+    speech_ms = int(voiced.sum()) * VAD_FRAME_MS
+    out["speech_s"] = speech_ms / 1000.0
+    if speech_ms < VAD_MIN_SPEECH_MS:
+        out["speech"] = False
+        _record(out)
+        return out
+
+    # Recorte de silencios al inicio/fin (con margen para no cortar fonemas)
+    idx = np.flatnonzero(voiced)
+    start_ms = max(0, int(idx[0]) * VAD_FRAME_MS - VAD_PAD_MS)
+    end_ms = min(len(seg), (int(idx[-1]) + 1) * VAD_FRAME_MS + VAD_PAD_MS)
+    if len(seg) - (end_ms - start_ms) >= VAD_MIN_TRIM_MS:
+        trimmed = seg[start_ms:end_ms]
+        buf = io.BytesIO()
+        try:
+            trimmed.export(buf, format="ogg", codec="libopus")
+            name = "audio.ogg"
+        except Exception:
+            buf = io.BytesIO()
+            trimmed.export(buf, format="wav")
+            name = "audio.wav"
+        out["audio"] = buf.getvalue()
+        out["filename"] = name
+        out["trimmed_s"] = (len(seg) - len(trimmed)) / 1000.0
+
+    _record(out)
+    return out
+
+
+def _record(result: dict):
+    with _stats_lock:
+        _stats["chunks_total"] += 1
+        if not result["decoded"]:
+            _stats["chunks_undecoded"] += 1
+            return
+        _stats["audio_s_total"] += result["duration_s"]
+        if not result["speech"]:
+            _stats["chunks_skipped"] += 1
+            _stats["audio_s_skipped"] += result["duration_s"]
+        elif result.get("trimmed_s"):
+            _stats["chunks_trimmed"] += 1
+            _stats["audio_s_skipped"] += result["trimmed_s"]
+
+
+def stats() -> dict:
+    """Snapshot de contadores y fracciones omitidas (chunks y segundos de audio)."""
+    with _stats_lock:
+        s = dict(_stats)
+    s["enabled"] = VAD_ENABLED and AudioSegment is not None
+    s["chunks_skipped_frac"] = round(s["chunks_skipped"] / s["chunks_total"], 4) if s["chunks_total"] else 0.0
+    s["audio_s_skipped_frac"] = round(s["audio_s_skipped"] / s["audio_s_total"], 4) if s["audio_s_total"] else 0.0
+    s["audio_s_total"] = round(s["audio_s_total"], 3)
+    s["audio_s_skipped"] = round(s["audio_s_skipped"], 3)
+    return s
@@ -1,8 +1,9 @@
 # backend.py
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
-from openai import OpenAI
 import os
+import sys
+import io
 import base64
 import tempfile
 import speech_recognition as sr
@@ -11,6 +12,14 @@ import json
 import re
 from pathlib import Path
 
+# `python backend.py` desde apps/ai_detectV2: la raíz del repo (apps.common) no está en sys.path
+_REPO_ROOT = str(Path(__file__).resolve().parents[2])
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from apps.common import openai_client
+from apps.common.metrics import instrument_flask, stage
+
 # ─────────────────────────────────────────────────────────────
 # Config
 # ─────────────────────────────────────────────────────────────
@@ -22,10 +31,12 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 app = Flask(__name__, static_folder=None)
 CORS(app)
+instrument_flask(app, "ai_detect_v2")
 
-# OpenAI client (API v1.x)
+# OpenAI client (API v1.x) compartido con las demás sub-apps: pool keep-alive, timeouts, reintentos y breaker
 # Asegúrate de exportar OPENAI_API_KEY en tu entorno
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OPENAI_BASE_URL apunta a otro endpoint compatible (p.ej. el stub local para pruebas de carga)
+client = openai_client.get_client()
 
 # Opcional: limita tamaño de subida (ej. 20 MB)
 app.config["MAX_CONTENT_LENGTH"] = 20 * 1024 * 1024
@@ -120,31 +131,33 @@ def upload_file():
         if not file or file.filename == "":
             return jsonify({"error": "Nombre de archivo vacío"}), 400
 
-        tmp_path = UPLOAD_DIR / file.filename
-        file.save(tmp_path)
+        # Bytes directo del request: sin archivo temporal ni relecturas
+        raw = file.read()
+        if not raw:
+            return jsonify({"error": "Archivo vacío"}), 400
 
         # <<< NUEVO: idioma desde query (?lang=es|en)
         lang = (request.args.get("lang") or "es").lower()
         if lang not in ("es", "en"):
             lang = "es"
 
-        result = process_image(tmp_path, lang=lang)   # <<< pasa lang
-
-        try:
-            tmp_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+        result = process_image(raw, lang=lang)   # <<< pasa lang
 
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-def process_image(image_path: Path, lang: str = "es"):
-    Image.open(image_path).close()
+def process_image(image, lang: str = "es"):
+    """'image' puede ser bytes (request) o una ruta a disco."""
+    if not isinstance(image, (bytes, bytearray)):
+        with open(image, "rb") as f:
+            image = f.read()
+
+    # Valida que sea imagen (solo cabecera; no decodifica píxeles)
+    Image.open(io.BytesIO(image)).close()
 
-    with open(image_path, "rb") as f:
-        image_b64 = base64.b64encode(f.read()).decode("utf-8")
+    image_b64 = base64.b64encode(image).decode("utf-8")
 
     # <<< NUEVO: prompt por idioma
     if lang == "en":
@@ -163,17 +176,19 @@ def process_image(image_path: Path, lang: str = "es"):
             "{objects: [{name: string, count: number}], analysis: string, suggestions: string}"
         )
 
-    resp = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}},
-            ],
-        }],
-        max_tokens=1000,
-    )
+    with stage("ai_detect_v2", "openai_chat"):
+        resp = openai_client.call(
+            "chat", "gpt-4o", client.chat.completions.create,
+            model="gpt-4o",
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"}},
+                ],
+            }],
+            max_tokens=1000,
+        )
 
     text = resp.choices[0].message.content
 
@@ -211,7 +226,7 @@ def speech_to_text():
         audio_file.save(tmp_path)
 
         recognizer = sr.Recognizer()
-        with sr.AudioFile(str(tmp_path)) as source:
+        with stage("ai_detect_v2", "stt"), sr.AudioFile(str(tmp_path)) as source:
             audio_data = recognizer.record(source)
             text = recognizer.recognize_google(audio_data, language="es-ES")
 
@@ -243,15 +258,17 @@ def chat():
             "You are a helpful assistant with a futuristic style. Always respond in English."
         )
 
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": user_message},
-            ],
-            max_tokens=600,
-            temperature=0.7,
-        )
+        with stage("ai_detect_v2", "openai_chat"):
+            resp = openai_client.call(
+                "chat", "gpt-4o-mini", client.chat.completions.create,
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_msg},
+                    {"role": "user", "content": user_message},
+                ],
+                max_tokens=600,
+                temperature=0.7,
+            )
 
         bot_response = resp.choices[0].message.content
         return jsonify({"response": bot_response})
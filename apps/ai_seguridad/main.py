@@ -1,4 +1,5 @@
 import os
+import sys
 import cv2
 import json
 import time
@@ -13,9 +14,18 @@ import numpy as np
 from fastapi import FastAPI, UploadFile, File, Request, WebSocket
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from ultralytics import YOLO
 
+# `python main.py` desde apps/ai_seguridad: la raíz del repo (apps.common) no está en sys.path
+_REPO_ROOT = str(Path(__file__).resolve().parents[2])
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+
+from apps.common.metrics import stage
+from apps.common.readiness import parse_sizes, readiness
+from apps.common.yolo_backend import load_yolo, warmup
+
 # ───────────────────────── App (root_path para subruta en prod) ─────────────────────────
 ROOT_PATH = os.getenv("ROOT_PATH", "")  # p.ej. "/ai-seguridad" en Render
 app = FastAPI(
@@ -37,20 +47,33 @@ os.makedirs(STATIC_DIR / "css", exist_ok=True)
 os.makedirs(STATIC_DIR / "js", exist_ok=True)
 os.makedirs(STATIC_DIR / "uploads", exist_ok=True)
 
-# ───────────────────────── Carga perezosa del modelo ─────────────────────────
+# ─────────────── Modelo (carga + warmup en segundo plano al importar; get_model() sigue siendo seguro) ───────────────
 MODEL_PATH = BASE_DIR / "yolov8n.pt"
 _model = None
+_model_info = {}
 _model_lock = threading.Lock()
 
 def get_model() -> YOLO:
-    global _model
+    global _model, _model_info
     if _model is None:
         with _model_lock:
             if _model is None:
                 model_source = str(MODEL_PATH) if MODEL_PATH.exists() else "yolov8n.pt"
-                _model = YOLO(model_source)  # CPU por defecto si no hay GPU
+                # CPU; backend por AI_SEGURIDAD_BACKEND > YOLO_BACKEND (onnx/openvino requieren pesos locales)
+                _model, _model_info = load_yolo(model_source, backend=os.getenv("AI_SEGURIDAD_BACKEND"))
     return _model
 
+def _warmup_model() -> dict:
+    """Carga el modelo y hace inferencias dummy al tamaño típico de frame (AI_SEGURIDAD_WARMUP_SIZES)."""
+    model = get_model()
+    sizes = parse_sizes(os.getenv("AI_SEGURIDAD_WARMUP_SIZES", "640x480"))
+    return {"ms": warmup(model, sizes, int(os.getenv("AI_SEGURIDAD_WARMUP_RUNS", "2"))),
+            "backend": _model_info.get("backend")}
+
+# El modelo ya no espera al primer request: se carga y calienta en segundo plano al importar
+readiness.register("ai_seguridad")
+readiness.run("ai_seguridad", _warmup_model)
+
 # Clases consideradas peligrosas (personalizable)
 DANGER_CLASSES = {'knife', 'gun', 'pistol', 'weapon', 'firearm', 'rifle'}
 SAFETY_CLASSES = {'person', 'backpack', 'handbag', 'suitcase', 'cell phone'}
@@ -62,47 +85,51 @@ def detect_dangers(frame):
       processed_frame, danger_detected(bool), detected_objects(list)
     """
     model = get_model()
-    results = model(frame, verbose=False)
+    with stage("ai_seguridad", "inference"):
+        results = model(frame, verbose=False)
     danger_detected = False
     detected_objects = []
 
-    for result in results:
-        for box in result.boxes:
-            class_id = int(box.cls)
-            class_name = model.names.get(class_id, str(class_id))
-            confidence = float(box.conf)
-
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-            if class_name in DANGER_CLASSES and confidence > 0.5:
-                danger_detected = True
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
-                label = f"ALERTA! {class_name.upper()} {confidence:.2f}"
-                cv2.putText(frame, label, (x1, max(20, y1 - 10)),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                detected_objects.append({
-                    "class": class_name,
-                    "confidence": confidence,
-                    "position": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
-                })
-
-            elif class_name in SAFETY_CLASSES and confidence > 0.5:
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                label = f"{class_name.upper()} {confidence:.2f}"
-                cv2.putText(frame, label, (x1, max(20, y1 - 10)),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-    if danger_detected:
-        cv2.rectangle(frame, (0, 0), (frame.shape[1], 50), (0, 0, 255), -1)
-        cv2.putText(frame, "ZONA PELIGROSA DETECTADA!", (20, 35),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    with stage("ai_seguridad", "postprocess"):
+        for result in results:
+            for box in result.boxes:
+                class_id = int(box.cls)
+                class_name = model.names.get(class_id, str(class_id))
+                confidence = float(box.conf)
+
+                x1, y1, x2, y2 = map(int, box.xyxy[0])
+
+                if class_name in DANGER_CLASSES and confidence > 0.5:
+                    danger_detected = True
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 3)
+                    label = f"ALERTA! {class_name.upper()} {confidence:.2f}"
+                    cv2.putText(frame, label, (x1, max(20, y1 - 10)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+                    detected_objects.append({
+                        "class": class_name,
+                        "confidence": confidence,
+                        "position": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+                    })
+
+                elif class_name in SAFETY_CLASSES and confidence > 0.5:
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                    label = f"{class_name.upper()} {confidence:.2f}"
+                    cv2.putText(frame, label, (x1, max(20, y1 - 10)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+        if danger_detected:
+            cv2.rectangle(frame, (0, 0), (frame.shape[1], 50), (0, 0, 255), -1)
+            cv2.putText(frame, "ZONA PELIGROSA DETECTADA!", (20, 35),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
 
     return frame, danger_detected, detected_objects
 
 # ───────────────────────── Healthcheck ─────────────────────────
 @app.get("/healthz")
 def healthz():
-    return {"ok": True}
+    """Readiness: 200 solo cuando el modelo está cargado y caliente (503 mientras tanto o si falló)."""
+    ready, payload = readiness.check(["ai_seguridad"])
+    return JSONResponse(payload, status_code=200 if ready else 503)
 
 # ───────────────────────── Home ─────────────────────────
 @app.get("/", response_class=HTMLResponse)
@@ -114,7 +141,8 @@ async def home(request: Request):
 async def upload_image(request: Request, file: UploadFile = File(...)):
     raw = await file.read()
     nparr = np.frombuffer(raw, np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    with stage("ai_seguridad", "decode"):
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
     if frame is None:
         return {"error": "El archivo no es una imagen válida."}
@@ -123,9 +151,9 @@ async def upload_image(request: Request, file: UploadFile = File(...)):
 
     out_name = f"processed_{uuid.uuid4().hex}.jpg"
     out_path = STATIC_DIR / "uploads" / out_name
-    cv2.imwrite(str(out_path), processed_frame)
-
-    ok, img_encoded = cv2.imencode(".jpg", processed_frame)
+    with stage("ai_seguridad", "imwrite"):
+        cv2.imwrite(str(out_path), processed_frame)
+        ok, img_encoded = cv2.imencode(".jpg", processed_frame)
     if not ok:
         return {"error": "No se pudo codificar la imagen de salida."}
     img_base64 = base64.b64encode(img_encoded).decode("utf-8")
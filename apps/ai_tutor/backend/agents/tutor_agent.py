@@ -1,11 +1,23 @@
 # apps/ai_tutor/backend/agents/tutor_agent.py
 import os
-from typing import List, Dict
+import time
+from typing import List, Dict, Tuple
+
+from apps.common import openai_client
+from apps.common.metrics import stage
+from apps.common.tokens import count_tokens, fit_history, truncate_to_tokens
+
+try:
+    from ..models.session_store import SessionStore
+    from ..utils.doc_index import SessionDocs, get_index
+except Exception:
+    from models.session_store import SessionStore
+    from utils.doc_index import SessionDocs, get_index
+
+DEFAULT_SESSION = "default"
 
 class TutorAgent:
     def __init__(self):
-        self.conversation_history: List[Dict[str, str]] = []
-
         # Modelo configurable por entorno; pon OPENAI_MODEL si quieres otro.
         # Por defecto uso un modelo actual y económico.
         self.model_new = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
@@ -13,13 +25,15 @@ class TutorAgent:
         self.model_legacy = os.getenv("OPENAI_MODEL_LEGACY", "gpt-3.5-turbo")
 
         # Detecta lib nueva vs legacy
-        try:
-            from openai import OpenAI  # >= 1.0
-            self.client = OpenAI()     # usa OPENAI_API_KEY del entorno
+        if openai_client.OpenAI is not None:  # >= 1.0
+            # Cliente compartido del proceso (OPENAI_API_KEY / OPENAI_BASE_URL del entorno)
+            self.client = openai_client.get_client()
             self.api_mode = "v1"
-        except Exception:
+        else:
             import openai              # < 1.0
             openai.api_key = os.getenv("OPENAI_API_KEY", "")
+            if os.getenv("OPENAI_BASE_URL"):
+                openai.api_base = os.getenv("OPENAI_BASE_URL")
             self.openai = openai
             self.api_mode = "legacy"
 
@@ -30,54 +44,125 @@ class TutorAgent:
             "Da pasos cortos y ejemplos breves cuando ayuden."
         )
 
-        # Límite de turnos a mantener para contexto
-        self.max_turns = 6
+        # Límite de turnos guardados por sesión; el presupuesto de tokens decide cuántos se envían
+        self.max_turns = int(os.getenv("AI_TUTOR_MAX_TURNS", "20"))
+        self.context_tokens = int(os.getenv("AI_TUTOR_CONTEXT_TOKENS", "1500"))
+
+        # Historial por sesión (acotado en sesiones, turnos y TTL)
+        self.sessions = SessionStore(
+            max_sessions=int(os.getenv("AI_TUTOR_MAX_SESSIONS", "500")),
+            ttl_sec=float(os.getenv("AI_TUTOR_SESSION_TTL_SEC", "1800")),
+            max_turns=self.max_turns,
+        )
 
-    def _build_messages(self, user_input: str) -> List[Dict[str, str]]:
-        # Añade el turno actual del usuario al historial (en memoria)
-        self.conversation_history.append({"role": "user", "content": user_input})
+        # Recuperación sobre documentos adjuntos: solo los top-k fragmentos, con su propio presupuesto
+        self.rag_top_k = int(os.getenv("AI_TUTOR_RAG_TOP_K", "4"))
+        self.rag_tokens = int(os.getenv("AI_TUTOR_RAG_TOKENS", "800"))
+        self.index = get_index()
+        # Adjuntos por sesión en SQLite: /upload?sid= y el WebSocket pueden caer en workers distintos
+        self.session_docs = SessionDocs(ttl_sec=self.sessions.ttl_sec)
 
-        # Toma solo el contexto reciente
-        recent = self.conversation_history[-self.max_turns:]
+    def attach_document(self, session_id: str, doc_id: str):
+        """Adjunta un documento indexado a la sesión: sus fragmentos relevantes van en cada prompt."""
+        self.session_docs.attach(session_id, doc_id)
 
-        # Inserta system al inicio
-        messages = [{"role": "system", "content": self.system_prompt}]
-        messages.extend(recent)
-        return messages
+    def _retrieve(self, query: str, doc_ids: List[str]) -> Tuple[str, Dict[str, int]]:
+        """Mensaje de sistema con los top-k fragmentos (recortados a rag_tokens) y sus stats."""
+        t0 = time.perf_counter()
+        hits = self.index.search(query, doc_ids=doc_ids, k=self.rag_top_k)
+        header = "Fragmentos de los documentos del estudiante (úsalos si son relevantes y cita la página):"
+        used = count_tokens(header)
+        parts = []
+        for hit in hits:
+            label = f"[{hit['name']} · p. {hit['page']}] "
+            room = self.rag_tokens - used - count_tokens(label)
+            text = truncate_to_tokens(hit["text"], room)
+            if not text:
+                break
+            parts.append(label + text)
+            used += count_tokens(parts[-1])
+        stats = {"retrieved_chunks": len(parts), "retrieval_ms": round((time.perf_counter() - t0) * 1000, 1)}
+        return (header + "\n" + "\n".join(parts) if parts else ""), stats
 
-    def generate_response(self, user_input: str) -> str:
+    def _build_messages(self, user_input: str, session_id: str = DEFAULT_SESSION, doc_ids=None) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        # Añade el turno actual del usuario al historial de su sesión
+        self.sessions.append(session_id, "user", user_input)
+
+        # System al inicio (+ fragmentos recuperados) + turnos recientes que quepan en el presupuesto
+        head = [{"role": "system", "content": self.system_prompt}]
+        budget = self.context_tokens
+        rag_stats = {}
+        if doc_ids is None and self.rag_top_k > 0:
+            doc_ids = self.session_docs.documents(session_id)
+        if doc_ids and self.rag_top_k > 0:
+            context, rag_stats = self._retrieve(user_input, doc_ids)
+            if context:
+                head.append({"role": "system", "content": context})
+                budget += count_tokens(context)  # el historial conserva su presupuesto completo
+        messages, stats = fit_history(head, self.sessions.messages(session_id), budget)
+        return messages, {**stats, **rag_stats}
+
+    def _complete(self, messages):
+        if self.api_mode == "v1":
+            # Cliente nuevo (openai>=1.0): timeout, reintentos y breaker de openai_client
+            if self.client is None:
+                raise RuntimeError("OPENAI_API_KEY no configurada")
+            return openai_client.call(
+                "chat", self.model_new, self.client.chat.completions.create,
+                model=self.model_new,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=400,
+            )
+        # Cliente legacy (openai<1.0)
+        return self.openai.ChatCompletion.create(
+            model=self.model_legacy,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=400,
+        )
+
+    def generate_response(self, user_input: str, session_id: str = DEFAULT_SESSION, doc_ids=None) -> str:
+        return self.generate(user_input, session_id, doc_ids)[0]
+
+    def generate(self, user_input: str, session_id: str = DEFAULT_SESSION, doc_ids=None) -> Tuple[str, Dict[str, int]]:
+        """
+        Como generate_response, pero además retorna stats de la llamada (tokens de prompt y latencia).
+        doc_ids: documentos a consultar; por defecto, los adjuntos a la sesión.
+        """
         user_input = (user_input or "").strip()
         if not user_input:
-            return "¿En qué tema te gustaría que te ayude?"
+            return "¿En qué tema te gustaría que te ayude?", {}
 
-        messages = self._build_messages(user_input)
+        messages, stats = self._build_messages(user_input, session_id, doc_ids)
 
+        t0 = time.perf_counter()
         try:
+            with stage("ai_tutor", "openai_chat"):
+                resp = self._complete(messages)
             if self.api_mode == "v1":
-                # Cliente nuevo (openai>=1.0)
-                resp = self.client.chat.completions.create(
-                    model=self.model_new,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=400,
-                )
                 ai_response = (resp.choices[0].message.content or "").strip()
+                usage = getattr(resp, "usage", None)
+                if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+                    stats["prompt_tokens"] = usage.prompt_tokens
 
             else:
-                # Cliente legacy (openai<1.0)
-                resp = self.openai.ChatCompletion.create(
-                    model=self.model_legacy,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=400,
-                )
                 # Nota: en legacy el message es un dict
                 ai_response = (resp.choices[0].message["content"] or "").strip()
 
             # Guarda respuesta en el historial
-            self.conversation_history.append({"role": "assistant", "content": ai_response})
-            return ai_response or "No tengo una respuesta en este momento."
+            self.sessions.append(session_id, "assistant", ai_response)
+            stats["llm_latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            return ai_response or "No tengo una respuesta en este momento.", stats
 
         except Exception as e:
             # Devuelve texto legible para mostrar en el chat
-            return f"Error del sistema: {e}"
+            return f"Error del sistema: {e}", stats
+
+    def end_session(self, session_id: str, idle_since: float = None):
+        """
+        Libera el historial de una sesión (p.ej. al cerrar su WebSocket). Con idle_since (time.time() de
+        la desconexión) los adjuntos solo se borran si no se usaron después, p.ej. desde otro worker.
+        """
+        self.sessions.drop(session_id)
+        self.session_docs.drop(session_id, idle_since)
@@ -1,17 +1,32 @@
-from fastapi import FastAPI, WebSocket, Request
+from fastapi import FastAPI, WebSocket, Request, UploadFile, File, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 import os
+import sys
+import time
+import uuid
+import hashlib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict
+
+# `uvicorn main:app` desde apps/ai_tutor/backend: la raíz del repo no está en sys.path y agents/ y
+# utils/ importan apps.common; con el HUB (apps.ai_tutor.backend.main) ya lo está
+_REPO_ROOT = str(Path(__file__).resolve().parents[3])
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
 
 # Imports relativos robustos
 try:
     from .agents.tutor_agent import TutorAgent
     from .utils.voice_processor import VoiceProcessor
+    from .utils import file_processor, session_auth
 except Exception:
     from agents.tutor_agent import TutorAgent
     from utils.voice_processor import VoiceProcessor
+    from utils import file_processor, session_auth
 
 app = FastAPI(title="Tutor AI Futurista")
 
@@ -41,12 +56,186 @@ os.makedirs(BASE / "static" / "audio", exist_ok=True)
 
 tutor = TutorAgent()
 voice_processor = VoiceProcessor()
+voice_processor.start_janitor()
+
+# ── Ejecutores para trabajo bloqueante (OpenAI, gTTS/pydub, STT) ──
+# El tamaño de cada pool es el límite de concurrencia de esa etapa.
+LLM_CONCURRENCY = int(os.getenv("AI_TUTOR_LLM_CONCURRENCY", "4"))
+TTS_CONCURRENCY = int(os.getenv("AI_TUTOR_TTS_CONCURRENCY", "2"))
+STT_CONCURRENCY = int(os.getenv("AI_TUTOR_STT_CONCURRENCY", "2"))
+llm_executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="tutor-llm")
+tts_executor = ThreadPoolExecutor(max_workers=TTS_CONCURRENCY, thread_name_prefix="tutor-tts")
+stt_executor = ThreadPoolExecutor(max_workers=STT_CONCURRENCY, thread_name_prefix="tutor-stt")
+# La extracción de PDFs ya reparte páginas en un pool de procesos; aquí solo se limita cuántas corren a la vez
+INGEST_CONCURRENCY = int(os.getenv("AI_TUTOR_INGEST_CONCURRENCY", "1"))
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_CONCURRENCY, thread_name_prefix="tutor-ingest")
+
+# Documentos subidos (se guardan por hash; la cache de texto vive en data/ingest_cache)
+UPLOAD_DIR = file_processor.DATA_DIR / "uploads"
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+MAX_UPLOAD_MB = float(os.getenv("AI_TUTOR_MAX_UPLOAD_MB", "50"))
+UPLOAD_EXTS = (".pdf",) + file_processor.IMAGE_EXTS + (".txt",)
+
+# Sesiones del chat: el sid lo emite el servidor (firmado, ver utils/session_auth.py). Al desconectar se
+# espera RESUME_GRACE_SEC a que el cliente reconecte con su token antes de liberar la sesión.
+RESUME_GRACE_SEC = float(os.getenv("AI_TUTOR_RESUME_GRACE_SEC", "120"))
+_open_sessions: Dict[str, int] = {}   # session_id -> WebSockets abiertos en este proceso
+_session_epoch: Dict[str, int] = {}   # session_id -> nº de la última conexión (invalida liberaciones viejas)
+
+def release_session(session_id: str, epoch: int, disconnected_at: float):
+    """Libera la sesión si nadie reconectó a este proceso durante la gracia."""
+    if _open_sessions.get(session_id) or _session_epoch.get(session_id) != epoch:
+        return
+    _session_epoch.pop(session_id, None)
+    tutor.end_session(session_id, idle_since=disconnected_at)
+
+async def run_blocking(executor: ThreadPoolExecutor, fn, *args):
+    """
+    Ejecuta fn(*args) en el pool sin bloquear el event loop.
+    Retorna (resultado, timings) con espera en cola y ejecución en ms.
+    """
+    submitted = time.perf_counter()
+    started = {}
+
+    def _call():
+        started["t"] = time.perf_counter()
+        return fn(*args)
+
+    result = await asyncio.get_running_loop().run_in_executor(executor, _call)
+    done = time.perf_counter()
+    t0 = started.get("t", submitted)
+    return result, {
+        "queue_ms": round((t0 - submitted) * 1000, 1),
+        "run_ms": round((done - t0) * 1000, 1),
+    }
+
+def audio_url_for(websocket: WebSocket, audio_fs_path: str) -> str:
+    """URL pública del audio respetando root_path cuando la sub-app está bajo prefijo (p.ej. /ai-tutor)."""
+    root = websocket.scope.get("root_path", "") or ""
+    try:
+        static_root = (BASE / "static").resolve()
+        rel = Path(audio_fs_path).resolve().relative_to(static_root)
+        return f"{root}{STATIC_MOUNT}/{rel.as_posix()}"
+    except Exception:
+        # Fallbacks por si llega una ruta ya relativa/absoluta
+        p = str(audio_fs_path).replace("\\", "/")
+        if p.startswith(STATIC_MOUNT + "/"):
+            return f"{root}{p}"
+        if p.startswith("static/"):
+            # lo normalizamos al mount actual para servirlo correctamente
+            return f"{root}{STATIC_MOUNT}/{p.split('static/', 1)[1]}"
+        return p  # último recurso (no recomendado)
+
+async def push_audio(websocket: WebSocket, text: str, fmt: str, timings: dict, seq: int, after=None):
+    """
+    Sintetiza en segundo plano y envía la URL de audio cuando esté lista.
+    'after' es el envío de la respuesta anterior de la conexión: la síntesis corre en paralelo, pero el
+    audio de la respuesta N+1 nunca sale antes que el de la N.
+    """
+    try:
+        audio_fs_path, t = await run_blocking(tts_executor, voice_processor.text_to_speech, text, fmt)
+        if after is not None:
+            await asyncio.wait({after})
+        if not audio_fs_path:
+            return
+        await websocket.send_json({
+            "type": "audio",
+            "seq": seq,
+            "path": audio_url_for(websocket, audio_fs_path),
+            "timings": {**timings, "tts_queue_ms": t["queue_ms"], "tts_ms": t["run_ms"]},
+        })
+    except Exception as e:
+        print(f"[WS] audio error: {e}")
 
 # Healthcheck para Render
 @app.get("/healthz")
 async def healthz():
     return {"status": "ok"}
 
+# Sesiones de conversación activas (memoria acotada)
+@app.get("/sessions/stats")
+async def sessions_stats():
+    return tutor.sessions.stats()
+
+def ingest_and_index(path: Path, name: str):
+    """Extrae el texto (cache por hash) y lo agrega al índice de recuperación del tutor."""
+    entry = file_processor.ingest_file(path, name)
+    return entry, tutor.index.add(entry)
+
+# Subida e ingesta de documentos (PDF, imagen, texto); con ?sid=<token de la sesión> queda adjunto a ella
+@app.post("/upload")
+async def upload_document(file: UploadFile = File(...), sid: str = ""):
+    session_id = session_auth.verify(sid) if sid else None
+    if sid and session_id is None:
+        raise HTTPException(status_code=403, detail="Sesión inválida")
+    ext = Path(file.filename or "").suffix.lower()
+    if ext not in UPLOAD_EXTS:
+        raise HTTPException(status_code=415, detail=f"Formato no soportado; use {', '.join(UPLOAD_EXTS)}")
+
+    # Copia por bloques calculando el hash: el nombre final es el contenido (misma subida = mismo archivo)
+    tmp = UPLOAD_DIR / f".{uuid.uuid4().hex}{ext}"
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as out:
+            while True:
+                block = await file.read(1024 * 1024)
+                if not block:
+                    break
+                size += len(block)
+                if size > MAX_UPLOAD_MB * 1024 * 1024:
+                    raise HTTPException(status_code=413, detail=f"Archivo mayor a {MAX_UPLOAD_MB:g} MB")
+                sha.update(block)
+                out.write(block)
+        dst = UPLOAD_DIR / f"{sha.hexdigest()[:16]}{ext}"
+        try:
+            os.link(tmp, dst)  # atómico: si dos subidas iguales llegan a la vez, solo una crea el original
+            created = True
+        except FileExistsError:
+            created = False  # mismo contenido ya subido: se conserva el original existente
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+    try:
+        (entry, indexed), t = await run_blocking(ingest_executor, ingest_and_index, dst, file.filename)
+    except Exception as e:
+        if created:  # solo se borra lo que creó esta subida, nunca un original ingerido antes
+            dst.unlink(missing_ok=True)
+        raise HTTPException(status_code=422, detail=f"No se pudo procesar el documento: {e}")
+
+    if session_id:
+        tutor.attach_document(session_id, entry["doc_id"])
+    pages = entry.pop("pages")
+    preview = next((p for p in pages if p.strip()), "")[:500]
+    return {
+        **{k: v for k, v in entry.items() if k != "version"},
+        "pages": len(pages),
+        "bytes": size,
+        "preview": preview,
+        "index": {k: indexed.get(k) for k in ("n_chunks", "terms", "indexed", "build_ms")},
+        "attached": session_id is not None,
+        "timings": {"ingest_queue_ms": t["queue_ms"], "ingest_ms": t["run_ms"]},
+    }
+
+# Índice de recuperación: totales y búsqueda de prueba en los documentos adjuntos a la sesión
+@app.get("/index/stats")
+async def index_stats():
+    return tutor.index.stats()
+
+@app.get("/index/search")
+async def index_search(q: str, sid: str, doc_id: str = "", k: int = 4):
+    session_id = session_auth.verify(sid)
+    if session_id is None:
+        raise HTTPException(status_code=403, detail="Sesión inválida")
+    doc_ids = tutor.session_docs.documents(session_id)
+    if doc_id:
+        if doc_id not in doc_ids:
+            raise HTTPException(status_code=404, detail="Documento no adjunto a esta sesión")
+        doc_ids = [doc_id]
+    hits = tutor.index.search(q, doc_ids=doc_ids, k=max(1, min(k, 20))) if doc_ids else []
+    return {"q": q, "hits": hits}
+
 # Página principal
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -56,45 +245,62 @@ async def home(request: Request):
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    pending = set()
+    reply_seq = 0       # número de respuesta en esta conexión (viaja en "text" y "audio")
+    last_push = None    # último push_audio: los audios salen en orden de respuesta
+
+    # Historial propio por sesión: el sid lo genera el servidor; solo un token firmado de una conexión
+    # anterior (?sid=<token>) retoma la sesión al reconectar. Cualquier otro valor abre una sesión nueva.
+    session_id = session_auth.verify(websocket.query_params.get("sid"))
+    resumed = session_id is not None
+    if resumed:
+        tutor.session_docs.touch(session_id)
+    else:
+        session_id = session_auth.new_session()
+    _open_sessions[session_id] = _open_sessions.get(session_id, 0) + 1
+    epoch = _session_epoch[session_id] = _session_epoch.get(session_id, 0) + 1
     try:
+        await websocket.send_json({"type": "session", "sid": session_auth.sign(session_id), "resumed": resumed})
         while True:
             data = await websocket.receive_json()
             msg_type = data.get("type")
 
             if msg_type == "text":
                 user_text = data.get("content", "")
-                response = tutor.generate_response(user_text)
-
-                # 1) responder texto
-                await websocket.send_json({"type": "text", "content": response})
-
-                # 2) sintetizar y mandar URL de audio servible
-                audio_fs_path = voice_processor.text_to_speech(response)
-
-                # Respetar root_path cuando esta sub-app está bajo prefijo (p.ej. /ai-tutor)
-                root = websocket.scope.get("root_path", "") or ""
-                try:
-                    static_root = (BASE / "static").resolve()
-                    rel = Path(audio_fs_path).resolve().relative_to(static_root)
-                    audio_url = f"{root}{STATIC_MOUNT}/{rel.as_posix()}"
-                except Exception:
-                    # Fallbacks por si llega una ruta ya relativa/absoluta
-                    p = str(audio_fs_path).replace("\\", "/")
-                    if p.startswith(STATIC_MOUNT + "/"):
-                        audio_url = f"{root}{p}"
-                    elif p.startswith("static/"):
-                        # lo normalizamos al mount actual para servirlo correctamente
-                        audio_url = f"{root}{STATIC_MOUNT}/{p.split('static/', 1)[1]}"
-                    else:
-                        audio_url = p  # último recurso (no recomendado)
-
-                await websocket.send_json({"type": "audio", "path": audio_url})
+                docs = data.get("docs") if isinstance(data.get("docs"), list) else None
+                if docs is not None:  # solo documentos adjuntos a esta sesión
+                    attached = set(tutor.session_docs.documents(session_id))
+                    docs = [d for d in docs if d in attached]
+                (response, usage), t = await run_blocking(llm_executor, tutor.generate, user_text, session_id, docs)
+                timings = {"llm_queue_ms": t["queue_ms"], "llm_ms": t["run_ms"], **usage}
+                reply_seq += 1
+
+                # 1) responder texto de inmediato
+                await websocket.send_json({"type": "text", "seq": reply_seq, "content": response, "timings": timings})
+
+                # 2) sintetizar en segundo plano y mandar URL de audio servible al terminar
+                # (MP3 directo si el cliente lo soporta; OGG solo si lo pide)
+                fmt = voice_processor.negotiate_format(data.get("formats"))
+                task = asyncio.create_task(push_audio(websocket, response, fmt, timings, reply_seq, last_push))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                last_push = task
 
             elif msg_type == "audio":
                 audio_path = data.get("path", "")
-                text = voice_processor.speech_to_text(audio_path)
-                response = tutor.generate_response(text)
-                await websocket.send_json({"type": "text", "content": response})
+                text, t_stt = await run_blocking(stt_executor, voice_processor.speech_to_text, audio_path)
+                (response, usage), t_llm = await run_blocking(llm_executor, tutor.generate, text, session_id)
+                reply_seq += 1
+                await websocket.send_json({
+                    "type": "text",
+                    "seq": reply_seq,
+                    "content": response,
+                    "timings": {
+                        "stt_queue_ms": t_stt["queue_ms"], "stt_ms": t_stt["run_ms"],
+                        "llm_queue_ms": t_llm["queue_ms"], "llm_ms": t_llm["run_ms"],
+                        **usage,
+                    },
+                })
 
             else:
                 # Ignorar tipos desconocidos
@@ -103,6 +309,12 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         print(f"[WS] error: {e}")
     finally:
+        for task in list(pending):
+            task.cancel()
+        _open_sessions[session_id] -= 1
+        if not _open_sessions[session_id]:
+            del _open_sessions[session_id]
+        asyncio.get_running_loop().call_later(RESUME_GRACE_SEC, release_session, session_id, epoch, time.time())
         try:
             await websocket.close()
         except Exception:
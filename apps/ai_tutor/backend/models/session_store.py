@@ -0,0 +1,96 @@
+# apps/ai_tutor/backend/models/session_store.py
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List
+
+
+class SessionHistory:
+    """Historial de una sesión como ring buffer: solo guarda los últimos `max_turns` mensajes."""
+
+    __slots__ = ("messages", "nbytes", "last_seen")
+
+    def __init__(self, max_turns: int):
+        self.messages: Deque[Dict[str, str]] = deque(maxlen=max_turns)
+        self.nbytes = 0
+        self.last_seen = time.monotonic()
+
+    def append(self, role: str, content: str, max_chars: int) -> int:
+        """Añade un mensaje y retorna el delta de bytes (negativo si se expulsó uno mayor)."""
+        content = (content or "")[:max_chars]
+        size = len(content.encode("utf-8"))
+        delta = size
+        if len(self.messages) == self.messages.maxlen:
+            delta -= len(self.messages[0]["content"].encode("utf-8"))
+        self.messages.append({"role": role, "content": content})
+        self.nbytes += delta
+        return delta
+
+
+class SessionStore:
+    """
+    Historiales por sesión (p.ej. una por conexión WebSocket), acotados en memoria:
+    - como mucho `max_sessions` sesiones (se expulsa la menos usada recientemente),
+    - cada sesión expira tras `ttl_sec` sin actividad,
+    - cada sesión guarda a lo sumo `max_turns` mensajes de hasta `max_chars` caracteres.
+    Thread-safe: generate_response corre en un pool de hilos.
+    """
+
+    def __init__(self, max_sessions: int = 500, ttl_sec: float = 1800, max_turns: int = 6, max_chars: int = 4000):
+        self.max_sessions = max_sessions
+        self.ttl_sec = ttl_sec
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self._sessions: "OrderedDict[str, SessionHistory]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float):
+        # OrderedDict está ordenado por último acceso: las expiradas quedan al frente
+        while self._sessions:
+            _, sess = next(iter(self._sessions.items()))
+            if now - sess.last_seen < self.ttl_sec and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= sess.nbytes
+
+    def _get(self, session_id: str, now: float) -> SessionHistory:
+        sess = self._sessions.get(session_id)
+        if sess is None:
+            sess = SessionHistory(self.max_turns)
+            self._sessions[session_id] = sess
+        else:
+            self._sessions.move_to_end(session_id)
+        sess.last_seen = now
+        return sess
+
+    def append(self, session_id: str, role: str, content: str):
+        with self._lock:
+            now = time.monotonic()
+            sess = self._get(session_id, now)
+            self._bytes += sess.append(role, content, self.max_chars)
+            self._purge(now)
+
+    def messages(self, session_id: str) -> List[Dict[str, str]]:
+        with self._lock:
+            now = time.monotonic()
+            sess = self._get(session_id, now)
+            self._purge(now)
+            return list(sess.messages)
+
+    def drop(self, session_id: str):
+        with self._lock:
+            sess = self._sessions.pop(session_id, None)
+            if sess is not None:
+                self._bytes -= sess.nbytes
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._purge(time.monotonic())
+            return {
+                "active_sessions": len(self._sessions),
+                "bytes_used": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_turns": self.max_turns,
+                "ttl_sec": int(self.ttl_sec),
+            }
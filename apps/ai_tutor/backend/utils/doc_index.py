@@ -0,0 +1,343 @@
+# doc_index.py — Índice de recuperación (BM25) sobre los documentos ingeridos del tutor
+# - Cada documento se parte en fragmentos de ~CHUNK_WORDS palabras (con solapamiento) por página.
+# - Un segmento por documento en data/index/<doc_id>/: postings en CSR (.npy) + texto de los fragmentos
+#   en un blob; al cargar todo se abre con mmap (np.load(mmap_mode="r")), sin copiar a memoria.
+# - search() calcula BM25 exacto sobre los documentos pedidos: df y largo promedio se suman entre
+#   segmentos al consultar, así agregar un documento no obliga a reconstruir los demás.
+# Se usa desde TutorAgent para enviar solo los top-k fragmentos al modelo (prompt de tamaño constante).
+# SessionDocs guarda qué documentos tiene adjuntos cada sesión en SQLite (data/index/sessions.db), así
+# /upload?sid=X y el WebSocket de X ven lo mismo aunque caigan en workers distintos.
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from apps.common.metrics import stage
+
+# ========= Configuración (por entorno) =========
+INDEX_DIR = Path(os.getenv("AI_TUTOR_INDEX_DIR", str(Path(__file__).resolve().parents[2] / "data" / "index")))
+CHUNK_WORDS = int(os.getenv("AI_TUTOR_CHUNK_WORDS", "180"))
+CHUNK_OVERLAP = int(os.getenv("AI_TUTOR_CHUNK_OVERLAP", "40"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_VERSION = 1
+
+_token_re = re.compile(r"\w+", re.UNICODE)
+_doc_id_re = re.compile(r"^[0-9a-f]{16}$")  # doc_id = sha256[:16] (viene del cliente: nunca rutas)
+STOPWORDS = frozenset(
+    "a al algo como con cual cuando de del el ella ellos en entre era es esa ese eso esta este esto fue ha hay "
+    "la las le les lo los mas me mi muy no nos o para pero por que se si sin sobre son su sus te tu un una uno "
+    "y ya the of and to in is for on that with as are by this be or".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Términos en minúsculas y sin acentos, sin stopwords ni tokens de un carácter."""
+    t = unicodedata.normalize("NFD", (text or "").lower())
+    t = "".join(ch for ch in t if unicodedata.category(ch) != "Mn")
+    return [w for w in _token_re.findall(t) if len(w) > 1 and w not in STOPWORDS]
+
+
+def chunk_pages(pages: List[str], words: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP):
+    """[(página 1-based, texto)] en ventanas de 'words' palabras con 'overlap' de solapamiento."""
+    step = max(1, words - overlap)
+    out = []
+    for pno, text in enumerate(pages, 1):
+        ws = (text or "").split()
+        for s in range(0, len(ws), step):
+            out.append((pno, " ".join(ws[s:s + words])))
+            if s + words >= len(ws):
+                break
+    return out
+
+
+class Segment:
+    """Índice de un documento, abierto con mmap."""
+
+    FILES = ("indptr", "chunk_ids", "tf", "chunk_len", "chunk_page", "text_offsets")
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(path / "vocab.json", "r", encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+        self.n_chunks = int(self.meta["n_chunks"])
+        self.total_len = int(self.meta["total_len"])
+        mmap_mode = "r" if self.n_chunks else None  # mmap no admite arrays vacíos
+        for name in self.FILES:
+            setattr(self, name, np.load(path / f"{name}.npy", mmap_mode=mmap_mode))
+        self.text = np.memmap(path / "chunks.txt", dtype=np.uint8, mode="r") if self.meta["text_bytes"] else b""
+
+    def df(self, term: str) -> int:
+        tid = self.vocab.get(term)
+        return 0 if tid is None else int(self.indptr[tid + 1] - self.indptr[tid])
+
+    def chunk_text(self, i: int) -> str:
+        s, e = int(self.text_offsets[i]), int(self.text_offsets[i + 1])
+        return bytes(self.text[s:e]).decode("utf-8")
+
+    def scores(self, terms: Dict[str, float], avgdl: float) -> np.ndarray:
+        """BM25 de cada fragmento dado {término: idf global}."""
+        out = np.zeros(self.n_chunks, dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * np.asarray(self.chunk_len, dtype=np.float32) / avgdl)
+        for term, idf in terms.items():
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            s, e = int(self.indptr[tid]), int(self.indptr[tid + 1])
+            ids = self.chunk_ids[s:e]
+            tf = np.asarray(self.tf[s:e], dtype=np.float32)
+            out[ids] += idf * tf * (BM25_K1 + 1) / (tf + norm[ids])
+        return out
+
+
+def build_segment(dst: Path, doc_id: str, name: str, pages: List[str]) -> dict:
+    """Escribe el segmento de un documento (en una carpeta temporal que luego se renombra)."""
+    chunks = chunk_pages(pages)
+    postings: Dict[str, List] = {}
+    lengths = []
+    for cid, (_, text) in enumerate(chunks):
+        terms = tokenize(text)
+        lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            postings.setdefault(term, []).append((cid, tf))
+
+    vocab = {term: i for i, term in enumerate(sorted(postings))}
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    for term, i in vocab.items():
+        indptr[i + 1] = len(postings[term])
+    np.cumsum(indptr, out=indptr)
+    chunk_ids = np.empty(int(indptr[-1]), dtype=np.int32)
+    tfs = np.empty(int(indptr[-1]), dtype=np.uint16)
+    for term, i in vocab.items():
+        plist = postings[term]
+        chunk_ids[indptr[i]:indptr[i + 1]] = [c for c, _ in plist]
+        tfs[indptr[i]:indptr[i + 1]] = [min(t, 65535) for _, t in plist]
+
+    blobs = [text.encode("utf-8") for _, text in chunks]
+    text_offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=text_offsets[1:])
+
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    arrays = {
+        "indptr": indptr,
+        "chunk_ids": chunk_ids,
+        "tf": tfs,
+        "chunk_len": np.asarray(lengths, dtype=np.int32),
+        "chunk_page": np.asarray([p for p, _ in chunks], dtype=np.int32),
+        "text_offsets": text_offsets,
+    }
+    for fname, arr in arrays.items():
+        np.save(tmp / f"{fname}.npy", arr)
+    with open(tmp / "chunks.txt", "wb") as f:
+        f.write(b"".join(blobs))
+    with open(tmp / "vocab.json", "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    meta = {
+        "version": INDEX_VERSION,
+        "doc_id": doc_id,
+        "name": name,
+        "pages": len(pages),
+        "n_chunks": len(chunks),
+        "total_len": int(sum(lengths)),
+        "terms": len(vocab),
+        "text_bytes": int(text_offsets[-1]),
+        "created": time.time(),
+    }
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    shutil.rmtree(dst, ignore_errors=True)
+    os.replace(tmp, dst)
+    return meta
+
+
+class DocIndex:
+    def __init__(self, root: Path = INDEX_DIR):
+        self.root = Path(root)
+        self._segments: Dict[str, Segment] = {}
+        self._lock = threading.Lock()
+
+    def _segment(self, doc_id: str):
+        seg = self._segments.get(doc_id)
+        if seg is not None:
+            return seg
+        if not _doc_id_re.match(str(doc_id)):
+            return None
+        path = self.root / doc_id
+        if not (path / "meta.json").is_file():
+            return None
+        try:
+            seg = Segment(path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Índice de {doc_id} ilegible: {e}")
+            return None
+        if seg.meta.get("version") != INDEX_VERSION:
+            return None
+        with self._lock:
+            self._segments[doc_id] = seg
+        return seg
+
+    def has(self, doc_id: str) -> bool:
+        return self._segment(doc_id) is not None
+
+    def add(self, entry: dict) -> dict:
+        """Indexa un documento de file_processor.ingest_file (no hace nada si ya está indexado)."""
+        doc_id = entry["doc_id"]
+        seg = self._segment(doc_id)
+        if seg is not None:
+            return {**seg.meta, "indexed": False}
+        t0 = time.perf_counter()
+        self.root.mkdir(parents=True, exist_ok=True)
+        with stage("ai_tutor", "index_build"):
+            meta = build_segment(self.root / doc_id, doc_id, entry.get("name") or doc_id, entry["pages"])
+        with self._lock:
+            self._segments.pop(doc_id, None)
+        return {**meta, "indexed": True, "build_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+    def documents(self) -> List[str]:
+        if not self.root.is_dir():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if not p.name.startswith(".") and (p / "meta.json").is_file())
+
+    def search(self, query: str, doc_ids=None, k: int = 4) -> List[dict]:
+        """Top-k fragmentos [{doc_id, name, page, score, text}] de los documentos pedidos (todos si None)."""
+        terms = set(tokenize(query))
+        if not terms or k <= 0:
+            return []
+        segs = [s for s in (self._segment(d) for d in (self.documents() if doc_ids is None else doc_ids)) if s]
+        n = sum(s.n_chunks for s in segs)
+        if not n:
+            return []
+        with stage("ai_tutor", "retrieval"):
+            avgdl = max(1.0, sum(s.total_len for s in segs) / n)
+            idf = {}
+            for term in terms:
+                df = sum(s.df(term) for s in segs)
+                if df:
+                    idf[term] = float(np.log(1 + (n - df + 0.5) / (df + 0.5)))
+            if not idf:
+                return []
+            hits = []
+            for seg in segs:
+                scores = seg.scores(idf, avgdl)
+                top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+                hits += [(float(scores[i]), seg, int(i)) for i in top if scores[i] > 0]
+            hits.sort(key=lambda h: -h[0])
+            return [{
+                "doc_id": seg.meta["doc_id"],
+                "name": seg.meta["name"],
+                "page": int(seg.chunk_page[i]),
+                "score": round(score, 3),
+                "text": seg.chunk_text(i),
+            } for score, seg, i in hits[:k]]
+
+    def stats(self) -> dict:
+        docs = self.documents()
+        metas = [s.meta for s in (self._segment(d) for d in docs) if s]
+        return {
+            "documents": len(metas),
+            "chunks": sum(m["n_chunks"] for m in metas),
+            "terms": sum(m["terms"] for m in metas),
+            "loaded_segments": len(self._segments),
+            "chunk_words": CHUNK_WORDS,
+            "chunk_overlap": CHUNK_OVERLAP,
+        }
+
+
+SESSION_DOCS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_docs (
+    session_id TEXT NOT NULL,
+    doc_id     TEXT NOT NULL,
+    attached   REAL NOT NULL,
+    last_seen  REAL NOT NULL,
+    PRIMARY KEY (session_id, doc_id)
+);
+CREATE INDEX IF NOT EXISTS idx_session_docs_last_seen ON session_docs (last_seen);
+"""
+
+
+class SessionDocs:
+    """
+    Sesión -> documentos adjuntos, compartido entre workers (SQLite en WAL, una conexión por hilo).
+    Cada sesión conserva los últimos max_docs adjuntados; los vínculos sin uso en ttl_sec expiran.
+    """
+
+    def __init__(self, db_path: Path = None, max_docs: int = 8, ttl_sec: float = None):
+        self.db_path = Path(db_path or INDEX_DIR / "sessions.db")
+        self.max_docs = max_docs
+        self.ttl_sec = float(ttl_sec if ttl_sec is not None else os.getenv("AI_TUTOR_SESSION_TTL_SEC", "1800"))
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.db_path), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SESSION_DOCS_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def attach(self, session_id: str, doc_id: str):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO session_docs VALUES (?, ?, ?, ?)", (session_id, doc_id, now, now))
+            conn.execute(
+                "DELETE FROM session_docs WHERE session_id = ? AND doc_id NOT IN "
+                "(SELECT doc_id FROM session_docs WHERE session_id = ? ORDER BY attached DESC LIMIT ?)",
+                (session_id, session_id, self.max_docs),
+            )
+            conn.execute("DELETE FROM session_docs WHERE last_seen < ?", (now - self.ttl_sec,))
+
+    def documents(self, session_id: str) -> List[str]:
+        """doc_ids adjuntos (el último adjuntado primero); consultarlos renueva su TTL."""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE session_docs SET last_seen = ? WHERE session_id = ? AND last_seen >= ?",
+                         (now, session_id, now - self.ttl_sec))
+            rows = conn.execute("SELECT doc_id FROM session_docs WHERE session_id = ? AND last_seen >= ? "
+                                "ORDER BY attached DESC", (session_id, now - self.ttl_sec)).fetchall()
+        return [r[0] for r in rows]
+
+    def touch(self, session_id: str):
+        """Renueva el TTL de los adjuntos (p.ej. al retomar la sesión en otro worker)."""
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE session_docs SET last_seen = ? WHERE session_id = ?", (time.time(), session_id))
+
+    def drop(self, session_id: str, idle_since: float = None):
+        """Borra los adjuntos; con idle_since, solo si nadie los usó desde ese instante (time.time())."""
+        conn = self._conn()
+        with conn:
+            if idle_since is None:
+                conn.execute("DELETE FROM session_docs WHERE session_id = ?", (session_id,))
+            else:
+                conn.execute("DELETE FROM session_docs WHERE session_id = ? AND last_seen < ?",
+                             (session_id, idle_since))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> DocIndex:
+    """Índice compartido del proceso (lo usan la ruta /upload y TutorAgent)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DocIndex()
+        return _index
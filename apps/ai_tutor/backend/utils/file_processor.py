@@ -1,32 +1,241 @@
+# file_processor.py — Ingesta de documentos del tutor (PDF, imágenes, texto)
+# - PDF: extracción por página en un pool de procesos (por bloques de páginas), entregada en orden
+#   como generador (iter_pdf_pages). OCR solo en páginas sin capa de texto (sus imágenes embebidas).
+# - Cache por hash del archivo (sha256): la segunda subida del mismo documento no re-extrae nada.
+# - Tesseract se busca en el PATH; TESSERACT_CMD permite indicar el ejecutable (p.ej. en Windows).
+import hashlib
+import io
+import json
+import multiprocessing as mp
 import os
-from PIL import Image
-import pytesseract
-pytesseract.pytesseract.tesseract_cmd = r"C:\Users\rcondet\AppData\Local\Programs\Tesseract-OCR\tesseract.exe"
-import PyPDF2
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from typing import Union
 
+from PIL import Image
+
+try:
+    import pytesseract
+except Exception:  # OCR opcional
+    pytesseract = None
+
+try:
+    import PyPDF2
+except Exception:
+    PyPDF2 = None
+
+from apps.common.metrics import stage
+
+if pytesseract is not None and os.getenv("TESSERACT_CMD"):
+    pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_CMD")
+
+# ========= Configuración (por entorno) =========
+# Base absoluta de la subapp (este archivo está en .../apps/ai_tutor/backend/utils/)
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+CACHE_DIR = Path(os.getenv("AI_TUTOR_INGEST_CACHE_DIR", str(DATA_DIR / "ingest_cache")))
+INGEST_WORKERS = int(os.getenv("AI_TUTOR_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+CHUNK_PAGES = int(os.getenv("AI_TUTOR_INGEST_CHUNK_PAGES", "8"))
+POOL_MIN_PAGES = int(os.getenv("AI_TUTOR_INGEST_POOL_MIN_PAGES", "16"))  # PDFs chicos: en el mismo proceso
+OCR_LANG = os.getenv("AI_TUTOR_OCR_LANG", "spa+eng")
+# spawn: el proceso del HUB tiene hilos (executors, janitors) y fork con hilos puede trabarse
+MP_START = os.getenv("AI_TUTOR_INGEST_MP_START", "spawn")
+EXTRACTOR_VERSION = 1  # subirlo invalida la cache cuando cambia la extracción
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+TEXT_EXTS = (".txt",)  # .docx es un zip: leerlo como texto solo produce basura
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=mp.get_context(MP_START))
+        return _pool
+
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _ocr_image(img) -> str:
+    if pytesseract is None:
+        return ""
+    try:
+        return pytesseract.image_to_string(img, lang=OCR_LANG)
+    except Exception as e:  # idioma no instalado, binario ausente...
+        try:
+            return pytesseract.image_to_string(img)
+        except Exception:
+            print(f"⚠️ OCR no disponible: {e}")
+            return ""
+
+
+def _ocr_page(page) -> str:
+    """OCR de las imágenes embebidas de una página escaneada (PyPDF2 no rasteriza la página)."""
+    parts = []
+    try:
+        images = page.images
+    except Exception:
+        return ""
+    for image in images:
+        try:
+            parts.append(_ocr_image(Image.open(io.BytesIO(image.data))))
+        except Exception:
+            continue
+    return "\n".join(p for p in parts if p.strip())
+
+
+# Por proceso del pool: último PDF abierto, para no re-parsear el xref en cada bloque
+_worker_reader = (None, None)
+
+
+def _open_reader(path: str):
+    global _worker_reader
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if _worker_reader[0] != key:
+        _worker_reader = (key, PyPDF2.PdfReader(path))
+    return _worker_reader[1]
+
+
+def _extract_range(path: str, start: int, stop: int, ocr: bool = True) -> list:
+    """Extrae las páginas [start, stop). Corre dentro del pool (o en el proceso actual si el PDF es chico)."""
+    reader = _open_reader(path)
+    out = []
+    for i in range(start, stop):
+        page = reader.pages[i]
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        used_ocr = False
+        if not text.strip() and ocr:
+            text = _ocr_page(page)
+            used_ocr = bool(text.strip())
+        out.append({"page": i + 1, "text": text, "ocr": used_ocr})
+    return out
+
+
+def pdf_page_count(path) -> int:
+    return len(PyPDF2.PdfReader(str(path)).pages)
+
+
+def iter_pdf_pages(path, workers: int = None, chunk_pages: int = CHUNK_PAGES, ocr: bool = True):
+    """
+    Generador de páginas {"page", "text", "ocr"} en orden. Los bloques de 'chunk_pages' se extraen en
+    paralelo en el pool de procesos; cada bloque se entrega apenas está listo y le toca su turno.
+    workers=1 (o PDFs de menos de POOL_MIN_PAGES páginas) extrae en el proceso actual.
+    """
+    if PyPDF2 is None:
+        raise RuntimeError("PyPDF2 no está instalado")
+    path = str(Path(path).resolve())
+    n = pdf_page_count(path)
+    ranges = [(s, min(s + chunk_pages, n)) for s in range(0, n, max(1, chunk_pages))]
+    workers = INGEST_WORKERS if workers is None else workers
+    if workers <= 1 or n < POOL_MIN_PAGES:
+        for s, e in ranges:
+            yield from _extract_range(path, s, e, ocr)
+        return
+    pool = _get_pool()
+    futures = [pool.submit(_extract_range, path, s, e, ocr) for s, e in ranges]
+    try:
+        for fut in futures:
+            yield from fut.result()
+    finally:
+        for fut in futures:  # si el consumidor corta antes, no dejar trabajo encolado
+            fut.cancel()
+
+
+# ───────────────────────── Cache por hash ─────────────────────────
+def _cache_path(sha: str) -> Path:
+    return CACHE_DIR / f"{sha}.json"
+
+
+def load_cached(sha: str):
+    try:
+        with open(_cache_path(sha), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return entry if entry.get("version") == EXTRACTOR_VERSION else None
+
+
+def _save_cached(entry: dict):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    dst = _cache_path(entry["sha256"])
+    tmp = dst.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp, dst)  # atómico: nunca se lee un JSON a medias
+
+
+def ingest_file(file_path, name: str = None, use_cache: bool = True, workers: int = None) -> dict:
+    """
+    Extrae el texto de un documento y lo guarda en cache por sha256.
+    Retorna {doc_id, sha256, name, type, pages: [..], ocr_pages, chars, cached, seconds, pages_per_sec}.
+    """
+    file_path = Path(file_path)
+    ext = file_path.suffix.lower()
+    t0 = time.perf_counter()
+    sha = file_sha256(file_path)
+    if use_cache:
+        entry = load_cached(sha)
+        if entry is not None:
+            entry.update(cached=True, seconds=round(time.perf_counter() - t0, 4))
+            return entry
+
+    with stage("ai_tutor", "ingest"):
+        if ext == ".pdf":
+            pages = list(iter_pdf_pages(file_path, workers=workers))
+            kind = "pdf"
+        elif ext in IMAGE_EXTS:
+            with Image.open(file_path) as img:
+                text = _ocr_image(img)
+            pages = [{"page": 1, "text": text, "ocr": True}]
+            kind = "image"
+        elif ext in TEXT_EXTS:
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                pages = [{"page": 1, "text": f.read(), "ocr": False}]
+            kind = "text"
+        else:
+            raise ValueError(f"Formato no soportado: {ext or '(sin extensión)'}")
+
+    seconds = time.perf_counter() - t0
+    entry = {
+        "version": EXTRACTOR_VERSION,
+        "doc_id": sha[:16],
+        "sha256": sha,
+        "name": name or file_path.name,
+        "type": kind,
+        "pages": [p["text"] for p in pages],
+        "ocr_pages": [p["page"] for p in pages if p["ocr"]],
+        "chars": sum(len(p["text"]) for p in pages),
+        "created": time.time(),
+    }
+    _save_cached(entry)
+    entry.update(cached=False, seconds=round(seconds, 4),
+                 pages_per_sec=round(len(pages) / seconds, 1) if seconds > 0 else None)
+    return entry
+
+
 def process_uploaded_file(file_path: str) -> Union[str, dict]:
     file_ext = os.path.splitext(file_path)[1].lower()
-    
+
     try:
-        if file_ext in ['.jpg', '.jpeg', '.png']:
-            # Procesamiento de imágenes
-            text = pytesseract.image_to_string(Image.open(file_path))
-            return {"type": "image", "text": text}
-        
-        elif file_ext == '.pdf':
-            # Procesamiento de PDF
-            text = ""
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    text += page.extract_text()
-            return {"type": "pdf", "text": text}
-        
-        elif file_ext in ['.txt', '.docx']:
-            # Procesamiento de texto
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return {"type": "text", "content": file.read()}
-    
+        entry = ingest_file(file_path)
+        text = "\n".join(entry["pages"])
+        if file_ext in TEXT_EXTS:
+            return {"type": "text", "content": text}
+        return {"type": entry["type"], "text": text, "pages": len(entry["pages"]), "doc_id": entry["doc_id"]}
+
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
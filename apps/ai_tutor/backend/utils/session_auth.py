@@ -0,0 +1,69 @@
+# session_auth.py — Identificadores de sesión del tutor emitidos y firmados por el servidor
+# El WebSocket genera el sid y se lo entrega al cliente como "<sid>.<firma>" (HMAC-SHA256); solo un
+# token con firma válida permite retomar la sesión al reconectar o adjuntarle documentos (/upload).
+# Secreto: AI_TUTOR_SESSION_SECRET; si no está, se crea una vez en data/session_secret (compartido por
+# los workers del mismo host). Con varios hosts detrás de un balanceador debe fijarse por entorno.
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+SECRET_FILE = Path(__file__).resolve().parents[2] / "data" / "session_secret"
+
+_secret = None
+_secret_lock = threading.Lock()
+
+
+def _load_secret() -> bytes:
+    global _secret
+    with _secret_lock:
+        if _secret is not None:
+            return _secret
+        env = os.getenv("AI_TUTOR_SESSION_SECRET")
+        if env:
+            _secret = env.encode("utf-8")
+            return _secret
+        SECRET_FILE.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # O_EXCL: si dos workers arrancan a la vez, solo uno escribe y el otro lee el suyo
+            fd = os.open(SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+        value = ""
+        for _ in range(50):  # el otro worker puede estar terminando de escribirlo
+            value = SECRET_FILE.read_text().strip()
+            if value:
+                break
+            time.sleep(0.02)
+        if not value:
+            raise RuntimeError(f"Secreto de sesión vacío en {SECRET_FILE}")
+        _secret = value.encode("utf-8")
+        return _secret
+
+
+def _signature(sid: str) -> str:
+    return hmac.new(_load_secret(), sid.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def new_session() -> str:
+    return uuid.uuid4().hex
+
+
+def sign(sid: str) -> str:
+    """Token que recibe el cliente para la sesión 'sid'."""
+    return f"{sid}.{_signature(sid)}"
+
+
+def verify(token: str) -> Optional[str]:
+    """sid del token si la firma es válida; None si falta, está malformado o fue alterado."""
+    sid, _, sig = (token or "").strip().partition(".")
+    if not sid or not sig or len(sid) > 64:
+        return None
+    return sid if hmac.compare_digest(sig, _signature(sid)) else None
@@ -1,10 +1,18 @@
 import speech_recognition as sr
 from gtts import gTTS
 import os
+import time
 import uuid
+import hashlib
+import threading
 from pydub import AudioSegment
 from pathlib import Path
 
+from apps.common.metrics import stage
+
+# Formatos que sabemos servir, en orden de preferencia (MP3 sale directo de gTTS, sin transcodificar)
+AUDIO_FORMATS = ("mp3", "ogg")
+
 class VoiceProcessor:
     def __init__(self):
         self.recognizer = sr.Recognizer()
@@ -17,6 +25,12 @@ class VoiceProcessor:
         self.audio_dir = self._base / "static" / "audio"
         self.audio_dir.mkdir(parents=True, exist_ok=True)
 
+        # Presupuesto de disco para static/audio (lo aplica el janitor)
+        self.max_bytes = int(float(os.getenv("AI_TUTOR_AUDIO_MAX_MB", "200")) * 1024 * 1024)
+        self.max_age_sec = float(os.getenv("AI_TUTOR_AUDIO_MAX_AGE_H", "72")) * 3600
+        self.janitor_interval_sec = float(os.getenv("AI_TUTOR_AUDIO_JANITOR_SEC", "600"))
+        self._janitor = None
+
     def _resolve_path(self, p: str) -> Path:
         """Resuelve rutas tipo '/static/...' o 'static/...' a la ubicación real en disco."""
         pth = Path(p)
@@ -31,32 +45,122 @@ class VoiceProcessor:
     def speech_to_text(self, audio_path: str) -> str:
         try:
             src = self._resolve_path(audio_path)
-            with sr.AudioFile(str(src)) as source:
+            with stage("ai_tutor", "stt"), sr.AudioFile(str(src)) as source:
                 audio = self.recognizer.record(source)
                 return self.recognizer.recognize_google(audio, language='es-ES')
         except Exception as e:
             print(f"Error en speech_to_text: {e}")
             return ""
 
-    def text_to_speech(self, text: str) -> str:
+    @staticmethod
+    def negotiate_format(accepted=None) -> str:
+        """Elige el formato de audio: el primero de AUDIO_FORMATS que el cliente declare soportar (MP3 por defecto)."""
+        if not accepted:
+            return AUDIO_FORMATS[0]
+        accepted = {str(f).lower() for f in accepted}
+        for fmt in AUDIO_FORMATS:
+            if fmt in accepted:
+                return fmt
+        return AUDIO_FORMATS[0]
+
+    @staticmethod
+    def cache_key(text: str, lang: str, fmt: str) -> str:
+        """Clave de contenido: misma respuesta + idioma + formato => mismo archivo."""
+        return hashlib.sha256(f"{lang}\x00{fmt}\x00{text}".encode("utf-8")).hexdigest()[:32]
+
+    def text_to_speech(self, text: str, fmt: str = "mp3", lang: str = "es") -> str:
         try:
-            # Generar nombre único para el archivo MP3
-            mp3_path = self.audio_dir / f"response_{uuid.uuid4()}.mp3"
+            fmt = fmt if fmt in AUDIO_FORMATS else AUDIO_FORMATS[0]
+            out_path = self.audio_dir / f"tts_{self.cache_key(text, lang, fmt)}.{fmt}"
 
-            # Convertir texto a voz (es-ES -> 'es' para gTTS)
-            tts = gTTS(text=text, lang='es', slow=False)
-            tts.save(str(mp3_path))
+            # Cache hit: refrescar mtime (el janitor expulsa por antigüedad de uso) y reutilizar
+            if out_path.exists():
+                try:
+                    os.utime(out_path)
+                except OSError:
+                    pass
+                return f"/static/audio/{out_path.name}"
 
-            # Intentar convertir a OGG (si ffmpeg no está, devolvemos MP3)
+            # Escritura a temporal + rename atómico (peticiones concurrentes del mismo texto no se pisan)
+            tmp_mp3 = self.audio_dir / f".tmp_{uuid.uuid4().hex}.mp3"
             try:
-                ogg_path = mp3_path.with_suffix('.ogg')
-                sound = AudioSegment.from_mp3(str(mp3_path))
-                sound.export(str(ogg_path), format='ogg')
-                return f"/static/audio/{ogg_path.name}"
-            except Exception as conv_err:
-                print(f"Aviso: no se pudo convertir a OGG ({conv_err}). Se usará MP3.")
-                return f"/static/audio/{mp3_path.name}"
+                # Convertir texto a voz (es-ES -> 'es' para gTTS)
+                with stage("ai_tutor", "tts"):
+                    tts = gTTS(text=text, lang=lang, slow=False)
+                    tts.save(str(tmp_mp3))
+
+                if fmt == "mp3":
+                    os.replace(tmp_mp3, out_path)
+                    return f"/static/audio/{out_path.name}"
+
+                # Solo clientes sin MP3 pagan la transcodificación (si ffmpeg no está, devolvemos MP3)
+                try:
+                    tmp_ogg = tmp_mp3.with_suffix(".ogg")
+                    AudioSegment.from_mp3(str(tmp_mp3)).export(str(tmp_ogg), format="ogg")
+                    os.replace(tmp_ogg, out_path)
+                    return f"/static/audio/{out_path.name}"
+                except Exception as conv_err:
+                    print(f"Aviso: no se pudo convertir a OGG ({conv_err}). Se usará MP3.")
+                    mp3_path = self.audio_dir / f"tts_{self.cache_key(text, lang, 'mp3')}.mp3"
+                    os.replace(tmp_mp3, mp3_path)
+                    return f"/static/audio/{mp3_path.name}"
+            finally:
+                for tmp in (tmp_mp3, tmp_mp3.with_suffix(".ogg")):
+                    try:
+                        tmp.unlink(missing_ok=True)
+                    except OSError:
+                        pass
 
         except Exception as e:
             print(f"Error en text_to_speech: {e}")
             return ""
+
+    # ────────────── Janitor de static/audio ──────────────
+    def cleanup_audio(self) -> dict:
+        """
+        Aplica el presupuesto de static/audio: borra archivos más viejos que max_age_sec
+        y, si aún se excede max_bytes, los de uso más antiguo hasta entrar en el presupuesto.
+        """
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.audio_dir):
+            if not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+
+        removed, freed = 0, 0
+        total = sum(f[1] for f in files)
+        for mtime, size, path in sorted(files):
+            # Temporales de escrituras en curso: solo si llevan mucho tiempo huérfanos
+            if os.path.basename(path).startswith(".tmp_") and now - mtime < 3600:
+                continue
+            if now - mtime <= self.max_age_sec and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                freed += size
+                total -= size
+            except OSError:
+                pass
+        return {"removed": removed, "freed_bytes": freed, "total_bytes": total}
+
+    def start_janitor(self):
+        """Lanza (una sola vez) el hilo de limpieza periódica en segundo plano."""
+        if self._janitor is not None:
+            return
+
+        def _loop():
+            while True:
+                try:
+                    self.cleanup_audio()
+                except Exception as e:
+                    print(f"Aviso: janitor de audio falló: {e}")
+                time.sleep(self.janitor_interval_sec)
+
+        self._janitor = threading.Thread(target=_loop, name="tutor-audio-janitor", daemon=True)
+        self._janitor.start()
@@ -58,8 +58,17 @@ class ChatInterface {
   setupEventListeners() {
     const sendBtn   = document.getElementById("send-btn");
     const userInput = document.getElementById("user-input");
+    const attachBtn = document.getElementById("attach-btn");
+    const docInput  = document.getElementById("doc-input");
 
     if (sendBtn) sendBtn.addEventListener("click", () => this.sendTextMessage());
+    if (attachBtn && docInput) {
+      attachBtn.addEventListener("click", () => docInput.click());
+      docInput.addEventListener("change", () => {
+        if (docInput.files && docInput.files[0]) this.uploadDocument(docInput.files[0]);
+        docInput.value = "";
+      });
+    }
     if (userInput) {
       userInput.addEventListener("keypress", (e) => {
         if (e.key === "Enter") this.sendTextMessage();
@@ -77,7 +86,7 @@ class ChatInterface {
     // Mostrar mensaje del usuario en la UI
     this.displayMessage(message, "user");
 
-    const payload = JSON.stringify({ type: "text", content: message });
+    const payload = JSON.stringify({ type: "text", content: message, formats: this.audioFormats() });
 
     // Enviar por WS si está abierto; si no, encolar y mostrar estado
     if (this.socket && this.socket.readyState === WebSocket.OPEN) {
@@ -91,6 +100,40 @@ class ChatInterface {
     input.value = "";
   }
 
+  // Sube un documento y lo adjunta a la sesión del chat (token que el servidor manda al conectar)
+  async uploadDocument(file) {
+    const sid = window.__AI_TUTOR_SID__;
+    if (!sid) {
+      this.displayMessage("⚠️ Aún no hay sesión con el servidor; intenta en unos segundos.", "ai");
+      return;
+    }
+    const setStatus = (t) => {
+      const el = document.getElementById("status-text");
+      if (el) el.textContent = t;
+    };
+    setStatus(`Procesando ${file.name}…`);
+
+    const fd = new FormData();
+    fd.append("file", file, file.name);
+    try {
+      const r = await fetch(`${this.BASE_PATH}/upload?sid=${encodeURIComponent(sid)}`, { method: "POST", body: fd });
+      const data = await r.json().catch(() => ({}));
+      if (!r.ok) throw new Error(data.detail || `HTTP ${r.status}`);
+      this.displayMessage(`📎 ${data.name} adjuntado (${data.pages} pág.). Puedes preguntar sobre su contenido.`, "ai");
+      setStatus("Listo");
+    } catch (e) {
+      this.displayMessage(`⚠️ No se pudo adjuntar ${file.name}: ${e.message}`, "ai");
+      setStatus("Listo");
+    }
+  }
+
+  // Formatos de audio que este navegador reproduce (el servidor prefiere MP3, sin transcodificar)
+  audioFormats() {
+    const a = document.createElement("audio");
+    const types = { mp3: "audio/mpeg", ogg: 'audio/ogg; codecs="vorbis"' };
+    return Object.keys(types).filter((f) => a.canPlayType && a.canPlayType(types[f]) !== "");
+  }
+
   displayMessage(text, sender) {
     const chatDisplay = document.getElementById("chat-display");
     if (!chatDisplay) return;
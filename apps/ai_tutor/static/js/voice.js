@@ -35,6 +35,7 @@ class VoiceAssistant {
 
     // Control de audio/TTS para evitar voces dobles
     this.currentAudio      = null;     // <audio> en reproducción
+    this.lastAudioSeq      = 0;        // "seq" de la última respuesta con audio reproducido
     this.ttsFallbackTimer  = null;     // timer para TTS de respaldo
 
     this.setupRecognition();
@@ -132,6 +133,12 @@ class VoiceAssistant {
         try {
           const data = JSON.parse(event.data);
 
+          // Sesión emitida por el servidor: el token firmado permite retomarla al reconectar
+          if (data.type === "session") {
+            window.__AI_TUTOR_SID__ = data.sid;
+            return;
+          }
+
           if (data.type === "text") {
             this.displayMessage(data.content, "ai");
 
@@ -145,6 +152,11 @@ class VoiceAssistant {
           }
 
           else if (data.type === "audio") {
+            // Audio de una respuesta anterior a la que ya sonó: descartar
+            if (data.seq != null) {
+              if (data.seq < this.lastAudioSeq) return;
+              this.lastAudioSeq = data.seq;
+            }
             // Llega audio servidor → cancelar cualquier TTS y reproducir SOLO audio
             clearTimeout(this.ttsFallbackTimer);
             this.cancelTTS();
@@ -181,8 +193,10 @@ class VoiceAssistant {
           this.socket = window.__AI_TUTOR_WS__;
           return;
         }
-        window.__AI_TUTOR_WS__ = new WebSocket(WS_URL);
+        const sid = window.__AI_TUTOR_SID__;
+        window.__AI_TUTOR_WS__ = new WebSocket(sid ? `${WS_URL}?sid=${encodeURIComponent(sid)}` : WS_URL);
         this.socket = window.__AI_TUTOR_WS__;
+        this.lastAudioSeq = 0;  // "seq" reinicia con cada conexión
         this.bindSocketLifecycle(WS_URL);
       } catch (e) {
         console.error("Reconexión WS falló:", e);
@@ -249,7 +263,7 @@ class VoiceAssistant {
 
     this.displayMessage(text, "user");
 
-    const payload = JSON.stringify({ type: "text", content: text });
+    const payload = JSON.stringify({ type: "text", content: text, formats: this.audioFormats() });
     if (this.socket && this.socket.readyState === WebSocket.OPEN) {
       this.socket.send(payload);
     } else {
@@ -258,6 +272,13 @@ class VoiceAssistant {
     }
   }
 
+  // Formatos de audio que este navegador reproduce (el servidor prefiere MP3, sin transcodificar)
+  audioFormats() {
+    const a = document.createElement("audio");
+    const types = { mp3: "audio/mpeg", ogg: 'audio/ogg; codecs="vorbis"' };
+    return Object.keys(types).filter((f) => a.canPlayType && a.canPlayType(types[f]) !== "");
+  }
+
   displayMessage(text, sender) {
     const chatDisplay = document.getElementById("chat-display");
     if (!chatDisplay) return;
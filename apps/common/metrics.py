@@ -0,0 +1,195 @@
+# apps/common/metrics.py — Métricas estilo Prometheus (conteos, histogramas) y timers por etapa
+# - Requests: HTTP por sub-app/ruta/método/estado (middleware ASGI del HUB + hooks de Flask).
+# - Etapas internas: with stage("ai_detect", "inference"): ...  (decode, inference, postprocess,
+#   annotation, imwrite, json_dump, openai_chat, tts, stt...).
+# - GET /metrics en el HUB expone todo en formato texto de Prometheus (un registro por worker).
+# METRICS_ENABLED=0 lo convierte en no-ops (stage() retorna un contexto nulo compartido).
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "no")
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_NULL = nullcontext()
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1.0):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_fmt_labels(self.labels, k)} {v:g}" for k, v in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, doc, labels=(), buckets=BUCKETS):
+        self.name, self.doc, self.labels, self.buckets = name, doc, tuple(labels), tuple(buckets)
+        self._values = {}  # labels -> [counts por bucket (no acumulados), suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        if not ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(label_values)
+            if v is None:
+                v = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            v[0][i] += 1
+            v[1] += value
+            v[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, ([*c], s, n)) for k, (c, s, n) in self._values.items())
+        for k, (counts, total, n) in items:
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le_label = 'le="+Inf"' if le == float("inf") else f'le="{le:g}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, le_label)} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {total:.6f}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {n}")
+        return lines
+
+
+REQUESTS = Counter("hub_requests_total", "Requests HTTP por sub-app, ruta, método y estado",
+                   ("app", "route", "method", "status"))
+REQUEST_SECONDS = Histogram("hub_request_duration_seconds", "Latencia de requests HTTP (s)", ("app", "route", "method"))
+STAGE_SECONDS = Histogram("hub_stage_duration_seconds", "Duración de etapas internas (s)", ("app", "stage"))
+STAGE_ERRORS = Counter("hub_stage_errors_total", "Etapas internas que terminaron con excepción", ("app", "stage"))
+_REGISTRY = [REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, STAGE_ERRORS]
+
+
+def counter(name, doc, labels=()) -> Counter:
+    """Crea un Counter y lo publica en /metrics (p.ej. los de apps/common/openai_client.py)."""
+    metric = Counter(name, doc, labels)
+    _REGISTRY.append(metric)
+    return metric
+
+
+def observe_request(app: str, route: str, method: str, status: int, seconds: float):
+    REQUESTS.inc(app, route, method, str(status))
+    REQUEST_SECONDS.observe(seconds, app, route, method)
+
+
+def observe_stage(app: str, name: str, seconds: float, error: bool = False):
+    """Registra una etapa medida a mano (p.ej. tiempo acumulado de un generador sin el del consumidor)."""
+    if not ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, app, name)
+    if error:
+        STAGE_ERRORS.inc(app, name)
+
+
+class _Stage:
+    __slots__ = ("app", "name", "t0")
+
+    def __init__(self, app, name):
+        self.app, self.name = app, name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_stage(self.app, self.name, time.perf_counter() - self.t0, exc_type is not None)
+        return False
+
+
+def stage(app: str, name: str):
+    """Context manager que mide una etapa interna; no-op compartido si las métricas están desactivadas."""
+    return _Stage(app, name) if ENABLED else _NULL
+
+
+def render() -> str:
+    """Todas las métricas en formato de exposición de texto de Prometheus."""
+    lines = []
+    for metric in _REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# ───────────────────────── Integraciones ─────────────────────────
+class MetricsMiddleware:
+    """
+    Middleware ASGI del HUB. Etiqueta la sub-app por prefijo de montaje y la ruta por el endpoint que
+    resolvió Starlette (sin ids en la etiqueta). Las sub-apps Flask (WSGI) se miden con instrument_flask.
+    """
+
+    def __init__(self, app, mounts):
+        self.app = app
+        self.mounts = sorted(mounts.items(), key=lambda kv: -len(kv[0]))  # prefijo más largo primero
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        sub = next((name for prefix, (name, wsgi) in self.mounts if path == prefix or path.startswith(prefix + "/")), "hub")
+        if any(name == sub and wsgi for _, (name, wsgi) in self.mounts):
+            await self.app(scope, receive, send)  # Flask registra sus propias métricas
+            return
+
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            endpoint = scope.get("endpoint")
+            if endpoint is None:
+                route = "unmatched"
+            else:  # función de la ruta, o la app montada (p.ej. StaticFiles)
+                route = getattr(endpoint, "__name__", None) or type(endpoint).__name__
+            observe_request(sub, route, scope.get("method", ""), status[0], time.perf_counter() - t0)
+
+
+def instrument_flask(flask_app, app_name: str):
+    """Registra conteo y latencia por regla de URL (p.ej. '/inspect/<filename>') en una app Flask."""
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @flask_app.before_request
+    def _metrics_start():
+        g._metrics_t0 = time.perf_counter()
+
+    @flask_app.after_request
+    def _metrics_end(response):
+        t0 = getattr(g, "_metrics_t0", None)
+        if t0 is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            observe_request(app_name, rule, request.method, response.status_code, time.perf_counter() - t0)
+        return response
@@ -0,0 +1,298 @@
+# apps/common/openai_client.py — Cliente OpenAI compartido por las sub-apps (pool, timeouts, reintentos)
+# Un solo cliente por proceso (keep-alive reutilizado entre ai_detect, ai_detectV2 y el tutor) y un
+# wrapper call() que aplica, por endpoint/modelo:
+#   - timeout propio (chat / tts / stt)
+#   - reintentos con backoff exponencial + jitter, acotados por un presupuesto de reintentos
+#   - circuit breaker por modelo (tras N fallos seguidos se corta rápido durante un cooldown)
+# y transcribe(..., hedge=True) para chunks de STT: si la primera petición tarda más que el p95 reciente,
+# se lanza una segunda idéntica y gana la primera que responda.
+#   OPENAI_API_KEY / OPENAI_BASE_URL          credenciales y endpoint (vacío = api.openai.com)
+#   OPENAI_MAX_CONNECTIONS (20) / OPENAI_MAX_KEEPALIVE (10) / OPENAI_KEEPALIVE_EXPIRY (30 s)
+#   OPENAI_TIMEOUT_CHAT (30) / OPENAI_TIMEOUT_TTS (20) / OPENAI_TIMEOUT_STT (15) / OPENAI_CONNECT_TIMEOUT (5)
+#   OPENAI_RETRIES (2)        reintentos por llamada;   OPENAI_RETRY_BUDGET (0.2) reintentos por request
+#   OPENAI_BREAKER_FAILURES (5) / OPENAI_BREAKER_COOLDOWN (30 s)
+#   OPENAI_STT_HEDGE_MS       "auto" (p95 reciente) | N ms | 0 (sin hedging)
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from apps.common import metrics
+
+try:
+    import openai
+    from openai import OpenAI
+    from httpx import Limits  # dependencia del SDK; API pública (no openai._constants)
+except ImportError:  # openai<1.0 (legacy): sin cliente compartido
+    openai = None
+    OpenAI = None
+
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+TIMEOUTS = {
+    "chat": float(os.getenv("OPENAI_TIMEOUT_CHAT", "30")),
+    "tts": float(os.getenv("OPENAI_TIMEOUT_TTS", "20")),
+    "stt": float(os.getenv("OPENAI_TIMEOUT_STT", "15")),
+}
+RETRIES = int(os.getenv("OPENAI_RETRIES", "2"))
+RETRY_BUDGET = float(os.getenv("OPENAI_RETRY_BUDGET", "0.2"))
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 4.0
+BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", "30"))
+STT_HEDGE_MS = os.getenv("OPENAI_STT_HEDGE_MS", "auto").strip().lower()
+
+REQUESTS = metrics.counter("openai_requests_total", "Llamadas a OpenAI por endpoint, modelo y resultado",
+                           ("endpoint", "model", "outcome"))
+RETRIES_TOTAL = metrics.counter("openai_retries_total", "Reintentos a OpenAI por motivo", ("endpoint", "model", "reason"))
+TIMEOUTS_TOTAL = metrics.counter("openai_timeouts_total", "Intentos a OpenAI que vencieron el timeout",
+                                 ("endpoint", "model"))
+BUDGET_EXHAUSTED = metrics.counter("openai_retry_budget_exhausted_total",
+                                   "Reintentos descartados por agotar el presupuesto", ("endpoint",))
+BREAKER_TRANSITIONS = metrics.counter("openai_circuit_transitions_total", "Cambios de estado del circuit breaker",
+                                      ("model", "state"))
+HEDGES = metrics.counter("openai_hedges_total", "Peticiones de STT duplicadas (hedging) y quién ganó",
+                         ("endpoint", "winner"))
+
+
+class CircuitOpenError(RuntimeError):
+    """El breaker del modelo está abierto: no se llama a la API hasta que pase el cooldown."""
+
+
+# ───────────────────────── Cliente compartido ─────────────────────────
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Cliente OpenAI del proceso (None si no hay OPENAI_API_KEY o la lib es legacy)."""
+    global _client
+    api_key = os.getenv("OPENAI_API_KEY", "")  # se lee al crear: las sub-apps cargan .env antes de usarlo
+    if _client is None and OpenAI is not None and api_key:
+        with _client_lock:
+            if _client is None:
+                http_client = openai.DefaultHttpxClient(
+                    limits=Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                                  keepalive_expiry=KEEPALIVE_EXPIRY),
+                    timeout=openai.Timeout(TIMEOUTS["chat"], connect=CONNECT_TIMEOUT),
+                )
+                # Los reintentos los hace call() (con presupuesto y breaker), no el SDK
+                _client = OpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL") or None,
+                                 http_client=http_client, max_retries=0)
+    return _client
+
+
+# ───────────────────────── Presupuesto de reintentos ─────────────────────────
+class RetryBudget:
+    """Cada request deposita 'ratio' fichas (hasta 'cap'); cada reintento gasta una."""
+
+    def __init__(self, ratio: float, cap: float = 10.0):
+        self.ratio, self.cap = ratio, cap
+        self.tokens = cap
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+# ───────────────────────── Circuit breaker ─────────────────────────
+class CircuitBreaker:
+    """closed → open (tras 'failures' fallos seguidos) → half_open (una prueba tras 'cooldown') → closed/open."""
+
+    def __init__(self, name: str, failures: int, cooldown: float):
+        self.name, self.failures, self.cooldown = name, failures, cooldown
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def _set(self, state):
+        if state != self.state:
+            self.state = state
+            BREAKER_TRANSITIONS.inc(self.name, state)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self._set("half_open")
+                self._probe = False
+            if self.state == "half_open" and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.cooldown
+
+    def record(self, ok: bool):
+        with self._lock:
+            if ok:
+                self.consecutive = 0
+                self._set("closed")
+                return
+            self.consecutive += 1
+            if self.state == "half_open" or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+                self._set("open")
+
+
+_budgets = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def _budget(endpoint):
+    with _registry_lock:
+        return _budgets.setdefault(endpoint, RetryBudget(RETRY_BUDGET))
+
+
+def breaker(model):
+    with _registry_lock:
+        return _breakers.setdefault(model, CircuitBreaker(model, BREAKER_FAILURES, BREAKER_COOLDOWN))
+
+
+def _retry_reason(exc):
+    """Motivo reintentable ('timeout', 'connection', '429', '5xx') o None si el error es definitivo."""
+    if openai is None:
+        return None
+    if isinstance(exc, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(exc, openai.APIConnectionError):
+        return "connection"
+    if isinstance(exc, openai.APIStatusError):
+        status = getattr(exc, "status_code", 0) or 0
+        if status == 429:
+            return "429"
+        if status >= 500 or status == 408:
+            return "5xx"
+    return None
+
+
+def _backoff(attempt, exc):
+    """Full jitter sobre un exponencial acotado; respeta retry-after si el proveedor lo envía."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    response = getattr(exc, "response", None)
+    try:
+        retry_after = float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        retry_after = None
+    return min(BACKOFF_CAP, max(delay, retry_after or 0.0))
+
+
+def call(endpoint: str, model: str, fn, /, *args, **kwargs):
+    """
+    fn(*args, **kwargs) con el timeout de 'endpoint', reintentos y breaker de 'model'.
+    Ejemplo: call("chat", m, client.chat.completions.create, model=m, messages=msgs)
+    """
+    kwargs.setdefault("timeout", openai.Timeout(TIMEOUTS.get(endpoint, TIMEOUTS["chat"]), connect=CONNECT_TIMEOUT))
+    cb, budget = breaker(model), _budget(endpoint)
+    budget.deposit()
+    attempt = 0
+    while True:
+        if not cb.allow():
+            REQUESTS.inc(endpoint, model, "circuit_open")
+            raise CircuitOpenError(f"Circuito abierto para {model}; reintentar en {BREAKER_COOLDOWN:.0f}s")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            reason = _retry_reason(e)
+            if reason == "timeout":
+                TIMEOUTS_TOTAL.inc(endpoint, model)
+            cb.record(reason is None)  # un 4xx definitivo prueba que el proveedor responde; no abre el circuito
+            if reason is None or attempt >= RETRIES:
+                REQUESTS.inc(endpoint, model, "error")
+                raise
+            if not budget.withdraw():
+                BUDGET_EXHAUSTED.inc(endpoint)
+                REQUESTS.inc(endpoint, model, "error")
+                raise
+            RETRIES_TOTAL.inc(endpoint, model, reason)
+            time.sleep(_backoff(attempt, e))
+            attempt += 1
+            continue
+        cb.record(True)
+        REQUESTS.inc(endpoint, model, "ok")
+        return result
+
+
+# ───────────────────────── STT con hedging ─────────────────────────
+_stt_latencies = deque(maxlen=200)
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="openai-hedge")
+
+
+def _hedge_delay():
+    """Segundos a esperar antes de duplicar la petición (None = sin hedging)."""
+    if STT_HEDGE_MS not in ("", "auto"):
+        ms = float(STT_HEDGE_MS)
+        return ms / 1000.0 if ms > 0 else None
+    if len(_stt_latencies) < 20:
+        return 2.0  # sin historial suficiente: umbral conservador
+    xs = sorted(_stt_latencies)
+    return max(0.3, xs[int(len(xs) * 0.95) - 1])
+
+
+def _transcribe_once(client, raw, filename, model, language):
+    t0 = time.perf_counter()
+    tr = call("stt", model, client.audio.transcriptions.create, model=model, file=(filename, raw), language=language)
+    _stt_latencies.append(time.perf_counter() - t0)
+    return tr
+
+
+def transcribe(raw: bytes, filename: str, model: str, language: str = "es", hedge: bool = False,
+               fallback_model: str = None):
+    """
+    Transcribe 'raw' (bytes; cada intento reenvía el mismo contenido). Con hedge=True, si la primera
+    petición supera el p95 reciente se lanza una segunda y gana la primera en responder.
+    'fallback_model' solo se usa si el circuito del modelo principal está abierto.
+    """
+    client = get_client()
+    if client is None:
+        raise RuntimeError("OPENAI_API_KEY no configurada")
+    if fallback_model and fallback_model != model and breaker(model).is_open():
+        model = fallback_model
+    delay = _hedge_delay() if hedge else None
+    if delay is None:
+        return _transcribe_once(client, raw, filename, model, language)
+
+    primary = _hedge_pool.submit(_transcribe_once, client, raw, filename, model, language)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+    backup = _hedge_pool.submit(_transcribe_once, client, raw, filename, model, language)
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                HEDGES.inc("stt", "primary" if fut is primary else "hedge")
+                return fut.result()  # la otra petición termina sola en el pool; su resultado se descarta
+            error = fut.exception()
+    HEDGES.inc("stt", "none")
+    raise error
+
+
+def stats() -> dict:
+    """Estado de breakers y presupuestos (para depuración)."""
+    with _registry_lock:
+        return {
+            "breakers": {m: {"state": b.state, "consecutive_failures": b.consecutive} for m, b in _breakers.items()},
+            "retry_budget": {e: round(b.tokens, 2) for e, b in _budgets.items()},
+            "stt_hedge_delay_s": _hedge_delay(),
+        }
@@ -0,0 +1,122 @@
+# apps/common/profiling.py — Profiling bajo demanda del HUB en producción
+# - sample_stacks(): profiler por muestreo de TODOS los hilos (sys._current_frames) durante N segundos;
+#   retorna stacks colapsados ("hilo;mod:func;mod:func N"), el formato de flamegraph.pl/speedscope.
+# - profile_call(): cProfile de una sola llamada (p.ej. un /ai-detect/upload con header X-Profile).
+# Ambos exigen HUB_ADMIN_TOKEN (header X-Admin-Token). Sin token configurado quedan deshabilitados.
+# No hay hooks permanentes: si nadie los invoca, no cuestan nada.
+import cProfile
+import functools
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+ADMIN_TOKEN = os.getenv("HUB_ADMIN_TOKEN", "")
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+MAX_DEPTH = 128
+
+_sampling = threading.Lock()  # un muestreo a la vez
+_cprofile = threading.Lock()  # cProfile no admite perfiles simultáneos en el mismo proceso
+
+
+def is_admin(token) -> bool:
+    """True si 'token' coincide con HUB_ADMIN_TOKEN (comparación en tiempo constante)."""
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(str(token), ADMIN_TOKEN)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(seconds: float = 10.0, interval: float = 0.005) -> dict:
+    """
+    Muestrea los stacks de todos los hilos cada 'interval' segundos durante 'seconds'.
+    Retorna {"collapsed": str, "samples": int, "seconds": float, "threads": int} o None si ya hay
+    un muestreo en curso.
+    """
+    seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+    interval = max(0.001, float(interval))
+    if not _sampling.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        seen_threads = set()
+        samples = 0
+        t_end = time.perf_counter() + seconds
+        while time.perf_counter() < t_end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None and len(parts) < MAX_DEPTH:
+                    parts.append(_frame_label(frame))
+                    frame = frame.f_back
+                parts.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(parts))] += 1
+                seen_threads.add(ident)
+            samples += 1
+            time.sleep(interval)
+        collapsed = "\n".join(f"{stack} {n}" for stack, n in stacks.most_common())
+        return {"collapsed": collapsed + "\n", "samples": samples, "seconds": seconds, "threads": len(seen_threads)}
+    finally:
+        _sampling.release()
+
+
+def profile_call(fn, *args, sort: str = "cumulative", limit: int = 40, **kwargs):
+    """
+    Ejecuta fn(*args, **kwargs) bajo cProfile. Retorna (resultado, stats_texto); stats_texto es None si
+    otro perfil estaba activo (la llamada se ejecuta igual, sin perfilar).
+    """
+    if not _cprofile.acquire(blocking=False):
+        return fn(*args, **kwargs), None
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            prof.disable()
+    finally:
+        _cprofile.release()
+    out = io.StringIO()
+    pstats.Stats(prof, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return result, out.getvalue()
+
+
+def flask_profiled(view):
+    """
+    Decorador para vistas Flask: con header 'X-Profile' (valor: orden de pstats, p.ej. cumulative|tottime)
+    y X-Admin-Token válido, la respuesta JSON incluye "profile" con las estadísticas de cProfile.
+    Sin el header la vista se llama directamente.
+    """
+    from flask import current_app, jsonify, request
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        mode = request.headers.get("X-Profile")
+        if not mode:
+            return view(*args, **kwargs)
+        if not is_admin(request.headers.get("X-Admin-Token")):
+            return jsonify({"error": "X-Profile requiere un X-Admin-Token válido"}), 403
+        sort = mode if mode in ("cumulative", "tottime", "calls", "time") else "cumulative"
+        resp, stats = profile_call(lambda: current_app.make_response(view(*args, **kwargs)), sort=sort)
+        if stats is None:
+            resp.headers["X-Profile-Status"] = "busy"
+            return resp
+        if not resp.is_json:
+            resp.headers["X-Profile-Status"] = "skipped: respuesta no JSON"
+            return resp
+        payload = resp.get_json()
+        payload["profile"] = stats
+        out = jsonify(payload)
+        out.status_code = resp.status_code
+        return out
+
+    return wrapper
@@ -0,0 +1,92 @@
+# apps/common/readiness.py — Warmup de modelos y estado de readiness compartido por las sub-apps
+# Cada sub-app registra sus componentes (p.ej. "ai_detect") y lanza su warmup en segundo plano al
+# importarse (las sub-apps montadas no reciben eventos de startup). /healthz responde 503 hasta que
+# sus componentes terminan el warmup, para que el balanceador no mande tráfico a workers fríos.
+# En el /healthz del HUB un componente fallido no bloquea (status 'degraded'), salvo los listados en
+# HUB_HEALTH_BLOCKING_FAILED; el /healthz de cada sub-app sí responde 503 si su modelo falló.
+#   WARMUP_ENABLED=0 desactiva los warmups (los componentes quedan listos al instante).
+import os
+import threading
+import time
+from datetime import datetime
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") not in ("0", "false", "no")
+
+
+def parse_sizes(spec: str):
+    """'640x480,1280x960' -> [(640, 480), (1280, 960)] (ancho x alto)."""
+    out = []
+    for part in (spec or "").split(","):
+        w, _, h = part.strip().lower().partition("x")
+        if w.isdigit():
+            out.append((int(w), int(h) if h.isdigit() else int(w)))
+    return out
+
+
+class Readiness:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._components = {}
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self._components.setdefault(name, {"state": "pending"}).update(fields)
+
+    def register(self, name: str):
+        self._set(name, state="pending")
+
+    def fail(self, name: str, error: str):
+        self._set(name, state="failed", error=error)
+
+    def run(self, name: str, fn, background: bool = True):
+        """
+        Ejecuta el warmup `fn()` del componente y registra su duración. Lo que retorne `fn`
+        (si es dict) se guarda como detalle. Un warmup fallido deja el componente en 'failed'.
+        """
+        def _job():
+            if not WARMUP_ENABLED:
+                self._set(name, state="ready", warmup_ms=0, detail={"skipped": True})
+                return
+            self._set(name, state="warming", started_at=datetime.now().isoformat(timespec="seconds"))
+            t0 = time.perf_counter()
+            try:
+                detail = fn()
+                ms = round((time.perf_counter() - t0) * 1000, 1)
+                self._set(name, state="ready", warmup_ms=ms,
+                          ready_at=datetime.now().isoformat(timespec="seconds"),
+                          detail=detail if isinstance(detail, dict) else None)
+                print(f"🔥 Warmup {name}: {ms:.0f} ms")
+            except Exception as e:
+                self._set(name, state="failed", warmup_ms=round((time.perf_counter() - t0) * 1000, 1), error=str(e))
+                print(f"⚠️ Warmup {name} falló: {e}")
+
+        if background:
+            threading.Thread(target=_job, name=f"warmup-{name}", daemon=True).start()
+        else:
+            _job()
+
+    def snapshot(self, names=None) -> dict:
+        with self._lock:
+            return {k: dict(v) for k, v in self._components.items() if names is None or k in names}
+
+    def check(self, names=None, blocking_failed=None):
+        """
+        (listo, payload) para un endpoint de health. Un componente pendiente/calentando siempre bloquea.
+        Uno 'failed' bloquea solo si está en blocking_failed (None = todos, como el /healthz de cada
+        sub-app); si no, se reporta en el payload con status 'degraded' sin sacar al proceso de rotación.
+        """
+        comps = self.snapshot(names)
+        warming = [k for k, c in comps.items() if c.get("state") not in ("ready", "failed")]
+        failed = [k for k, c in comps.items() if c.get("state") == "failed"]
+        blocking = [k for k in failed if blocking_failed is None or k in blocking_failed]
+        ready = not warming and not blocking
+        if blocking:
+            status = "failed"
+        elif warming:
+            status = "warming"
+        else:
+            status = "degraded" if failed else "ready"
+        return ready, {"ok": ready, "status": status, "failed": failed, "components": comps}
+
+
+readiness = Readiness()
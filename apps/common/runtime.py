@@ -0,0 +1,118 @@
+# apps/common/runtime.py — Hilos de torch/OpenCV/ONNX Runtime y afinidad de CPU por worker
+# Se aplica UNA vez al arrancar el HUB (app.py), antes de importar las sub-apps: torch, OpenMP y
+# ONNX Runtime fijan sus pools al cargarse. Sin configuración, cada worker de gunicorn usaría
+# todos los cores en cada librería (sobre-suscripción con varios workers).
+#   WEB_CONCURRENCY              workers de gunicorn (para repartir cores; default 1)
+#   RUNTIME_TORCH_THREADS        hilos intra-op de torch/OpenMP (default: cores del worker)
+#   RUNTIME_TORCH_INTEROP_THREADS hilos inter-op de torch (default 1)
+#   RUNTIME_CV2_THREADS          hilos de OpenCV (default 1; las imágenes se procesan por request)
+#   RUNTIME_CPU_AFFINITY         "" (sin fijar) | "auto" (reparte cores entre workers) | "0-3,6" (explícito)
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks de archivo, el slot se deriva del pid
+    fcntl = None
+
+_applied = None
+_slot_fd = None  # se mantiene abierto: el lock del slot vive lo que vive el worker
+
+
+def _parse_cpus(spec: str):
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        a, _, b = part.partition("-")
+        cpus.update(range(int(a), int(b or a) + 1))
+    return sorted(cpus)
+
+
+def _claim_slot(n_slots: int) -> int:
+    """Índice de worker estable: el primer slot cuyo lock de archivo esté libre (se libera al morir el proceso)."""
+    global _slot_fd
+    if fcntl is None:
+        return os.getpid() % max(1, n_slots)
+    base = os.path.join(tempfile.gettempdir(), f"ai_hub_cpu_slot_{os.getppid()}")
+    for i in range(n_slots):
+        fd = os.open(f"{base}_{i}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            _slot_fd = fd
+            return i
+        except OSError:
+            os.close(fd)
+    return os.getpid() % max(1, n_slots)
+
+
+def _available_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # macOS/Windows
+        return list(range(os.cpu_count() or 1))
+
+
+def _affinity(spec: str, workers: int):
+    """CPUs para este worker según RUNTIME_CPU_AFFINITY, o None si no se fija afinidad."""
+    if not spec:
+        return None
+    if spec != "auto":
+        return _parse_cpus(spec)
+    cpus = _available_cpus()
+    per = max(1, len(cpus) // max(1, workers))
+    slot = _claim_slot(workers)
+    start = (slot * per) % len(cpus)
+    return cpus[start:start + per] or cpus
+
+
+def apply_runtime_config() -> dict:
+    """Fija hilos/afinidad del proceso actual (idempotente). Retorna la configuración aplicada."""
+    global _applied
+    if _applied is not None:
+        return _applied
+
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    cpus = _affinity(os.getenv("RUNTIME_CPU_AFFINITY", "").strip(), workers)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    n_cpus = len(cpus) if cpus else max(1, len(_available_cpus()) // workers)
+
+    torch_threads = int(os.getenv("RUNTIME_TORCH_THREADS", "0")) or n_cpus
+    interop = int(os.getenv("RUNTIME_TORCH_INTEROP_THREADS", "1"))
+    cv2_threads = int(os.getenv("RUNTIME_CV2_THREADS", "1"))
+
+    # OpenMP/MKL/BLAS leen el entorno al cargarse; ONNX Runtime lo toma de yolo_backend
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "YOLO_INTRA_OP_THREADS"):
+        os.environ.setdefault(var, str(torch_threads))
+
+    applied = {"workers": workers, "cpus": cpus, "torch_threads": torch_threads,
+               "torch_interop_threads": interop, "cv2_threads": cv2_threads}
+    try:
+        import torch
+
+        torch.set_num_threads(torch_threads)
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError:  # solo se puede fijar antes del primer trabajo paralelo
+            applied["torch_interop_threads"] = torch.get_num_interop_threads()
+    except ImportError:
+        applied["torch_threads"] = applied["torch_interop_threads"] = None
+    try:
+        import cv2
+
+        cv2.setNumThreads(cv2_threads)
+    except ImportError:
+        applied["cv2_threads"] = None
+
+    applied["onnx_intra_op_threads"] = int(os.environ["YOLO_INTRA_OP_THREADS"])
+    applied["pid"] = os.getpid()
+    _applied = applied
+    print(f"⚙️ Runtime: {applied}")
+    return applied
+
+
+def runtime_info() -> dict:
+    """Configuración aplicada en este worker (vacío si apply_runtime_config no se llamó)."""
+    return dict(_applied or {})
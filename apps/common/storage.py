@@ -0,0 +1,315 @@
+# apps/common/storage.py — Retención y almacenamiento por niveles de artefactos de las sub-apps
+# - Presupuesto por carpeta (tamaño y antigüedad) configurable por entorno:
+#     STORAGE_<NOMBRE>_MAX_MB, STORAGE_<NOMBRE>_MAX_AGE_DAYS, STORAGE_<NOMBRE>_ACTION (archive|delete|none)
+# - Compactación en segundo plano: archiva (tar + zstd si está 'zstandard', si no gzip) o borra lo viejo.
+# - Índice SQLite de archivados: restore() devuelve el archivo a su carpeta bajo demanda.
+# - Con varios workers cada uno arranca su compactador; un flock sobre <archive>/compact.lock hace que
+#   solo uno compacte a la vez (los demás saltan esa vuelta).
+import os
+import sqlite3
+import tarfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import zstandard
+except Exception:  # zstd es opcional; sin él se usa tar.gz
+    zstandard = None
+
+try:
+    import fcntl
+except Exception:  # Windows: sin flock, la compactación solo se serializa dentro del proceso
+    fcntl = None
+
+APPS_DIR = Path(__file__).resolve().parents[1]
+ARCHIVE_DIR = Path(os.getenv("STORAGE_ARCHIVE_DIR", str(APPS_DIR.parent / "storage_archive")))
+COMPACT_INTERVAL_SEC = float(os.getenv("STORAGE_COMPACT_INTERVAL_SEC", "3600"))
+MIN_FILE_AGE_SEC = 120  # nunca tocar archivos recién escritos (escrituras en curso)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archived (
+    policy    TEXT NOT NULL,
+    name      TEXT NOT NULL,
+    archive   TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    mtime     REAL NOT NULL,
+    PRIMARY KEY (policy, name)
+);
+"""
+
+
+class StoragePolicy:
+    """Presupuesto de una carpeta de artefactos."""
+
+    def __init__(self, name, app, path, max_mb, max_age_days, action="archive"):
+        env = f"STORAGE_{name.upper()}_"
+        self.name = name
+        self.app = app
+        self.path = Path(path)
+        self.max_bytes = int(float(os.getenv(env + "MAX_MB", max_mb)) * 1024 * 1024)
+        self.max_age_sec = float(os.getenv(env + "MAX_AGE_DAYS", max_age_days)) * 86400
+        self.action = os.getenv(env + "ACTION", action).lower()
+
+    def scan(self):
+        """[(mtime, size, name)] de los archivos de primer nivel (las carpetas de uploads son planas)."""
+        out = []
+        if not self.path.is_dir():
+            return out
+        for entry in os.scandir(self.path):
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            out.append((st.st_mtime, st.st_size, entry.name))
+        return out
+
+
+DEFAULT_POLICIES = [
+    StoragePolicy("ai_detect_uploads", "ai_detect", APPS_DIR / "ai_detect" / "static" / "uploads", 2048, 30),
+    StoragePolicy("ai_detect_results", "ai_detect", APPS_DIR / "ai_detect" / "static" / "results", 2048, 30),
+    StoragePolicy("ai_detect_audio", "ai_detect", APPS_DIR / "ai_detect" / "static" / "audio", 200, 3, "delete"),
+    StoragePolicy("ai_seguridad_uploads", "ai_seguridad", APPS_DIR / "ai_seguridad" / "static" / "uploads", 1024, 7, "delete"),
+    # Originales subidos al tutor; el texto extraído queda en data/ingest_cache (solo se reporta)
+    StoragePolicy("ai_tutor_documents", "ai_tutor", APPS_DIR / "ai_tutor" / "data" / "uploads", 1024, 90, "delete"),
+    StoragePolicy("ai_tutor_ingest_cache", "ai_tutor", APPS_DIR / "ai_tutor" / "data" / "ingest_cache", 512, 365, "none"),
+    # El audio del tutor ya tiene su propio janitor (VoiceProcessor); aquí solo se reporta
+    StoragePolicy("ai_tutor_audio", "ai_tutor", APPS_DIR / "ai_tutor" / "static" / "audio", 200, 3, "none"),
+]
+
+
+class StorageManager:
+    def __init__(self, policies=None, archive_dir=ARCHIVE_DIR):
+        self.policies = {p.name: p for p in (policies or DEFAULT_POLICIES)}
+        self.archive_dir = Path(archive_dir)
+        self._local = threading.local()
+        self._lock = threading.Lock()  # una compactación a la vez
+        self._thread = None
+        self._last_run = None
+
+    # ----------------- Índice de archivados -----------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.archive_dir / "index.db"), timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # ----------------- Compactación -----------------
+    @staticmethod
+    def _select_victims(policy: StoragePolicy, files, now: float):
+        """Archivos fuera de presupuesto: los muy viejos y, si aún sobra tamaño, los más antiguos."""
+        total = sum(f[1] for f in files)
+        victims = []
+        for mtime, size, name in sorted(files):
+            if now - mtime < MIN_FILE_AGE_SEC:
+                break
+            if now - mtime <= policy.max_age_sec and total <= policy.max_bytes:
+                break
+            victims.append((mtime, size, name))
+            total -= size
+        return victims
+
+    def _write_archive(self, policy: StoragePolicy, victims) -> Path:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = ".tar.zst" if zstandard is not None else ".tar.gz"
+        dest = self.archive_dir / policy.name / f"{policy.name}-{stamp}{suffix}"
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name("." + dest.name + ".tmp")
+        if zstandard is not None:
+            with open(tmp, "wb") as raw, zstandard.ZstdCompressor(level=10).stream_writer(raw) as zf, \
+                    tarfile.open(fileobj=zf, mode="w|") as tar:
+                for _, _, name in victims:
+                    tar.add(str(policy.path / name), arcname=name)
+        else:
+            with tarfile.open(tmp, mode="w:gz") as tar:
+                for _, _, name in victims:
+                    tar.add(str(policy.path / name), arcname=name)
+        os.replace(tmp, dest)
+        return dest
+
+    def compact_policy(self, policy: StoragePolicy) -> dict:
+        if policy.action not in ("archive", "delete"):
+            return {"policy": policy.name, "action": policy.action, "files": 0, "bytes": 0}
+        victims = self._select_victims(policy, policy.scan(), time.time())
+        if not victims:
+            return {"policy": policy.name, "action": policy.action, "files": 0, "bytes": 0}
+
+        if policy.action == "archive":
+            dest = self._write_archive(policy, victims)
+            conn = self._conn()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO archived (policy, name, archive, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                    [(policy.name, name, str(dest), size, mtime) for mtime, size, name in victims],
+                )
+
+        freed = 0
+        for _, size, name in victims:
+            try:
+                os.remove(policy.path / name)
+                freed += size
+            except OSError:
+                pass
+        return {"policy": policy.name, "action": policy.action, "files": len(victims), "bytes": freed}
+
+    def _lock_compaction(self):
+        """flock no bloqueante entre procesos. Retorna el fd a liberar, -1 sin fcntl, None si otro lo tiene."""
+        if fcntl is None:
+            return -1
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.archive_dir / "compact.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def compact(self) -> list:
+        """Aplica todos los presupuestos una vez (se salta si otro proceso ya está compactando)."""
+        with self._lock:
+            fd = self._lock_compaction()
+            if fd is None:
+                self._last_run = {"at": datetime.now().isoformat(timespec="seconds"),
+                                  "skipped": "otro proceso está compactando"}
+                return []
+            try:
+                out = []
+                for policy in self.policies.values():
+                    try:
+                        out.append(self.compact_policy(policy))
+                    except Exception as e:
+                        out.append({"policy": policy.name, "error": str(e)})
+                self._last_run = {"at": datetime.now().isoformat(timespec="seconds"), "results": out}
+                return out
+            finally:
+                if fd >= 0:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+
+    def start(self, interval_sec: float = COMPACT_INTERVAL_SEC):
+        """Lanza (una sola vez) el hilo de compactación periódica."""
+        if self._thread is not None:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval_sec)
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"[storage] compactación falló: {e}")
+
+        self._thread = threading.Thread(target=_loop, name="storage-compactor", daemon=True)
+        self._thread.start()
+
+    # ----------------- Lectura perezosa -----------------
+    def restore(self, policy_name: str, name: str):
+        """
+        Ruta en disco de `name` dentro de la carpeta de la política; si fue archivado,
+        se extrae del archivo a su ubicación original. None si no existe en ningún nivel.
+        """
+        policy = self.policies.get(policy_name)
+        if policy is None or not name or "/" in name or "\\" in name:
+            return None
+        path = policy.path / name
+        if path.exists():
+            return path
+        row = self._conn().execute(
+            "SELECT archive FROM archived WHERE policy = ? AND name = ?", (policy_name, name)
+        ).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return None
+
+        data = None
+        if row[0].endswith(".zst"):
+            if zstandard is None:
+                return None
+            with open(row[0], "rb") as raw, zstandard.ZstdDecompressor().stream_reader(raw) as zf, \
+                    tarfile.open(fileobj=zf, mode="r|") as tar:
+                for member in tar:
+                    if member.name == name:
+                        data = tar.extractfile(member).read()
+                        break
+        else:
+            with tarfile.open(row[0], mode="r:gz") as tar:
+                try:
+                    data = tar.extractfile(name).read()
+                except KeyError:
+                    data = None
+        if data is None:
+            return None
+
+        policy.path.mkdir(parents=True, exist_ok=True)
+        tmp = policy.path / f".restore_{os.getpid()}_{threading.get_ident()}_{name}"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM archived WHERE policy = ? AND name = ?", (policy_name, name))
+        return path
+
+    # ----------------- Métricas -----------------
+    def usage(self) -> dict:
+        """Uso de disco por sub-app y por carpeta (vivo + archivado)."""
+        archived = {}
+        try:
+            for policy, n, size in self._conn().execute(
+                "SELECT policy, COUNT(*), COALESCE(SUM(size), 0) FROM archived GROUP BY policy"
+            ):
+                archived[policy] = (n, size)
+        except sqlite3.Error:
+            pass
+
+        archive_bytes = {}
+        if self.archive_dir.is_dir():
+            for d in self.archive_dir.iterdir():
+                if d.is_dir():
+                    archive_bytes[d.name] = sum(f.stat().st_size for f in d.iterdir() if f.is_file())
+
+        apps, dirs = {}, []
+        for p in self.policies.values():
+            files = p.scan()
+            live = sum(f[1] for f in files)
+            n_arch, arch_orig = archived.get(p.name, (0, 0))
+            entry = {
+                "policy": p.name,
+                "app": p.app,
+                "path": str(p.path),
+                "action": p.action,
+                "files": len(files),
+                "bytes": live,
+                "max_bytes": p.max_bytes,
+                "max_age_days": round(p.max_age_sec / 86400, 2),
+                "archived_files": n_arch,
+                "archived_original_bytes": arch_orig,
+                "archive_bytes": archive_bytes.get(p.name, 0),
+            }
+            dirs.append(entry)
+            a = apps.setdefault(p.app, {"bytes": 0, "files": 0, "archive_bytes": 0})
+            a["bytes"] += live
+            a["files"] += len(files)
+            a["archive_bytes"] += entry["archive_bytes"]
+        return {"apps": apps, "dirs": dirs, "last_compaction": self._last_run}
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> StorageManager:
+    """Instancia compartida por todas las sub-apps del proceso."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = StorageManager()
+    return _manager
@@ -0,0 +1,150 @@
+# apps/common/tokens.py — Estimación local de tokens y ventanas de contexto con presupuesto
+# Usa tiktoken si está instalado; si no, una heurística por palabras (sin red ni dependencias).
+import json
+import math
+import re
+from typing import Dict, List, Tuple
+
+try:
+    import tiktoken
+    _enc = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken es opcional
+    _enc = None
+
+_piece_re = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_sentence_re = re.compile(r"(?<=[.!?¿¡])\s+")
+
+# Overhead aproximado del formato chat de OpenAI
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+
+def count_tokens(text: str) -> int:
+    """Tokens aproximados de un texto (~1 token por 4 caracteres de palabra, 1 por signo)."""
+    if not text:
+        return 0
+    if _enc is not None:
+        return len(_enc.encode(text, disallowed_special=()))
+    return sum(max(1, math.ceil(len(p) / 4)) for p in _piece_re.findall(text))
+
+
+def message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Tokens de prompt de una lista de mensajes chat (contenido + overhead por mensaje)."""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m.get("content") or "") for m in messages) + TOKENS_PER_REPLY
+
+
+def truncate_to_tokens(text: str, budget: int, suffix: str = "…") -> str:
+    """Recorta un texto para que quepa en `budget` tokens (corta por palabras)."""
+    if budget <= 0 or not text:
+        return ""
+    if count_tokens(text) <= budget:
+        return text
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:  # búsqueda binaria del prefijo más largo que cabe
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]) + suffix) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + suffix if lo else ""
+
+
+def _summarize_turns(turns: List[Dict[str, str]], budget: int) -> str:
+    """Resumen extractivo (sin LLM): primera oración de cada turno antiguo, priorizando los más recientes."""
+    labels = {"user": "Usuario", "assistant": "Tutor"}
+    header = "Resumen de turnos anteriores:"
+    used = count_tokens(header)
+    lines = []
+    for m in reversed(turns):
+        first = _sentence_re.split((m.get("content") or "").strip(), maxsplit=1)[0]
+        line = f"- {labels.get(m.get('role'), m.get('role'))}: {truncate_to_tokens(first, 40)}"
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return ""
+    return header + "\n" + "\n".join(reversed(lines))
+
+
+def fit_history(
+    head: List[Dict[str, str]],
+    history: List[Dict[str, str]],
+    budget: int,
+    summary_budget: int = 150,
+) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """
+    Arma los mensajes [head..., (resumen), history reciente...] dentro de `budget` tokens.
+    - Se conservan los turnos más recientes completos mientras quepan.
+    - Los más antiguos que no caben se condensan en un mensaje de sistema (hasta `summary_budget`).
+    - El último turno (la pregunta actual) se recorta si por sí solo excede el presupuesto.
+    Retorna (mensajes, stats).
+    """
+    used = message_tokens(head)
+    kept: List[Dict[str, str]] = []
+    for i, m in enumerate(reversed(history)):
+        cost = TOKENS_PER_MESSAGE + count_tokens(m.get("content") or "")
+        if used + cost <= budget - (summary_budget if i < len(history) - 1 else 0):
+            kept.append(m)
+            used += cost
+        elif i == 0:
+            room = max(16, budget - used - TOKENS_PER_MESSAGE - summary_budget)
+            kept.append({"role": m["role"], "content": truncate_to_tokens(m.get("content") or "", room)})
+            used += TOKENS_PER_MESSAGE + count_tokens(kept[-1]["content"])
+        else:
+            break
+    kept.reverse()
+
+    older = history[: len(history) - len(kept)]
+    messages = list(head)
+    if older:
+        summary = _summarize_turns(older, max(0, min(summary_budget, budget - used - TOKENS_PER_MESSAGE)))
+        if summary:
+            messages.append({"role": "system", "content": summary})
+            used += TOKENS_PER_MESSAGE + count_tokens(summary)
+    messages.extend(kept)
+    return messages, {
+        "prompt_tokens_est": used,
+        "budget": budget,
+        "turns_kept": len(kept),
+        "turns_summarized": len(older),
+    }
+
+
+def fit_json(obj, budget: int, max_iter: int = 200):
+    """
+    Reduce un objeto JSON (dict/list anidados) hasta que su serialización quepa en `budget` tokens:
+    primero acorta las listas más largas (quitando los últimos elementos), luego los strings más largos.
+    Retorna (obj_reducido, tokens).
+    """
+    obj = json.loads(json.dumps(obj, ensure_ascii=False))  # copia profunda, no muta el original
+    tokens = count_tokens(json.dumps(obj, ensure_ascii=False))
+    for _ in range(max_iter):
+        if tokens <= budget:
+            break
+        lists, strings = [], []
+
+        def walk(node, parent, key):
+            if isinstance(node, dict):
+                for k, v in node.items():
+                    walk(v, node, k)
+            elif isinstance(node, list):
+                if len(node) > 1:
+                    lists.append(node)
+                for i, v in enumerate(node):
+                    walk(v, node, i)
+            elif isinstance(node, str) and len(node) > 40:
+                strings.append((parent, key, node))
+
+        walk(obj, None, None)
+        if lists:
+            max(lists, key=lambda l: len(json.dumps(l, ensure_ascii=False))).pop()
+        elif strings:
+            parent, key, s = max(strings, key=lambda t: len(t[2]))
+            parent[key] = s[: len(s) // 2].rstrip() + "…"
+        else:
+            break
+        tokens = count_tokens(json.dumps(obj, ensure_ascii=False))
+    return obj, tokens
@@ -0,0 +1,137 @@
+# apps/common/yolo_backend.py — Backends de inferencia CPU para los modelos YOLO (torch | onnx | openvino)
+# - YOLO_BACKEND elige el backend por defecto; cada app puede sobrescribirlo (p.ej. AI_DETECT_BACKEND).
+# - El artefacto exportado se cachea junto a los pesos (<stem>.onnx, <stem>_openvino_model/) y se
+#   regenera solo si el .pt es más nuevo.
+# - ONNX Runtime usa YOLO_INTRA_OP_THREADS hilos intra-op (0 = default de ORT); si no se puede ajustar
+#   la sesión se queda la que crea ultralytics, sin fallar la carga.
+# - Cualquier otro fallo (export, dependencia ausente, carga) cae a PyTorch con un aviso.
+# - Un .onnx (p.ej. la variante INT8 de apps/ai_detect/quantize.py) se carga directo con backend="onnx".
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+from ultralytics import YOLO
+
+BACKENDS = ("torch", "onnx", "openvino")
+DEFAULT_BACKEND = os.getenv("YOLO_BACKEND", "torch")
+INTRA_OP_THREADS = int(os.getenv("YOLO_INTRA_OP_THREADS", "0"))
+EXPORT_IMGSZ = int(os.getenv("YOLO_EXPORT_IMGSZ", "640"))
+
+logger = logging.getLogger(__name__)
+
+
+def exported_path(weights: Path, backend: str) -> Path:
+    """Ubicación del artefacto exportado junto a los pesos."""
+    if backend == "onnx":
+        return weights.with_suffix(".onnx")
+    return weights.with_name(f"{weights.stem}_openvino_model")
+
+
+def _is_fresh(artifact: Path, weights: Path) -> bool:
+    return artifact.exists() and artifact.stat().st_mtime >= weights.stat().st_mtime
+
+
+def export(weights, backend: str, imgsz: int = EXPORT_IMGSZ) -> Path:
+    """Exporta (si hace falta) los pesos .pt al backend pedido y retorna la ruta del artefacto."""
+    weights = Path(weights)
+    artifact = exported_path(weights, backend)
+    if _is_fresh(artifact, weights):
+        return artifact
+    logger.info(f"Exportando {weights.name} a {backend} (imgsz={imgsz})...")
+    # dynamic=True: el lote puede variar (teselas, frames) sin re-exportar
+    # Ultralytics escribe junto a los pesos con los mismos nombres que exported_path()
+    out = YOLO(str(weights)).export(format=backend, imgsz=imgsz, dynamic=True)
+    return Path(out)
+
+
+def _ultralytics_major() -> int:
+    try:
+        import ultralytics
+        return int(str(getattr(ultralytics, "__version__", "0")).split(".")[0])
+    except (ImportError, ValueError):
+        return 0
+
+
+def _tune_onnx_session(model: YOLO, artifact: Path, threads: int):
+    """
+    Ultralytics crea la sesión de ONNX Runtime sin opciones; se reemplaza por una con
+    intra_op_num_threads. La predicción dummy inicializa el predictor (y sirve de warmup).
+    El reemplazo toca un atributo interno de AutoBackend (predictor.model.session, ultralytics 8.x):
+    si la versión o la estructura no calzan, o la sesión nueva falla, se queda la sesión por defecto.
+    """
+    model.predict(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)
+    if threads <= 0:
+        return
+    backend = getattr(getattr(model, "predictor", None), "model", None)
+    if _ultralytics_major() != 8 or not hasattr(backend, "session") or backend.session is None:
+        logger.warning(f"ONNX: no se reconoce la sesión de ultralytics (versión {_ultralytics_major()}.x); "
+                       f"se usa la sesión por defecto (YOLO_INTRA_OP_THREADS={threads} ignorado)")
+        return
+    try:
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        session = ort.InferenceSession(str(artifact), sess_options=opts, providers=["CPUExecutionProvider"])
+        old_inputs = [i.name for i in backend.session.get_inputs()]
+        if [i.name for i in session.get_inputs()] != old_inputs:
+            raise ValueError(f"entradas distintas a las de la sesión original ({old_inputs})")
+        backend.session = session
+    except Exception as e:
+        logger.warning(f"ONNX: no se pudo ajustar la sesión ({e}); se usa la sesión por defecto")
+
+
+def load_yolo(weights, backend: str = None, threads: int = None):
+    """
+    Carga un modelo YOLO con el backend pedido. Retorna (modelo, info) donde
+    info = {"backend", "path", "load_ms"[, "fallback"]}. El modelo expone la misma API
+    (model(img), model.names) sin importar el backend.
+    """
+    backend = (backend or DEFAULT_BACKEND).lower()
+    threads = INTRA_OP_THREADS if threads is None else int(threads)
+    weights = str(weights)
+    t0 = time.perf_counter()
+
+    if backend in ("onnx", "openvino"):
+        try:
+            if not Path(weights).exists():
+                raise FileNotFoundError(f"pesos locales no encontrados: {weights}")
+            # Un .onnx ya listo (p.ej. la variante INT8) se usa tal cual, sin exportar
+            artifact = Path(weights) if weights.endswith(".onnx") else export(weights, backend)
+            model = YOLO(str(artifact), task="detect")
+            if backend == "onnx":
+                _tune_onnx_session(model, artifact, threads)
+            return model, {
+                "backend": backend,
+                "path": str(artifact),
+                "threads": threads,
+                "load_ms": round((time.perf_counter() - t0) * 1000, 1),
+            }
+        except Exception as e:
+            logger.warning(f"Backend {backend} no disponible para {weights} ({e}); se usa torch")
+            fallback = f"{backend}: {e}"
+    elif backend != "torch":
+        fallback = f"backend desconocido: {backend}"
+    else:
+        fallback = None
+
+    model = YOLO(weights)
+    info = {"backend": "torch", "path": weights, "load_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    if fallback:
+        info["fallback"] = fallback
+    return model, info
+
+
+def warmup(model, sizes, runs: int = 2) -> dict:
+    """Inferencias dummy (imágenes negras) a cada tamaño para pagar la inicialización perezosa antes del tráfico."""
+    out = {}
+    for w, h in sizes:
+        img = np.zeros((h, w, 3), dtype=np.uint8)
+        t0 = time.perf_counter()
+        for _ in range(max(1, runs)):
+            model(img, verbose=False)
+        out[f"{w}x{h}"] = round((time.perf_counter() - t0) * 1000 / max(1, runs), 1)
+    return out
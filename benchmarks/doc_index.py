@@ -0,0 +1,91 @@
+# benchmarks/doc_index.py — Construcción y consulta del índice BM25 del tutor (apps/ai_tutor/.../doc_index.py)
+# Para documentos sintéticos de --pages páginas reporta: tiempo de construcción, carga (mmap), latencia
+# de consulta p50/p95 y tokens de prompt: documento entero vs top-k fragmentos (este último es constante).
+# Uso: python -m benchmarks.doc_index [--pages 10 100 1000] [--queries 200] [--k 4]
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+VOCAB = ("extintor tablero electrico senalizacion salida emergencia casco guantes arnes andamio escalera "
+         "derrame quimico ventilacion ruido iluminacion orden limpieza residuos botiquin evacuacion "
+         "incendio inspeccion riesgo hallazgo responsable plazo norma capacitacion permiso trabajo altura "
+         "bloqueo etiquetado maquina guarda proteccion auditiva respiratoria ergonomia carga manual "
+         "montacargas pasillo almacenamiento rotulado hoja seguridad producto inflamable cilindro gas").split()
+
+
+def make_pages(pages: int, words_per_page: int = 350, seed: int = 0):
+    """Páginas con distribución de Zipf sobre un vocabulario técnico + términos raros por página."""
+    rng = np.random.default_rng(seed)
+    vocab = VOCAB + [f"termino{i}" for i in range(5000)]
+    ranks = np.arange(1, len(vocab) + 1)
+    p = 1 / ranks ** 1.1
+    p /= p.sum()
+    out = []
+    for _ in range(pages):
+        idx = rng.choice(len(vocab), size=words_per_page, p=p)
+        out.append(" ".join(vocab[i] for i in idx))
+    return out
+
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return round(xs[min(len(xs) - 1, int(len(xs) * q))], 3)
+
+
+def run(page_counts, n_queries, k):
+    from apps.ai_tutor.backend.utils import doc_index
+    from apps.common.tokens import count_tokens
+
+    rng = np.random.default_rng(1)
+    rows = []
+    for pages in page_counts:
+        root = tempfile.mkdtemp(prefix="bench_index_")
+        text = make_pages(pages)
+        entry = {"doc_id": f"{pages:016x}", "name": f"sintetico_{pages}p.pdf", "pages": text}
+
+        t0 = time.perf_counter()
+        meta = doc_index.DocIndex(root).add(entry)
+        build_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        index = doc_index.DocIndex(root)  # carga en frío: abre el segmento con mmap
+        index.has(entry["doc_id"])
+        load_ms = (time.perf_counter() - t0) * 1000
+
+        queries = [" ".join(rng.choice(VOCAB, size=int(rng.integers(2, 6)))) for _ in range(n_queries)]
+        lat, ctx_tokens = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            hits = index.search(q, doc_ids=[entry["doc_id"]], k=k)
+            lat.append((time.perf_counter() - t0) * 1000)
+            ctx_tokens.append(sum(count_tokens(h["text"]) for h in hits))
+
+        rows.append({
+            "pages": pages,
+            "chunks": meta["n_chunks"],
+            "terms": meta["terms"],
+            "build_s": round(build_s, 3),
+            "build_pages_per_sec": round(pages / build_s, 1),
+            "load_ms": round(load_ms, 2),
+            "query_p50_ms": _pct(lat, 0.5),
+            "query_p95_ms": _pct(lat, 0.95),
+            "query_mean_ms": round(statistics.mean(lat), 3),
+            "full_text_tokens": count_tokens("\n".join(text)),
+            "topk_tokens_mean": round(statistics.mean(ctx_tokens), 1),
+        })
+        shutil.rmtree(root, ignore_errors=True)
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Construcción y consulta del índice BM25 del tutor")
+    ap.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=4)
+    args = ap.parse_args()
+    print(json.dumps(run(args.pages, args.queries, args.k), indent=2))
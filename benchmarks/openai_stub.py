@@ -0,0 +1,234 @@
+# benchmarks/openai_stub.py — Servidor local compatible con la API de OpenAI (pruebas de carga sin proveedor)
+# Implementa chat.completions (también stream=true por SSE), audio.speech y audio.transcriptions con
+# contenido fijo, latencia según una distribución configurable y una tasa de fallos inyectados.
+# Así se mide el overhead y los límites de concurrencia del HUB por separado de los del proveedor.
+#
+# Latencias (por endpoint, con fallback a OPENAI_STUB_LATENCY):
+#   OPENAI_STUB_LATENCY[_CHAT|_SPEECH|_TRANSCRIPTIONS] = fixed:200 | uniform:100-400 | lognormal:300,0.5
+#       (lognormal: mediana en ms, sigma)   — OPENAI_STUB_LATENCY_MS=N equivale a fixed:N
+#   OPENAI_STUB_TOKEN_MS        retardo entre chunks en streaming (default 15)
+# Fallos:
+#   OPENAI_STUB_FAIL_RATE       probabilidad 0..1 de responder error (default 0)
+#   OPENAI_STUB_FAIL_STATUS     estados posibles, p.ej. "429,500,503" (default 500)
+#
+# Uso: python -m benchmarks.openai_stub [--port 8765] [--latency lognormal:300,0.5] [--fail-rate 0.02]
+#      y en el HUB: OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+import wave
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+ANSWER = ("Se detectó una fuga en el techo. Recomiendo sellar la cubierta, revisar los desagües "
+          "y programar una inspección de seguimiento esta semana.")
+TRANSCRIPT = "hola, ¿qué problema tiene la imagen?"
+# MP3 mínimo (un frame MPEG-1 Layer III silencioso): basta para clientes que solo leen bytes
+SILENT_MP3 = bytes.fromhex("fffb9064") + b"\x00" * 413
+
+
+def parse_latency(spec: str):
+    """'fixed:200' | 'uniform:100-400' | 'lognormal:300,0.5' -> función que muestrea ms."""
+    kind, _, arg = (spec or "fixed:0").partition(":")
+    kind = kind.strip().lower()
+    if kind == "uniform":
+        lo, _, hi = arg.partition("-")
+        lo, hi = float(lo), float(hi or lo)
+        return lambda: random.uniform(lo, hi)
+    if kind == "lognormal":
+        median, _, sigma = arg.partition(",")
+        mu, sigma = math.log(max(float(median), 1e-3)), float(sigma or 0.5)
+        return lambda: random.lognormvariate(mu, sigma)
+    try:
+        value = float((arg or 0) if kind == "fixed" else kind)  # 'fixed:200' o solo '200'
+    except ValueError:
+        raise ValueError(f"Distribución de latencia inválida: {spec!r}")
+    return lambda: value
+
+
+class StubConfig:
+    def __init__(self):
+        default = os.getenv("OPENAI_STUB_LATENCY") or f"fixed:{os.getenv('OPENAI_STUB_LATENCY_MS', '0')}"
+        self.latency = {ep: parse_latency(os.getenv(f"OPENAI_STUB_LATENCY_{ep.upper()}", default))
+                        for ep in ("chat", "speech", "transcriptions")}
+        self.token_ms = float(os.getenv("OPENAI_STUB_TOKEN_MS", "15"))
+        self.fail_rate = float(os.getenv("OPENAI_STUB_FAIL_RATE", "0"))
+        self.fail_status = [int(s) for s in os.getenv("OPENAI_STUB_FAIL_STATUS", "500").split(",") if s.strip()]
+
+
+config = StubConfig()
+app = FastAPI(title="OpenAI stub")
+stats = {"chat": 0, "chat_stream": 0, "speech": 0, "transcriptions": 0, "failures": 0}
+
+
+async def _delay(endpoint):
+    ms = config.latency[endpoint]()
+    if ms > 0:
+        await asyncio.sleep(ms / 1000)
+
+
+def _maybe_fail():
+    """Respuesta de error con el formato de OpenAI (o None) según la tasa de fallos configurada."""
+    if config.fail_rate <= 0 or random.random() >= config.fail_rate:
+        return None
+    stats["failures"] += 1
+    status = random.choice(config.fail_status or [500])
+    kind = "rate_limit_error" if status == 429 else "server_error"
+    headers = {"retry-after": "1"} if status == 429 else None
+    return JSONResponse({"error": {"message": f"stub: fallo inyectado ({status})", "type": kind, "code": status}},
+                        status_code=status, headers=headers)
+
+
+def _words(text):
+    return max(1, len(text.split()))
+
+
+def _usage(prompt):
+    return {"prompt_tokens": _words(prompt), "completion_tokens": _words(ANSWER),
+            "total_tokens": _words(prompt) + _words(ANSWER)}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await _delay("chat")
+    failed = _maybe_fail()
+    if failed is not None:
+        return failed
+    prompt = " ".join(str(m.get("content") or "") for m in body.get("messages") or [])
+    cid, created, model = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time()), body.get("model", "stub")
+
+    if not body.get("stream"):
+        stats["chat"] += 1
+        return JSONResponse({
+            "id": cid, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+            "usage": _usage(prompt),
+        })
+
+    stats["chat_stream"] += 1
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    def chunk(delta, finish=None, usage=None):
+        data = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish}]}
+        if usage:
+            data["usage"] = usage
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        for i, word in enumerate(ANSWER.split(" ")):
+            if config.token_ms > 0:
+                await asyncio.sleep(config.token_ms / 1000)
+            yield chunk({"content": (" " if i else "") + word})
+        yield chunk({}, finish="stop")
+        if include_usage:
+            yield chunk(None, usage=_usage(prompt))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _silent_wav(seconds=0.5, rate=16000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buf.getvalue()
+
+
+@app.post("/v1/audio/speech")
+async def speech(request: Request):
+    body = await request.json()
+    await _delay("speech")
+    failed = _maybe_fail()
+    if failed is not None:
+        return failed
+    stats["speech"] += 1
+    if body.get("response_format") == "wav":
+        return Response(_silent_wav(), media_type="audio/wav")
+    return Response(SILENT_MP3, media_type="audio/mpeg")
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    form = await request.form()
+    audio = form.get("file")
+    size = len(await audio.read()) if hasattr(audio, "read") else 0
+    await _delay("transcriptions")
+    failed = _maybe_fail()
+    if failed is not None:
+        return failed
+    stats["transcriptions"] += 1
+    fmt = form.get("response_format") or "json"
+    if fmt in ("text", "srt", "vtt"):
+        return PlainTextResponse(TRANSCRIPT)
+    out = {"text": TRANSCRIPT}
+    if fmt == "verbose_json":
+        out.update({"language": form.get("language") or "es", "duration": round(size / 32000, 2),
+                    "segments": [{"id": 0, "start": 0.0, "end": 1.5, "text": TRANSCRIPT}]})
+    return JSONResponse(out)
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": m, "object": "model", "owned_by": "stub"}
+                                       for m in ("gpt-4o-mini", "gpt-4o-mini-tts", "gpt-4o-mini-transcribe", "whisper-1")]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_in_thread(port: int = None) -> str:
+    """Levanta el stub en un hilo daemon y retorna su base URL (…/v1) cuando ya acepta conexiones."""
+    import uvicorn
+
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="openai-stub", daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description="Servidor local compatible con OpenAI")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", help="distribución para todos los endpoints (fixed:N | uniform:A-B | lognormal:MED,SIGMA)")
+    ap.add_argument("--token-ms", type=float, default=None)
+    ap.add_argument("--fail-rate", type=float, default=None)
+    ap.add_argument("--fail-status", default=None, help='p.ej. "429,500,503"')
+    args = ap.parse_args()
+    if args.latency:
+        config.latency = {ep: parse_latency(args.latency) for ep in config.latency}
+    if args.token_ms is not None:
+        config.token_ms = args.token_ms
+    if args.fail_rate is not None:
+        config.fail_rate = args.fail_rate
+    if args.fail_status:
+        config.fail_status = [int(s) for s in args.fail_status.split(",") if s.strip()]
+    print(f"OPENAI_BASE_URL=http://127.0.0.1:{args.port}/v1")
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,121 @@
+# benchmarks/pdf_ingest.py — Páginas/s de la ingesta de PDFs del tutor (apps/ai_tutor/.../file_processor.py)
+# Compara sobre un PDF sintético de --pages páginas de texto:
+#   antes:  PdfReader secuencial con text += page.extract_text()
+#   ahora:  iter_pdf_pages con workers=1 y con el pool de procesos (arranque en frío y pool ya caliente)
+#   cache:  ingest_file sobre un archivo ya ingerido (solo sha256 + lectura del JSON)
+# Uso: python -m benchmarks.pdf_ingest [--pages 300] [--workers 1 2 4] [--pdf archivo.pdf]
+import argparse
+import json
+import os
+import tempfile
+import time
+
+LOREM = ("La inspeccion de seguridad revisa extintores, senalizacion, orden y limpieza, tableros electricos "
+         "y equipos de proteccion personal. Cada hallazgo se clasifica por riesgo y area responsable.")
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(path, pages: int, lines_per_page: int = 45):
+    """PDF mínimo (Helvetica, una línea por Tj) escrito a mano: sin dependencias extra."""
+    objs = []  # cuerpo de cada objeto, numerados desde 1
+
+    def add(body: bytes) -> int:
+        objs.append(body)
+        return len(objs)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # se completa al final con los Kids
+    kids = []
+    for p in range(pages):
+        ops = ["BT /F1 9 Tf 40 800 Td 11 TL"]
+        for i in range(lines_per_page):
+            words = LOREM.split()
+            line = f"[{p + 1}.{i + 1}] " + " ".join(words[(p + i) % 7:][:14])
+            ops.append(f"({_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 %d 0 R >> >> "
+                        b"/Contents %d 0 R >>" % (pages_id, font, content)))
+    objs[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def _old_extract(path) -> str:
+    import PyPDF2
+
+    text = ""
+    with open(path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        for page in reader.pages:
+            text += page.extract_text()
+    return text
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def run(pdf_path, worker_counts):
+    from apps.ai_tutor.backend.utils import file_processor as fp
+
+    n = fp.pdf_page_count(pdf_path)
+    rows = []
+
+    def row(name, seconds, **extra):
+        rows.append({"mode": name, "seconds": round(seconds, 3), "pages_per_sec": round(n / seconds, 1), **extra})
+
+    text, s = _timed(lambda: _old_extract(pdf_path))
+    row("antes: secuencial text +=", s, chars=len(text))
+
+    for w in worker_counts:
+        if w <= 1:
+            pages, s = _timed(lambda: list(fp.iter_pdf_pages(pdf_path, workers=1)))
+            row("iter_pdf_pages workers=1", s, chars=sum(len(p["text"]) for p in pages))
+            continue
+        fp.INGEST_WORKERS = w
+        if fp._pool is not None:
+            fp._pool.shutdown()
+            fp._pool = None
+        pages, s = _timed(lambda: list(fp.iter_pdf_pages(pdf_path, workers=w)))
+        row(f"iter_pdf_pages workers={w} (pool en frío)", s, chars=sum(len(p["text"]) for p in pages))
+        pages, s = _timed(lambda: list(fp.iter_pdf_pages(pdf_path, workers=w)))
+        row(f"iter_pdf_pages workers={w} (pool caliente)", s, chars=sum(len(p["text"]) for p in pages))
+
+    fp.CACHE_DIR = fp.Path(tempfile.mkdtemp(prefix="bench_ingest_cache_"))
+    first, s = _timed(lambda: fp.ingest_file(pdf_path))
+    row("ingest_file (sin cache)", s, cached=first["cached"])
+    again, s = _timed(lambda: fp.ingest_file(pdf_path))
+    row("ingest_file (cache por sha256)", s, cached=again["cached"])
+    return {"pdf": str(pdf_path), "pages": n, "bytes": os.path.getsize(pdf_path), "cpus": os.cpu_count(), "rows": rows}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Páginas/s de la ingesta de PDFs del tutor")
+    ap.add_argument("--pages", type=int, default=300)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--pdf", default=None, help="PDF propio en lugar del sintético")
+    args = ap.parse_args()
+    pdf = args.pdf
+    if pdf is None:
+        pdf = os.path.join(tempfile.mkdtemp(prefix="bench_pdf_"), f"synthetic_{args.pages}p.pdf")
+        make_pdf(pdf, args.pages)
+    print(json.dumps(run(pdf, args.workers), indent=2, ensure_ascii=False))
@@ -0,0 +1,76 @@
+# benchmarks/postprocess_rules.py — Costo del post-proceso de ProblemDetector.detect_problems (sin inferencia)
+# Se reemplaza _predict por cajas sintéticas (--boxes por imagen) y se mide todo lo que viene después:
+# detecciones, zona inferida, descripciones y payload estructurado (render="none").
+# Uso: python -m benchmarks.postprocess_rules [--boxes 200] [--images 200] [--repeat 5]
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+CLASS_NAMES = {0: "FUGA TECHO", 1: "FILTRACION PARED", 2: "EQUIPO OXIDADO", 3: "TUBERIA ROTA"}
+FILENAMES = ["IMG_2024_0001.jpg", "tablero_electrico_piso2.jpg", "sotano_bodega.jpg", "cuarto_maquinas_ups.jpg"]
+
+
+class _FakeModel:
+    names = CLASS_NAMES
+
+
+def make_boxes(n, h=960, w=1280, seed=0):
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        x1, y1 = int(rng.integers(0, w - 50)), int(rng.integers(0, h - 50))
+        bw, bh = int(rng.integers(20, 300)), int(rng.integers(20, 300))
+        out.append((x1, y1, min(w, x1 + bw), min(h, y1 + bh), float(rng.uniform(0.25, 0.99)),
+                    int(rng.integers(0, len(CLASS_NAMES)))))
+    return out
+
+
+def make_detector():
+    """ProblemDetector sin cargar pesos: catálogo de problemas + modelo falso con los nombres de clase."""
+    import logging
+
+    from apps.ai_detect.detector_problemas import ProblemDetector
+
+    det = ProblemDetector.__new__(ProblemDetector)
+    det.logger = logging.getLogger("bench")
+    det.model = _FakeModel()
+    det.model_info = {"backend": "torch"}
+    det._setup_problem_descriptions()
+    return det
+
+
+def run(n_boxes, n_images, repeat):
+    det = make_detector()
+    img = np.zeros((960, 1280, 3), dtype=np.uint8)
+    batches = [make_boxes(n_boxes, seed=i) for i in range(n_images)]
+    current = {}
+    det._predict = lambda image, tiling=None: (current["boxes"], {"tiled": False, "tiles": 1, "ms": 0.0})
+
+    per_image = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for i, boxes in enumerate(batches):
+            current["boxes"] = boxes
+            out = det.detect_problems(f"/tmp/uploads/{FILENAMES[i % len(FILENAMES)]}", image=img, render="none")
+            assert "error" not in out, out
+        per_image.append((time.perf_counter() - t0) * 1000 / n_images)
+    ms = statistics.median(per_image)
+    return {
+        "boxes_per_image": n_boxes,
+        "images": n_images,
+        "ms_per_image": round(ms, 3),
+        "us_per_box": round(ms * 1000 / n_boxes, 2),
+        "images_per_sec": round(1000 / ms, 1),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Costo del post-proceso de detect_problems (sin inferencia)")
+    ap.add_argument("--boxes", type=int, default=200)
+    ap.add_argument("--images", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    print(json.dumps(run(args.boxes, args.images, args.repeat), indent=2))
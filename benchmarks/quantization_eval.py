@@ -0,0 +1,123 @@
+# benchmarks/quantization_eval.py — INT8 vs FP32 del detector de problemas
+# Reporta aceleración de latencia y concordancia de detecciones tomando FP32 como referencia:
+# por clase, recall (cajas FP32 recuperadas con IoU >= --iou), precisión y IoU medio de los pares.
+# Uso: python -m benchmarks.quantization_eval [--weights ...] [--int8 ...] [--images DIR] [--fp32-backend torch]
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+
+from apps.ai_detect.quantize import DEFAULT_CALIB, DEFAULT_WEIGHTS, IMAGE_EXTS, quantized_path
+from apps.common.yolo_backend import load_yolo
+
+
+def _iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _predict(model, img):
+    """[(cls_id, (x1, y1, x2, y2), conf)] y latencia en ms."""
+    t0 = time.perf_counter()
+    res = model(img, verbose=False)
+    ms = (time.perf_counter() - t0) * 1000
+    out = []
+    for r in res:
+        for b in r.boxes:
+            out.append((int(b.cls[0]), tuple(float(v) for v in b.xyxy[0]), float(b.conf[0])))
+    return out, ms
+
+
+def match(ref, cand, iou_thr):
+    """Emparejamiento greedy por clase (mayor confianza primero). Retorna {cls: [tp, n_ref, n_cand, [ious]]}."""
+    per = {}
+    for cls in {c for c, _, _ in ref} | {c for c, _, _ in cand}:
+        r = sorted([x for x in ref if x[0] == cls], key=lambda x: -x[2])
+        c = sorted([x for x in cand if x[0] == cls], key=lambda x: -x[2])
+        used = set()
+        ious = []
+        for _, rb, _ in r:
+            best, best_j = 0.0, None
+            for j, (_, cb, _) in enumerate(c):
+                if j in used:
+                    continue
+                v = _iou(rb, cb)
+                if v > best:
+                    best, best_j = v, j
+            if best_j is not None and best >= iou_thr:
+                used.add(best_j)
+                ious.append(best)
+        per[cls] = [len(ious), len(r), len(c), ious]
+    return per
+
+
+def evaluate(weights, int8_path, images, fp32_backend="torch", iou_thr=0.5, repeat=1):
+    fp32, fp32_info = load_yolo(weights, backend=fp32_backend)
+    q, q_info = load_yolo(int8_path, backend="onnx")
+    names = getattr(fp32, "names", {}) or {}
+    fp32(images[0], verbose=False)
+    q(images[0], verbose=False)  # warmup
+
+    lat_fp32, lat_int8, agg = [], [], {}
+    for img in images:
+        for _ in range(repeat):
+            ref, ms_ref = _predict(fp32, img)
+            cand, ms_q = _predict(q, img)
+            lat_fp32.append(ms_ref)
+            lat_int8.append(ms_q)
+        for cls, (tp, n_ref, n_cand, ious) in match(ref, cand, iou_thr).items():
+            a = agg.setdefault(cls, [0, 0, 0, []])
+            a[0] += tp; a[1] += n_ref; a[2] += n_cand; a[3].extend(ious)
+
+    per_class = {}
+    tot = [0, 0, 0]
+    for cls, (tp, n_ref, n_cand, ious) in sorted(agg.items()):
+        per_class[names.get(cls, str(cls))] = {
+            "fp32_boxes": n_ref,
+            "int8_boxes": n_cand,
+            "recall": round(tp / n_ref, 3) if n_ref else None,
+            "precision": round(tp / n_cand, 3) if n_cand else None,
+            "mean_iou": round(statistics.mean(ious), 3) if ious else None,
+        }
+        tot[0] += tp; tot[1] += n_ref; tot[2] += n_cand
+
+    p50 = lambda xs: round(statistics.median(xs), 1)
+    return {
+        "images": len(images),
+        "iou_threshold": iou_thr,
+        "fp32": {"backend": fp32_info["backend"], "p50_ms": p50(lat_fp32), "mean_ms": round(statistics.mean(lat_fp32), 1)},
+        "int8": {"backend": q_info["backend"], "p50_ms": p50(lat_int8), "mean_ms": round(statistics.mean(lat_int8), 1)},
+        "speedup_p50": round(statistics.median(lat_fp32) / max(statistics.median(lat_int8), 1e-6), 2),
+        "overall": {
+            "recall": round(tot[0] / tot[1], 3) if tot[1] else None,
+            "precision": round(tot[0] / tot[2], 3) if tot[2] else None,
+        },
+        "per_class": per_class,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Evaluación INT8 vs FP32 del detector de problemas")
+    ap.add_argument("--weights", default=str(DEFAULT_WEIGHTS))
+    ap.add_argument("--int8", default=None, help="default: <stem>.int8.onnx junto a los pesos")
+    ap.add_argument("--images", default=str(DEFAULT_CALIB))
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--fp32-backend", default="torch", choices=["torch", "onnx"])
+    ap.add_argument("--iou", type=float, default=0.5)
+    ap.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir()
+                   if p.suffix.lower() in IMAGE_EXTS and not p.name.endswith(".thumb.jpg"))[: args.limit]
+    imgs = [im for im in (cv2.imread(str(p)) for p in paths) if im is not None]
+    if not imgs:
+        raise SystemExit(f"Sin imágenes en {args.images}")
+    report = evaluate(args.weights, args.int8 or quantized_path(args.weights), imgs,
+                      fp32_backend=args.fp32_backend, iou_thr=args.iou, repeat=args.repeat)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,105 @@
+# benchmarks/stt_vad.py — Dictado en vivo contra /stt_chunk de ai_detect: ¿el VAD omite los chunks en silencio?
+# Arma un stream webm/opus como el de MediaRecorder.start(2000): solo el primer chunk trae la cabecera
+# EBML y los demás son clusters sueltos. Alterna tramos de voz (tonos) y silencio con ruido de fondo,
+# envía los chunks con un mismo sid y cuenta en el stub de OpenAI cuántos llegan a transcripción.
+# Sale con código 1 si algún chunk en silencio (incluidos los de continuación) se transcribe.
+# Requiere ffmpeg (pydub). Uso: python -m benchmarks.stt_vad [--pattern VSSVSS] [--chunk-ms 2000]
+import argparse
+import io
+import json
+import os
+import sys
+import uuid
+
+CLUSTER = b"\x1f\x43\xb6\x75"
+
+
+def _vint(buf: bytes, pos: int):
+    """Entero de largo variable EBML en buf[pos:] -> (valor, bytes usados)."""
+    first = buf[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    value = first & (0xFF >> length)
+    for b in buf[pos + 1:pos + length]:
+        value = (value << 8) | b
+    return value, length
+
+
+def make_stream(pattern: str, chunk_ms: int):
+    """Audio con un tramo de chunk_ms por letra (V=voz, S=silencio) codificado como un único webm/opus."""
+    from pydub import AudioSegment
+    from pydub.generators import Sine, WhiteNoise
+
+    audio = AudioSegment.empty()
+    for i, kind in enumerate(pattern.upper()):
+        noise = WhiteNoise().to_audio_segment(duration=chunk_ms, volume=-62)
+        if kind == "V":  # tono centrado: los cortes por cluster no calzan exacto con chunk_ms
+            tone = Sine(180 + 40 * i).to_audio_segment(duration=chunk_ms // 2, volume=-14)
+            noise = noise.overlay(tone, position=chunk_ms // 4)
+        audio += noise
+    audio = audio.set_channels(1).set_frame_rate(48000)
+    buf = io.BytesIO()
+    audio.export(buf, format="webm", codec="libopus", bitrate="96k",
+                 parameters=["-cluster_time_limit", str(chunk_ms // 8)])
+    return buf.getvalue()
+
+
+def split_like_mediarecorder(data: bytes, chunk_ms: int):
+    """Corta en bordes de cluster agrupando por timecode: chunk 0 = cabecera + primeros clusters."""
+    starts = []
+    pos = data.find(CLUSTER)
+    while pos != -1:
+        starts.append(pos)
+        pos = data.find(CLUSTER, pos + 1)
+    groups = {}
+    for i, start in enumerate(starts):
+        _, n = _vint(data, start + 4)
+        tc_pos = start + 4 + n
+        if data[tc_pos] != 0xE7:  # el Timecode es el primer hijo del cluster
+            continue
+        size, m = _vint(data, tc_pos + 1)
+        tc = int.from_bytes(data[tc_pos + 1 + m:tc_pos + 1 + m + size], "big")
+        end = starts[i + 1] if i + 1 < len(starts) else len(data)
+        groups.setdefault(tc // chunk_ms, []).append((start, end))
+    chunks = []
+    for k in sorted(groups):
+        first, last = groups[k][0][0], groups[k][-1][1]
+        chunks.append(data[:last] if k == 0 else data[first:last])
+    return chunks
+
+
+def run(pattern: str, chunk_ms: int):
+    from benchmarks import openai_stub
+
+    os.environ["OPENAI_BASE_URL"] = openai_stub.start_in_thread()
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    from apps.ai_detect import vad
+    from apps.ai_detect.app import flask_app
+
+    client = flask_app.test_client()
+    sid = uuid.uuid4().hex
+    chunks = split_like_mediarecorder(make_stream(pattern, chunk_ms), chunk_ms)
+    rows, leaked = [], []
+    for seq, (kind, chunk) in enumerate(zip(pattern.upper(), chunks)):
+        before = openai_stub.stats["transcriptions"]
+        resp = client.post("/stt_chunk", data={"seq": str(seq), "sid": sid,
+                                               "audio": (io.BytesIO(chunk), f"chunk_{seq}.webm")},
+                           content_type="multipart/form-data").get_json()
+        transcribed = openai_stub.stats["transcriptions"] > before
+        rows.append({"seq": seq, "kind": kind, "bytes": len(chunk), "header": chunk.startswith(b"\x1a\x45\xdf\xa3"),
+                     "vad": resp.get("vad"), "transcribed": transcribed})
+        if kind == "S" and transcribed:
+            leaked.append(seq)
+    client.post("/stt_close", json={"sid": sid})
+    return {"chunks": rows, "silent_transcribed": leaked, "vad": vad.stats()}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Chunks de dictado en silencio omitidos por el VAD de /stt_chunk")
+    ap.add_argument("--pattern", default="VSSVSS", help="un tramo por chunk: V=voz, S=silencio")
+    ap.add_argument("--chunk-ms", type=int, default=2000)
+    args = ap.parse_args()
+    out = run(args.pattern, args.chunk_ms)
+    print(json.dumps(out, indent=2))
+    sys.exit(1 if out["silent_transcribed"] else 0)
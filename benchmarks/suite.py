@@ -0,0 +1,347 @@
+# benchmarks/suite.py — Suite end-to-end de los caminos calientes del HUB
+# Cada escenario corre en un subproceso propio (arranque en frío real y RSS pico aislado) y reporta
+# por caso: items/s, latencias p50/p95/p99 (ms) y RSS pico (MB). Las rutas que llaman a OpenAI
+# se miden contra el stub local (benchmarks/openai_stub.py), sin red.
+# Uso:
+#   python -m benchmarks.suite [--scenarios detector_warm upload_detect ...] [--iterations 20]
+#                              [--out runs/2025-01-01.json] [--compare runs/baseline.json --tolerance 0.15]
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DETECT_SIZES = ((640, 480), (1280, 960), (4032, 3024))
+
+
+# ───────────────────────── Utilidades ─────────────────────────
+def _percentile(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, max(0, int(round(q * (len(xs) - 1)))))]
+
+
+def _peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 / (1024 if sys.platform == "darwin" else 1), 1)  # macOS reporta bytes
+
+
+def _synthetic_image(w, h, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    base = np.linspace(40, 220, w, dtype=np.float32)[None, :, None].repeat(h, 0).repeat(3, 2)
+    return np.clip(base + rng.normal(0, 12, (h, w, 3)), 0, 255).astype(np.uint8)
+
+
+def _jpeg(w, h, seed=0):
+    import cv2
+
+    ok, buf = cv2.imencode(".jpg", _synthetic_image(w, h, seed), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buf.tobytes()
+
+
+def _timed(fn, n):
+    lat = []
+    t0 = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        fn()
+        lat.append((time.perf_counter() - t) * 1000)
+    return lat, time.perf_counter() - t0
+
+
+def _case(name, lat, wall, items_per_call=1, **extra):
+    return {"case": name, "latencies_ms": lat, "wall_s": wall, "items": len(lat) * items_per_call, **extra}
+
+
+def _hub_client():
+    from starlette.testclient import TestClient
+    import app as hub_module
+
+    return TestClient(hub_module.app)
+
+
+# ───────────────────────── Escenarios ─────────────────────────
+def sc_detector_cold(n):
+    """Construcción de ProblemDetector + primera inferencia (proceso nuevo, sin warmup)."""
+    t0 = time.perf_counter()
+    from apps.ai_detect.detector_problemas import ProblemDetector
+
+    det = ProblemDetector()
+    load_ms = (time.perf_counter() - t0) * 1000
+    img = _synthetic_image(1280, 960)
+    t1 = time.perf_counter()
+    det.detect_problems("/tmp/uploads/bench.jpg", image=img, render="none")
+    first_ms = (time.perf_counter() - t1) * 1000
+    return [_case("1280x960", [first_ms], time.perf_counter() - t1, load_ms=round(load_ms, 1),
+                  backend=det.model_info.get("backend"))]
+
+
+def sc_detector_warm(n):
+    """detect_problems ya caliente, a varios tamaños (el grande activa el teselado en modo auto)."""
+    from apps.ai_detect.detector_problemas import ProblemDetector
+
+    det = ProblemDetector()
+    det.warmup()
+    out = []
+    for w, h in DETECT_SIZES:
+        img = _synthetic_image(w, h)
+        info = {}
+
+        def call():
+            info.update(det.detect_problems("/tmp/uploads/bench.jpg", image=img.copy(), render="none").get("inference") or {})
+
+        lat, wall = _timed(call, n)
+        out.append(_case(f"{w}x{h}", lat, wall, tiles=info.get("tiles")))
+    return out
+
+
+def sc_dangers(n):
+    """detect_dangers por frame (ai_seguridad) a resolución de cámara."""
+    from apps.ai_seguridad import main as seg
+
+    seg.get_model()
+    frames = [_synthetic_image(640, 480, seed=i) for i in range(4)]
+    seg.detect_dangers(frames[0].copy())
+    i = [0]
+
+    def call():
+        seg.detect_dangers(frames[i[0] % len(frames)].copy())
+        i[0] += 1
+
+    lat, wall = _timed(call, n)
+    return [_case("640x480", lat, wall)]
+
+
+def sc_upload_detect(n):
+    """POST /ai-detect/upload a través del HUB ASGI en proceso (multipart → JSON)."""
+    from apps.ai_detect import app as detect_app
+
+    client = _hub_client()
+    data = _jpeg(1600, 1200)
+    created = []
+
+    def call():
+        r = client.post("/ai-detect/upload", files={"file": ("bench.jpg", data, "image/jpeg")}, data={"render": "sync"})
+        r.raise_for_status()
+        created.append(r.json().get("filename"))
+
+    call()  # warmup
+    lat, wall = _timed(call, n)
+    detect_app.persist_executor.shutdown(wait=True)
+    _cleanup_detect(detect_app, created)
+    return [_case("1600x1200", lat, wall, bytes=len(data))]
+
+
+def _cleanup_detect(detect_app, filenames):
+    up, res = detect_app.app.config["UPLOAD_FOLDER"], detect_app.app.config["RESULT_FOLDER"]
+    for fn in filter(None, filenames):
+        stem = os.path.splitext(fn)[0]
+        for folder in (up, res):
+            for name in os.listdir(folder):
+                if name.startswith(stem):
+                    try:
+                        os.remove(os.path.join(folder, name))
+                    except OSError:
+                        pass
+        if detect_app.inspection_index is not None:
+            detect_app.inspection_index.delete(fn)
+
+
+def sc_upload_seguridad(n):
+    """POST /ai-seguridad/upload/image a través del HUB ASGI en proceso."""
+    from apps.ai_seguridad import main as seg
+
+    client = _hub_client()
+    data = _jpeg(1280, 720)
+    created = []
+
+    def call():
+        r = client.post("/ai-seguridad/upload/image", files={"file": ("frame.jpg", data, "image/jpeg")})
+        r.raise_for_status()
+        created.append((r.json().get("image_url") or "").rsplit("/", 1)[-1])
+
+    call()
+    lat, wall = _timed(call, n)
+    for name in filter(None, created):
+        try:
+            os.remove(seg.STATIC_DIR / "uploads" / name)
+        except OSError:
+            pass
+    return [_case("1280x720", lat, wall, bytes=len(data))]
+
+
+def sc_merge_normalize(n):
+    """_merge_and_normalize sobre sesiones de dictado largas (chunks con solape entre sí)."""
+    from apps.ai_detect.app import _merge_and_normalize
+
+    words = ("la tubería del cuarto eléctrico tiene una fuga constante cerca del tablero principal "
+             "y el techo muestra humedad en la esquina norte del pasillo").split()
+    out = []
+    for chunks in (50, 200, 1000):
+        session = {}
+        for i in range(chunks):
+            start = (i * 5) % len(words)
+            session[i] = " ".join((words * 3)[start:start + 9])
+        lat, wall = _timed(lambda: _merge_and_normalize(session), n)
+        out.append(_case(f"{chunks}_chunks", lat, wall))
+    return out
+
+
+def sc_openai_routes(n):
+    """Rutas que llaman a OpenAI (contra el stub): /ai-detect/ask, /ai-detect/tts, /ai-detect/stt, /ai-detect-v2/chat."""
+    client = _hub_client()
+    wav = _wav_bytes()
+    routes = {
+        "ai_detect_ask": lambda: client.post("/ai-detect/ask", json={"q": "¿Qué tan grave es la fuga?", "mode": "chat", "speak": False}),
+        "ai_detect_tts": lambda: client.post("/ai-detect/tts", json={"text": "Fuga en el techo, prioridad alta."}),
+        "ai_detect_stt": lambda: client.post("/ai-detect/stt", files={"audio": ("voz.wav", wav, "audio/wav")}),
+        "ai_detectV2_chat": lambda: client.post("/ai-detect-v2/chat", json={"message": "Hola"}),
+    }
+    out = []
+    for name, fn in routes.items():
+        fn().raise_for_status()
+        lat, wall = _timed(lambda: fn().raise_for_status(), n)
+        out.append(_case(name, lat, wall))
+    return out
+
+
+def _wav_bytes(seconds=2.0, rate=16000):
+    """WAV mono con un tono (el VAD lo considera voz)."""
+    import io
+    import wave
+
+    import numpy as np
+
+    t = np.arange(int(seconds * rate)) / rate
+    pcm = (np.sin(2 * np.pi * 220 * t) * 12000).astype(np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+SCENARIOS = {
+    "detector_cold": sc_detector_cold,
+    "detector_warm": sc_detector_warm,
+    "dangers": sc_dangers,
+    "upload_detect": sc_upload_detect,
+    "upload_seguridad": sc_upload_seguridad,
+    "merge_normalize": sc_merge_normalize,
+    "openai_routes": sc_openai_routes,
+}
+
+
+# ───────────────────────── Runner ─────────────────────────
+def summarize(case: dict, peak_rss_mb: float) -> dict:
+    lat = case.pop("latencies_ms")
+    wall = case.pop("wall_s")
+    case.update({
+        "n": len(lat),
+        "items_per_sec": round(case["items"] / wall, 2) if wall > 0 else None,
+        "mean_ms": round(statistics.mean(lat), 2),
+        "p50_ms": round(_percentile(lat, 0.50), 2),
+        "p95_ms": round(_percentile(lat, 0.95), 2),
+        "p99_ms": round(_percentile(lat, 0.99), 2),
+        "peak_rss_mb": peak_rss_mb,
+    })
+    return case
+
+
+def run_child(name, n):
+    sys.path.insert(0, str(ROOT))
+    cases = SCENARIOS[name](n)
+    rss = _peak_rss_mb()
+    print("BENCH_JSON " + json.dumps([summarize(c, rss) for c in cases]))
+
+
+def compare(current: dict, baseline: dict, tolerance: float):
+    """Regresiones: p95 más de `tolerance` peor que la línea base (mismo escenario/caso)."""
+    base = {(r["scenario"], r["case"]): r for r in baseline.get("results", [])}
+    out = []
+    for r in current["results"]:
+        b = base.get((r["scenario"], r["case"]))
+        if b and b.get("p95_ms") and r.get("p95_ms") and r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            out.append({"scenario": r["scenario"], "case": r["case"], "p95_ms": r["p95_ms"],
+                        "baseline_p95_ms": b["p95_ms"], "ratio": round(r["p95_ms"] / b["p95_ms"], 2)})
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Suite de benchmarks end-to-end del HUB")
+    ap.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    ap.add_argument("--iterations", type=int, default=20)
+    ap.add_argument("--out", help="archivo JSON de salida (además de stdout)")
+    ap.add_argument("--compare", help="JSON de una corrida anterior para detectar regresiones")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        run_child(args.child, args.iterations)
+        return
+
+    from benchmarks.openai_stub import start_in_thread
+
+    stub_url = start_in_thread()
+    tmp = tempfile.mkdtemp(prefix="bench_suite_")
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": stub_url,
+        "OPENAI_API_KEY": "stub",
+        "WARMUP_ENABLED": "0",  # cada escenario decide si calienta
+        "AI_DETECT_INDEX_DB": os.path.join(tmp, "inspections.db"),
+        "STORAGE_ARCHIVE_DIR": os.path.join(tmp, "archive"),
+        # Importar el HUB arranca el janitor de audio del tutor: que no pode el árbol durante el benchmark
+        "AI_TUTOR_AUDIO_MAX_AGE_H": "1000000",
+        "AI_TUTOR_AUDIO_MAX_MB": "1000000",
+    })
+
+    results, errors = [], {}
+    for name in args.scenarios:
+        proc = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--child", name,
+                               "--iterations", str(args.iterations)],
+                              cwd=str(ROOT), env=env, capture_output=True, text=True)
+        line = next((l for l in proc.stdout.splitlines() if l.startswith("BENCH_JSON ")), None)
+        if proc.returncode != 0 or line is None:
+            errors[name] = (proc.stderr or proc.stdout).strip().splitlines()[-3:]
+            continue
+        for case in json.loads(line[len("BENCH_JSON "):]):
+            results.append({"scenario": name, **case})
+            print(f"{name:18s} {case['case']:18s} p50={case['p50_ms']:>9} ms  p95={case['p95_ms']:>9} ms  "
+                  f"{case['items_per_sec']} it/s  rss={case['peak_rss_mb']} MB", file=sys.stderr)
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "git": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT),
+                              capture_output=True, text=True).stdout.strip() or None,
+        "iterations": args.iterations,
+        "results": results,
+        "errors": errors,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(text, encoding="utf-8")
+    print(text)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
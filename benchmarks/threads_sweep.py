@@ -0,0 +1,135 @@
+# benchmarks/threads_sweep.py — Barrido workers × hilos sobre ProblemDetector.detect_problems
+# Cada worker es un proceso (como un worker de gunicorn) con la configuración de apps/common/runtime.py
+# aplicada antes de cargar torch. Todos arrancan juntos tras el warmup y procesan imágenes durante
+# --duration segundos; se reporta throughput agregado (img/s) y latencias p50/p95.
+# Si un worker muere o no termina de cargar en --setup-timeout segundos, esa combinación se aborta y se
+# reporta con "error" (el barrido sigue con la siguiente).
+# Uso: python -m benchmarks.threads_sweep [--workers 1 2 4] [--threads 1 2 4] [--duration 20] [--affinity auto]
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue as queue_mod
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_IMAGES = ROOT / "apps" / "ai_detect" / "static" / "uploads"
+
+
+def _percentile(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * q))] if xs else None
+
+
+def _worker(env, images_dir, limit, render, duration, setup_timeout, barrier, queue):
+    os.environ.update(env)  # antes de importar torch/cv2
+    from apps.common.runtime import apply_runtime_config
+
+    applied = apply_runtime_config()
+    import cv2
+    import numpy as np
+    from apps.ai_detect.detector_problemas import ProblemDetector
+
+    paths = [p for p in sorted(Path(images_dir).glob("*")) if p.suffix.lower() in (".jpg", ".jpeg", ".png")][:limit]
+    imgs = [(str(p), cv2.imread(str(p))) for p in paths]
+    imgs = [(p, im) for p, im in imgs if im is not None]
+    if not imgs:
+        rng = np.random.default_rng(os.getpid())
+        imgs = [(f"/tmp/uploads/synthetic_{i}.jpg", rng.integers(0, 255, (960, 1280, 3), dtype=np.uint8)) for i in range(4)]
+
+    det = ProblemDetector()
+    det.warmup()
+    try:
+        barrier.wait(setup_timeout)
+    except threading.BrokenBarrierError:  # otro worker murió o el padre abortó la combinación
+        return
+
+    lat, i = [], 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        path, img = imgs[i % len(imgs)]
+        t0 = time.perf_counter()
+        det.detect_problems(path, image=img.copy(), render=render)
+        lat.append((time.perf_counter() - t0) * 1000)
+        i += 1
+    queue.put({"pid": os.getpid(), "cpus": applied.get("cpus"), "latencies": lat})
+
+
+def run_combo(workers, threads, args):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers + 1)
+    queue = ctx.Queue()
+    env = {
+        "WEB_CONCURRENCY": str(workers),
+        "RUNTIME_TORCH_THREADS": str(threads),
+        "RUNTIME_CPU_AFFINITY": args.affinity,
+        "OMP_NUM_THREADS": str(threads),
+        "YOLO_INTRA_OP_THREADS": str(threads),
+        "WARMUP_ENABLED": "0",
+    }
+    procs = [ctx.Process(target=_worker, args=(env, args.images, args.limit, args.render, args.duration,
+                                               args.setup_timeout, barrier, queue))
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+
+    def abort(reason):
+        barrier.abort()
+        for p in procs:
+            p.terminate()
+            p.join()
+        return {"workers": workers, "threads_per_worker": threads, "affinity": args.affinity or None, "error": reason}
+
+    try:
+        barrier.wait(args.setup_timeout)  # todos cargados y calientes
+    except threading.BrokenBarrierError:
+        dead = sum(1 for p in procs if not p.is_alive())
+        return abort(f"workers sin llegar a la barrera en {args.setup_timeout:g}s ({dead} terminados)")
+    t0 = time.perf_counter()
+    try:
+        results = [queue.get(timeout=args.duration + args.setup_timeout) for _ in procs]
+    except queue_mod.Empty:
+        return abort("algún worker no entregó resultados (¿murió durante la medición?)")
+    wall = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+
+    lat = [x for r in results for x in r["latencies"]]
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "affinity": args.affinity or None,
+        "images": len(lat),
+        "throughput_img_s": round(len(lat) / wall, 2) if wall else None,
+        "p50_ms": round(_percentile(lat, 0.50), 1) if lat else None,
+        "p95_ms": round(_percentile(lat, 0.95), 1) if lat else None,
+        "cpus": [r["cpus"] for r in results],
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Barrido workers × hilos para ProblemDetector")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--setup-timeout", type=float, default=300.0,
+                    help="segundos para que todos los workers carguen el modelo y lleguen a la barrera")
+    ap.add_argument("--images", default=str(DEFAULT_IMAGES))
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--render", default="none", choices=["none", "sync"])
+    ap.add_argument("--affinity", default="", help='"" | auto | lista de CPUs (ver apps/common/runtime.py)')
+    args = ap.parse_args()
+
+    n_cpus = os.cpu_count() or 1
+    rows = []
+    for w in args.workers:
+        for t in args.threads:
+            if w * t > 2 * n_cpus:
+                continue  # sobre-suscripción evidente; no vale la pena medirla
+            rows.append(run_combo(w, t, args))
+            print(json.dumps(rows[-1]), flush=True)
+    measured = [r for r in rows if "error" not in r]
+    best = max(measured, key=lambda r: r["throughput_img_s"] or 0) if measured else None
+    print(json.dumps({"cpus": n_cpus, "results": rows, "best_throughput": best}, indent=2))
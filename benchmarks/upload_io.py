@@ -0,0 +1,92 @@
+# benchmarks/upload_io.py — Latencia ahorrada en /upload al decodificar desde bytes
+# Compara, sin inferencia (es igual en ambos caminos):
+#   ai_detect   antes: file.save + os.path.exists + cv2.imread     ahora: cv2.imdecode(bytes)
+#   ai_detectV2 antes: file.save + PIL.open + relectura + base64   ahora: PIL.open(BytesIO) + base64
+# Uso: python -m benchmarks.upload_io [--sizes-mb 5 10 15] [--repeat 5]
+import argparse
+import base64
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+
+def make_jpeg(target_mb: float, seed: int = 0) -> bytes:
+    """JPEG sintético (ruido + gradiente) de ~target_mb, con resolución de foto de teléfono."""
+    rng = np.random.default_rng(seed)
+    h, w = 3000, 4000
+    base = np.linspace(0, 255, w, dtype=np.float32)[None, :, None].repeat(h, 0).repeat(3, 2)
+    quality = 95
+    for amp in (8, 16, 32, 64, 96, 128):
+        img = np.clip(base + rng.normal(0, amp, (h, w, 3)), 0, 255).astype(np.uint8)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok and len(buf) >= target_mb * 1024 * 1024:
+            return buf.tobytes()
+    return buf.tobytes()
+
+
+def _timeit(fn, repeat):
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+
+def run(sizes_mb, repeat):
+    from PIL import Image
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_upload_")
+    rows = []
+    for mb in sizes_mb:
+        data = make_jpeg(mb)
+        path = os.path.join(tmpdir, f"photo_{mb}mb.jpg")
+
+        def v1_old():
+            with open(path, "wb") as f:
+                f.write(data)
+            assert os.path.exists(path)
+            assert cv2.imread(path) is not None
+
+        def v1_new():
+            assert cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) is not None
+
+        def v2_old():
+            with open(path, "wb") as f:
+                f.write(data)
+            Image.open(path).close()
+            with open(path, "rb") as f:
+                base64.b64encode(f.read())
+            os.remove(path)
+
+        def v2_new():
+            Image.open(io.BytesIO(data)).close()
+            base64.b64encode(data)
+
+        r = {"size_mb": round(len(data) / 1024 / 1024, 2)}
+        r["ai_detect_old_ms"] = round(_timeit(v1_old, repeat), 1)
+        r["ai_detect_new_ms"] = round(_timeit(v1_new, repeat), 1)
+        r["ai_detect_saved_ms"] = round(r["ai_detect_old_ms"] - r["ai_detect_new_ms"], 1)
+        r["ai_detectV2_old_ms"] = round(_timeit(v2_old, repeat), 1)
+        r["ai_detectV2_new_ms"] = round(_timeit(v2_new, repeat), 1)
+        r["ai_detectV2_saved_ms"] = round(r["ai_detectV2_old_ms"] - r["ai_detectV2_new_ms"], 1)
+        rows.append(r)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Latencia ahorrada en /upload al decodificar desde bytes")
+    ap.add_argument("--sizes-mb", type=float, nargs="+", default=[5, 10, 15])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    print(json.dumps(run(args.sizes_mb, args.repeat), indent=2))
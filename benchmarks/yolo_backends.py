@@ -0,0 +1,107 @@
+# benchmarks/yolo_backends.py — Latencia y memoria por backend de inferencia YOLO (torch | onnx | openvino)
+# Cada backend corre en un subproceso propio para que el RSS no se contamine entre backends.
+# Uso: python -m benchmarks.yolo_backends [--weights apps/ai_detect/modelos/problemas_infraestructura.pt]
+#        [--backends torch onnx openvino] [--images DIR] [--repeat 3] [--threads 0]
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_WEIGHTS = ROOT / "apps" / "ai_detect" / "modelos" / "problemas_infraestructura.pt"
+DEFAULT_IMAGES = ROOT / "apps" / "ai_detect" / "static" / "uploads"
+
+
+def _rss_mb() -> float:
+    """RSS actual (Linux: /proc); si no, el pico de getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_images(folder, limit=20):
+    """Hasta `limit` imágenes de la carpeta; si no hay, imágenes sintéticas del tamaño de una foto de teléfono."""
+    imgs = []
+    if folder and Path(folder).is_dir():
+        for p in sorted(Path(folder).iterdir()):
+            if p.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"):
+                img = cv2.imread(str(p))
+                if img is not None:
+                    imgs.append(img)
+            if len(imgs) >= limit:
+                break
+    if not imgs:
+        rng = np.random.default_rng(0)
+        imgs = [rng.integers(0, 255, (1080, 1440, 3), dtype=np.uint8) for _ in range(4)]
+    return imgs
+
+
+def run_backend(weights, backend, images, repeat, threads) -> dict:
+    sys.path.insert(0, str(ROOT))
+    from apps.common.yolo_backend import load_yolo
+
+    rss0 = _rss_mb()
+    model, info = load_yolo(weights, backend=backend, threads=threads)
+    model(images[0], verbose=False)  # warmup
+    rss_loaded = _rss_mb()
+
+    lat = []
+    for _ in range(repeat):
+        for img in images:
+            t0 = time.perf_counter()
+            model(img, verbose=False)
+            lat.append((time.perf_counter() - t0) * 1000)
+    lat.sort()
+    return {
+        "backend": info["backend"],
+        "requested": backend,
+        "fallback": info.get("fallback"),
+        "artifact": info["path"],
+        "load_ms": info["load_ms"],
+        "images": len(images),
+        "runs": len(lat),
+        "mean_ms": round(statistics.mean(lat), 1),
+        "p50_ms": round(lat[len(lat) // 2], 1),
+        "p95_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1),
+        "rss_model_mb": round(rss_loaded - rss0, 1),
+        "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Latencia/RSS por backend de inferencia YOLO")
+    ap.add_argument("--weights", default=str(DEFAULT_WEIGHTS))
+    ap.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    ap.add_argument("--images", default=str(DEFAULT_IMAGES))
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--threads", type=int, default=0, help="hilos intra-op de ONNX Runtime (0 = default)")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        imgs = load_images(args.images, args.limit)
+        print(json.dumps(run_backend(args.weights, args.worker, imgs, args.repeat, args.threads)))
+        sys.exit(0)
+
+    rows = []
+    for backend in args.backends:
+        cmd = [sys.executable, "-m", "benchmarks.yolo_backends", "--worker", backend,
+               "--weights", args.weights, "--images", args.images, "--limit", str(args.limit),
+               "--repeat", str(args.repeat), "--threads", str(args.threads)]
+        proc = subprocess.run(cmd, cwd=str(ROOT), capture_output=True, text=True)
+        try:
+            rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        except (IndexError, ValueError):
+            rows.append({"requested": backend, "error": (proc.stderr or "").strip().splitlines()[-1:]})
+    print(json.dumps(rows, indent=2))